@@ -0,0 +1,146 @@
+"""
+hr_async_sync 與 hr_jobs 的比較：hr_jobs.json 中的每個工作使用同一份合成資料（hr_fake_sheets），
+hr_jobs 直接讀 FakeClient，hr_async_sync 經由本機的 FakeSheetsServer（HTTP）讀取，
+兩邊的每個 Sheets 請求都加上相同的模擬延遲（--latency）。
+
+每個引擎寫入自己的資料庫並同步兩次：第一次全部是新增；第二次之前修改、刪除部分行並更新試算表版本。
+每次同步後比對兩個資料庫中的目標表與狀態表，內容必須完全相同，否則以非 0 結束。
+PostgreSQL 的準備方式與 bench_loaders 相同（臨時資料庫或 --dsn）。
+執行：python bench_async_sync.py [--rows 10000] [--latency 0.2]
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import sys
+import time
+
+from bench_loaders import _admin, existing_postgres, local_postgres
+
+ENGINES = ("hr_jobs", "hr_async_sync")
+
+
+def make_client(jobs, rows, latency):
+    """每個工作一個假試算表；配額不限，latency 模擬每個請求的網路延遲。"""
+    from hr_fake_sheets import FakeClient, FakeWorksheet, employee_sheet_rows, merge_sheet_rows
+    from hr_schema import EMPLOYEE_RECORDS, HR_MERGE
+
+    generators = {EMPLOYEE_RECORDS.table: employee_sheet_rows, HR_MERGE.table: merge_sheet_rows}
+    client = FakeClient()
+    for job in jobs:
+        sheet = FakeWorksheet(generators[job.schema.table](rows), row_count=rows + 1000, quota=10 ** 9,
+                              base_latency=latency, title=job.worksheet)
+        client.add(job.spreadsheet_name or job.name, {job.worksheet: sheet}, spreadsheet_id=job.spreadsheet_id)
+    return client
+
+
+def edit_sheets(client):
+    """每 37 行改一個儲存格、每 101 行刪一行，並更新 Drive 版本。"""
+    for spreadsheet in client.spreadsheets:
+        for sheet in spreadsheet.worksheets.values():
+            for i in range(2, len(sheet.rows), 37):
+                sheet.rows[i][1] += ' (edited)'
+            del sheet.rows[3::101]
+        spreadsheet.version += 1
+
+
+def settings_for(params, dbname):
+    from hr_jobs import load_settings
+    return dict(load_settings(),
+                POSTGRES_SERVER=params['host'], POSTGRES_PORT=params.get('port'), POSTGRES_DB=dbname,
+                POSTGRES_USER=params.get('user'), POSTGRES_PASSWORD=params.get('password'),
+                HR_REJECTS='off', HR_METRICS=False)
+
+
+def run_sync(jobs, settings, client):
+    from hr_jobs import run_job
+    for job in jobs:
+        run_job(job, settings, client=client)
+
+
+async def run_async(jobs, settings, server):
+    import aiohttp
+    import asyncpg
+    from hr_async_sync import AsyncSheetsClient, connect_options, run_job_async
+
+    async with aiohttp.ClientSession() as session, \
+            asyncpg.create_pool(min_size=1, max_size=2, **connect_options(settings)) as pool:
+        sheets = AsyncSheetsClient(session, server.sheets_url, server.drive_url)
+        for job in jobs:
+            await run_job_async(job, settings, sheets, pool)
+
+
+def dump(params, dbname, query):
+    import psycopg2
+    conn = psycopg2.connect(**dict(params, dbname=dbname))
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(query)
+            return sorted(cursor.fetchall(), key=repr)
+    finally:
+        conn.close()
+
+
+def snapshot_queries(jobs):
+    from hr_sync_state import ROW_STATE_TABLE, SYNC_STATE_TABLE
+    queries = {job.table: f'SELECT * FROM {job.table}' for job in jobs}
+    queries[ROW_STATE_TABLE] = f'SELECT sync_name, row_key, row_hash FROM {ROW_STATE_TABLE}'
+    queries[SYNC_STATE_TABLE] = f'SELECT sync_name, revision FROM {SYNC_STATE_TABLE}'
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="hr_async_sync 與 hr_jobs 的比較")
+    parser.add_argument('--rows', type=int, default=10000, help="每個工作表的資料行數")
+    parser.add_argument('--latency', type=float, default=0.2, help="模擬每個 Sheets API 請求的延遲（秒）")
+    parser.add_argument('--dsn', help="使用既有的 PostgreSQL，不建立臨時資料庫")
+    parser.add_argument('--pg-bin', help="initdb / pg_ctl 所在的目錄")
+    args = parser.parse_args()
+
+    from hr_connections import close_pools
+    from hr_fake_sheets import FakeSheetsServer
+    from hr_jobs import load_jobs
+    from hr_sheet_scheduler import SheetReadScheduler, TokenBucket, set_default_scheduler
+
+    set_default_scheduler(SheetReadScheduler(TokenBucket(rate=10 ** 6, per=1.0)))
+    jobs = load_jobs()
+    client = make_client(jobs, args.rows, args.latency)
+    sheets = [sheet for spreadsheet in client.spreadsheets for sheet in spreadsheet.worksheets.values()]
+
+    server = existing_postgres(args.dsn) if args.dsn else local_postgres(args.pg_bin)
+    failed = False
+    with server as params, FakeSheetsServer(client) as http:
+        databases = {engine: f"bench_{engine}" for engine in ENGINES}
+        for dbname in databases.values():
+            _admin(params, f'DROP DATABASE IF EXISTS {dbname}', f'CREATE DATABASE {dbname}')
+        try:
+            for phase in ("第一次同步", "修改後再同步"):
+                if phase != "第一次同步":
+                    edit_sheets(client)
+                for engine, dbname in databases.items():
+                    settings = settings_for(params, dbname)
+                    requests = sum(sheet.requests for sheet in sheets)
+                    start = time.perf_counter()
+                    with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+                        if engine == "hr_jobs":
+                            run_sync(jobs, settings, client)
+                            close_pools()
+                        else:
+                            asyncio.run(run_async(jobs, settings, http))
+                    elapsed = time.perf_counter() - start
+                    print(f"{phase} {engine:<14} {elapsed:>8.2f} 秒，{args.rows * len(jobs) / elapsed:>10,.0f} 行/秒，"
+                          f"Sheets 請求 {sum(sheet.requests for sheet in sheets) - requests} 次")
+
+                for name, query in snapshot_queries(jobs).items():
+                    results = [dump(params, dbname, query) for dbname in databases.values()]
+                    same = results[0] == results[1]
+                    failed = failed or not same
+                    print(f"  {name}: {len(results[0])} 行，{'相同' if same else '不同！'}")
+        finally:
+            for dbname in databases.values():
+                _admin(params, f'DROP DATABASE IF EXISTS {dbname}')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+欄位式轉換微型效能測試：逐行逐格 (transform_rows) 對比欄位式去重 (transform_columns)。
+資料模擬員工表：Div / Department / Cost_Centre 等欄位只有少數不重複值，日期集中在少數到職日。
+日期混用多種格式，包括日/月可互換的 %d/%m/%Y 與 %m/%d/%Y（例如 03/04/2020），兩種轉換的結果必須完全相同。
+執行：python bench_columnar_transform.py [筆數]
+"""
+import random
+import sys
+import timeit
+from datetime import date, timedelta
+
+from hr_columnar import transform_columns, transform_rows
+from hr_date_parser import DateNormalizer
+from hr_pipeline import PIPELINE_CHUNK_SIZE, chunked, clean_text
+
+
+def make_rows(n, seed=42):
+    rng = random.Random(seed)
+    divs = [f"DIV{i}" for i in range(8)]
+    departments = [f" Dept {i} " for i in range(60)]
+    base = date(2000, 1, 1)
+    # 依到職日排列：每塊只有少數幾天（不重複值少），整份資料的日期則很多。
+    # 同一天的到職日以同一種格式書寫；每 10000 行輪流以 %d/%m/%Y、%m/%d/%Y 為主，
+    # 該欄學到的格式順序會在中途互換，日/月可互換的值（日 <= 12）每塊都有新的，
+    # 最容易看出兩種轉換的結果是否不同
+    phases = [['%d/%m/%Y'] * 8 + ['%Y/%m/%d'], ['%m/%d/%Y'] * 8 + ['%Y/%m/%d']]
+    day_formats = {}
+
+    def hire_date(row_num):
+        offset = row_num // 100 + rng.randrange(3)
+        if offset not in day_formats:
+            day_formats[offset] = rng.choice(phases[row_num // 10000 % 2])
+        return (base + timedelta(days=offset)).strftime(day_formats[offset])
+
+    rows = []
+    for row_num in range(2, n + 2):
+        dept = rng.randrange(len(departments))
+        rows.append((row_num, [
+            rng.choice(divs),
+            departments[dept],
+            f"CC{dept:04d}",
+            f"D{dept:03d}",
+            hire_date(row_num),
+            hire_date(row_num) if rng.random() < 0.2 else '',
+            f"Name {row_num}",
+            f"{row_num:08d}",
+        ]))
+    return rows
+
+
+def make_column_fns(width):
+    # 每次都用新的 DateNormalizer，把學習與快取暖機的成本也算進去
+    parse_reporting_date = DateNormalizer()
+    parse_resigned_date = DateNormalizer()
+    column_fns = {i: clean_text for i in range(width)}
+    column_fns[4] = lambda value: parse_reporting_date(clean_text(value))
+    column_fns[5] = lambda value: parse_resigned_date(clean_text(value))
+    return column_fns
+
+
+def run(transform, rows):
+    column_fns = make_column_fns(len(rows[0][1]))
+    out = []
+    for chunk in chunked(rows, PIPELINE_CHUNK_SIZE):
+        out.extend(transform(chunk, column_fns))
+    return out
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rows = make_rows(n)
+
+    if run(transform_rows, rows) != run(transform_columns, rows):
+        print("結果不一致")
+        sys.exit(1)
+
+    # transform_columns 要求 fn 只依賴輸入值：整份資料跑過之後，同一個日期字串的結果必須與全新的 DateNormalizer 相同
+    # （上面的比對只在 set 的順序剛好不同時才抓得到，這裡不受雜湊順序影響）
+    shared = DateNormalizer()
+    for _, record in rows:
+        shared(record[4])
+    impure = [value for value in {record[4] for _, record in rows} if shared(value) != DateNormalizer()(value)]
+    if impure:
+        print(f"日期的解讀受先前的值影響: {sorted(impure)[:10]}")
+        sys.exit(1)
+
+    old = min(timeit.repeat(lambda: run(transform_rows, rows), number=1, repeat=3))
+    new = min(timeit.repeat(lambda: run(transform_columns, rows), number=1, repeat=3))
+    print(f"筆數: {n}（每塊 {PIPELINE_CHUNK_SIZE} 筆）")
+    print(f"逐行轉換: {old:.3f}s ({n / old:,.0f} 筆/秒)")
+    print(f"欄位式轉換: {new:.3f}s ({n / new:,.0f} 筆/秒)")
+    print(f"加速: {old / new:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
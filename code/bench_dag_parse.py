@@ -0,0 +1,92 @@
+"""
+DAG 解析時間測試：模擬排程器在全新的行程中匯入 hr_gsheet2db_dag.py。
+超過 PARSE_BUDGET_SECONDS、匯入時嘗試連網或載入了 psycopg2 / gspread 等重的套件時以非 0 結束，
+可以放進部署前的檢查。
+執行：python bench_dag_parse.py [次數] [DAG 檔案]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# 匯入 DAG 檔（不含 airflow 本身）允許的時間（秒）
+PARSE_BUDGET_SECONDS = 0.5
+
+# 解析時不應載入的套件，只能在任務執行時才匯入
+HEAVY_MODULES = ("psycopg2", "gspread", "oauth2client", "dotenv", "hr_bulk_load", "hr_connections", "hr_jobs", "hr_sync_state")
+
+DEFAULT_DAG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hr_gsheet2db_dag.py")
+
+# 在子行程中執行：先載入 airflow（本身的匯入時間不算），再擋住所有網路連線並計時匯入 DAG 檔
+CHILD = r'''
+import importlib.util, json, socket, sys, time
+
+import airflow
+
+attempts = []
+
+def refuse(*args, **kwargs):
+    attempts.append(repr(args[1:] or args)[:200])
+    raise OSError("解析 DAG 檔時不應連網")
+
+socket.socket.connect = refuse
+socket.socket.connect_ex = refuse
+socket.create_connection = refuse
+socket.getaddrinfo = refuse
+
+path, heavy = sys.argv[1], sys.argv[2].split(',')
+start = time.perf_counter()
+error = None
+try:
+    spec = importlib.util.spec_from_file_location("dag_under_test", path)
+    spec.loader.exec_module(importlib.util.module_from_spec(spec))
+except Exception as e:
+    error = f"{type(e).__name__}: {e}"
+elapsed = time.perf_counter() - start
+
+print(json.dumps({
+    "elapsed": elapsed,
+    "error": error,
+    "network": attempts,
+    "heavy": [name for name in heavy if name in sys.modules],
+}))
+'''
+
+
+def parse_once(path):
+    result = subprocess.run([sys.executable, "-c", CHILD, path, ",".join(HEAVY_MODULES)],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        print(result.stderr.strip())
+        sys.exit(2)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    path = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_DAG_FILE
+
+    results = [parse_once(path) for _ in range(runs)]
+    median = statistics.median(r["elapsed"] for r in results)
+    print(f"DAG 檔: {path}")
+    print(f"解析時間（中位數，{runs} 次）: {median * 1000:.1f} ms，上限 {PARSE_BUDGET_SECONDS * 1000:.0f} ms")
+
+    failures = []
+    first = results[0]
+    if first["error"]:
+        failures.append(f"匯入失敗: {first['error']}")
+    if first["network"]:
+        failures.append(f"解析時嘗試連網: {first['network']}")
+    if first["heavy"]:
+        failures.append(f"解析時載入了: {', '.join(first['heavy'])}")
+    if median > PARSE_BUDGET_SECONDS:
+        failures.append("解析時間超過上限")
+
+    for failure in failures:
+        print(failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,332 @@
+"""
+載入程式效能測試：以合成的員工資料（hr_fake_sheets）與臨時建立的本機 PostgreSQL 執行
+- hr_sheet2db      : hr_sheet2db.main()
+- hr_gsheet2db     : DAG 的 extract → transform → load（hr_jobs.run_job，employee_records_for_IT_use）
+- hr_gsheet2db_parallel: 同上，以 --workers 條連線依 10_Number 的雜湊分片平行 COPY（HR_LOAD_WORKERS）
+- upsert_data      : hr_merge2gsheet_20250213.upsert_data()（第一次同步，全部都是新增）
+- upsert_data_rerun: 同一份資料再同步一次（全部未變動）
+記錄每秒行數、資料庫往返次數（execute / executemany 的每一行 / COPY / commit / rollback）
+與最大記憶體用量，結果存成 JSON，可以用 --baseline 與之前的結果比較。
+
+每個項目在獨立的子行程中執行，最大記憶體用量才不會互相影響；每個項目使用自己的資料庫。
+臨時資料庫需要 PATH 中有 initdb 與 pg_ctl（或以 --pg-bin 指定），也可以用 --dsn 改用既有的資料庫
+（會在其中建立並刪除 bench_* 資料庫）。
+執行：python bench_loaders.py [--rows 10000,100000] [--targets ...] [--workers 4] [--baseline 舊結果.json]
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+TARGETS = ("hr_sheet2db", "hr_gsheet2db", "hr_gsheet2db_parallel", "upsert_data", "upsert_data_rerun")
+
+# 每秒行數比基準慢超過這個比例時視為退步，以非 0 結束
+REGRESSION_TOLERANCE = 0.15
+
+
+# ---------- 臨時 PostgreSQL ----------
+
+def _find_pg_bin(pg_bin=None):
+    if pg_bin:
+        return pg_bin
+    found = shutil.which('initdb')
+    if found:
+        return os.path.dirname(found)
+    # Debian / Ubuntu 的 postgresql 套件不會把 initdb 放進 PATH
+    root = '/usr/lib/postgresql'
+    if os.path.isdir(root):
+        for version in sorted(os.listdir(root), key=lambda v: int(v) if v.isdigit() else 0, reverse=True):
+            candidate = os.path.join(root, version, 'bin')
+            if os.path.exists(os.path.join(candidate, 'initdb')):
+                return candidate
+    raise SystemExit("找不到 initdb，請安裝 PostgreSQL、以 --pg-bin 指定目錄，或以 --dsn 使用既有的資料庫")
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@contextlib.contextmanager
+def local_postgres(pg_bin=None):
+    """在暫存目錄建立一個只接受 Unix socket 的 PostgreSQL，結束時停止並刪除，回傳連線參數。"""
+    bin_dir = _find_pg_bin(pg_bin)
+    data_dir = tempfile.mkdtemp(prefix='hr_bench_pg_')
+    port = _free_port()
+    log = os.path.join(data_dir, 'postgres.log')
+    try:
+        subprocess.run([os.path.join(bin_dir, 'initdb'), '-D', data_dir, '-U', 'postgres', '-A', 'trust',
+                        '--no-sync', '-E', 'UTF8'], check=True, capture_output=True)
+        # 臨時資料不需要持久性，關掉 fsync 讓結果反映程式本身而不是磁碟
+        options = f"-p {port} -k {data_dir} -c listen_addresses='' -c fsync=off -c synchronous_commit=off"
+        subprocess.run([os.path.join(bin_dir, 'pg_ctl'), '-D', data_dir, '-l', log, '-o', options, '-w', 'start'],
+                       check=True, capture_output=True)
+        try:
+            yield {'host': data_dir, 'port': port, 'user': 'postgres', 'dbname': 'postgres'}
+        finally:
+            subprocess.run([os.path.join(bin_dir, 'pg_ctl'), '-D', data_dir, '-m', 'fast', '-w', 'stop'],
+                           capture_output=True)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def existing_postgres(dsn):
+    import psycopg2.extensions
+    yield psycopg2.extensions.parse_dsn(dsn)
+
+
+def _admin(params, *statements):
+    import psycopg2
+    conn = psycopg2.connect(**params)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+            if cursor.description:
+                return cursor.fetchone()[0]
+    finally:
+        conn.close()
+
+
+# ---------- 子行程：執行一個項目 ----------
+
+def _counting_connection_class():
+    """psycopg2 的 connection 子類別，計算送到伺服器的往返次數。"""
+    import psycopg2.extensions
+
+    lock = threading.Lock()
+    counter = {'round_trips': 0}
+
+    def add(n=1):
+        with lock:
+            counter['round_trips'] += n
+
+    class CountingCursor(psycopg2.extensions.cursor):
+        def execute(self, query, vars=None):
+            add()
+            return super().execute(query, vars)
+
+        def executemany(self, query, vars_list):
+            vars_list = list(vars_list)
+            add(len(vars_list))
+            return super().executemany(query, vars_list)
+
+        def copy_expert(self, sql, file, size=8192):
+            add()
+            return super().copy_expert(sql, file, size)
+
+        def copy_from(self, *args, **kwargs):
+            add()
+            return super().copy_from(*args, **kwargs)
+
+    class CountingConnection(psycopg2.extensions.connection):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.cursor_factory = CountingCursor
+
+        def commit(self):
+            add()
+            return super().commit()
+
+        def rollback(self):
+            add()
+            return super().rollback()
+
+    return CountingConnection, counter
+
+
+def _fake_client(target, rows, latency):
+    from hr_fake_sheets import FakeClient, FakeWorksheet, employee_sheet_rows, merge_sheet_rows
+
+    # 配額不限，測的是載入程式本身；latency 模擬每個 API 請求的網路延遲
+    client = FakeClient()
+    if target.startswith('upsert_data'):
+        sheet = FakeWorksheet(merge_sheet_rows(rows), row_count=rows + 1000, quota=10 ** 9, base_latency=latency,
+                              title='Merge')
+        client.add("HR Merge", {'Merge': sheet}, spreadsheet_id="1veNclH-62PWTKaUwi7UNeP_lPM4nKunFNpbF24XCmGc")
+    else:
+        sheet = FakeWorksheet(employee_sheet_rows(rows), row_count=rows + 1000, quota=10 ** 9,
+                              base_latency=latency)
+        client.add("引用-HR 10碼工號", {'工作表1': sheet})
+    return client, sheet
+
+
+def _run_target(target, client, sheet, params, connection_factory, workers):
+    if target == 'hr_sheet2db':
+        import hr_sheet2db
+        hr_sheet2db.main(client=client, db_params=dict(params, connection_factory=connection_factory))
+        return 'employee_records_for_IT_use'
+
+    if target in ('hr_gsheet2db', 'hr_gsheet2db_parallel'):
+        from hr_jobs import load_jobs, load_settings, run_job
+        job = next(job for job in load_jobs() if job.name == 'employee_records_for_IT_use')
+        settings = dict(load_settings(),
+                        POSTGRES_SERVER=params['host'], POSTGRES_PORT=params.get('port'),
+                        POSTGRES_DB=params['dbname'], POSTGRES_USER=params.get('user'),
+                        POSTGRES_PASSWORD=params.get('password'), HR_SKIP_IF_UNCHANGED=False,
+                        POSTGRES_OPTIONS={'connection_factory': connection_factory},
+                        HR_LOAD_WORKERS=workers if target == 'hr_gsheet2db_parallel' else 1)
+        run_job(job, settings, client=client)
+        return job.table
+
+    import hr_merge2gsheet_20250213 as merge
+    from hr_connections import db_connection
+    from hr_sync_state import create_state_tables
+    with db_connection(connection_factory=connection_factory, **params) as conn:
+        merge.create_table_if_not_exists(conn)
+        create_state_tables(conn)
+        spreadsheet = client.open_by_key(merge.my_spreadsheet_id)
+        plan, total_rows = merge.check_google_sheet(spreadsheet)
+        merge.upsert_data(sheet, plan, total_rows, conn)
+    return merge.HR_MERGE.table
+
+
+def child(target, rows, params, latency, workers):
+    """在子行程中執行一個項目，輸出一行 JSON。upsert_data_rerun 先同步一次（不計時）再計時第二次。"""
+    from hr_connections import close_pools
+    from hr_sheet_scheduler import SheetReadScheduler, TokenBucket, set_default_scheduler
+
+    set_default_scheduler(SheetReadScheduler(TokenBucket(rate=10 ** 6, per=1.0)))
+    connection_factory, counter = _counting_connection_class()
+    client, sheet = _fake_client(target, rows, latency)
+
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+        if target == 'upsert_data_rerun':
+            _run_target(target, client, sheet, params, connection_factory, workers)
+            counter['round_trips'] = 0
+            sheet.requests = 0
+
+        start = time.perf_counter()
+        table = _run_target(target, client, sheet, params, connection_factory, workers)
+        elapsed = time.perf_counter() - start
+        close_pools()
+
+    loaded = _admin(params, f'SELECT count(*) FROM {table}')
+    # Linux 的 ru_maxrss 單位是 KB，macOS 是 bytes
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    print(json.dumps({
+        'target': target,
+        'rows': rows,
+        'workers': workers if target == 'hr_gsheet2db_parallel' else 1,
+        'loaded_rows': loaded,
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(rows / elapsed, 1),
+        'round_trips': counter['round_trips'],
+        'sheet_requests': sheet.requests,
+        'peak_rss_mb': round(peak_mb, 1),
+    }))
+
+
+# ---------- 主程式 ----------
+
+def run_one(target, rows, params, latency, workers):
+    dbname = f"bench_{target}_{rows}"
+    _admin(params, f'DROP DATABASE IF EXISTS {dbname}', f'CREATE DATABASE {dbname}')
+    try:
+        result = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', target, '--rows', str(rows),
+             '--latency', str(latency), '--workers', str(workers),
+             '--params', json.dumps(dict(params, dbname=dbname))],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+    finally:
+        _admin(params, f'DROP DATABASE IF EXISTS {dbname}')
+    if result.returncode != 0:
+        print(result.stderr.strip())
+        raise SystemExit(f"{target}（{rows} 行）執行失敗")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def compare(results, baseline_path):
+    """與基準結果比較每秒行數，回傳退步的項目。"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(r['target'], r['rows']): r for r in json.load(f)['results']}
+    regressions = []
+    for r in results:
+        old = baseline.get((r['target'], r['rows']))
+        if not old:
+            continue
+        ratio = r['rows_per_second'] / old['rows_per_second']
+        print(f"{r['target']:<21} {r['rows']:>8} 行: 每秒行數 {ratio:.2f}x，"
+              f"往返 {old['round_trips']} -> {r['round_trips']}，"
+              f"記憶體 {old['peak_rss_mb']} -> {r['peak_rss_mb']} MB")
+        if ratio < 1 - REGRESSION_TOLERANCE:
+            regressions.append(r)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="載入程式效能測試")
+    parser.add_argument('--rows', default='10000', help="以逗號分隔的資料行數，例如 10000,100000,1000000")
+    parser.add_argument('--targets', default=','.join(TARGETS), help="以逗號分隔的項目")
+    parser.add_argument('--latency', type=float, default=0.0, help="模擬每個 Sheets API 請求的延遲（秒）")
+    parser.add_argument('--workers', type=int, default=4, help="hr_gsheet2db_parallel 的平行連線數")
+    parser.add_argument('--dsn', help="使用既有的 PostgreSQL，不建立臨時資料庫")
+    parser.add_argument('--pg-bin', help="initdb / pg_ctl 所在的目錄")
+    parser.add_argument('--output', help="結果 JSON 檔（預設 bench_loaders_<時間>.json）")
+    parser.add_argument('--baseline', help="與之前的結果 JSON 比較")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--params', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, int(args.rows), json.loads(args.params), args.latency, args.workers)
+        return
+
+    targets = args.targets.split(',')
+    unknown = set(targets) - set(TARGETS)
+    if unknown:
+        parser.error(f"未知的項目: {', '.join(sorted(unknown))}（可用: {', '.join(TARGETS)}）")
+    sizes = [int(n) for n in args.rows.split(',')]
+
+    server = existing_postgres(args.dsn) if args.dsn else local_postgres(args.pg_bin)
+    results = []
+    with server as params:
+        version = _admin(params, 'SHOW server_version')
+        for rows in sizes:
+            for target in targets:
+                r = run_one(target, rows, params, args.latency, args.workers)
+                results.append(r)
+                print(f"{target:<21} {rows:>8} 行: {r['seconds']:>8.2f} 秒，{r['rows_per_second']:>10,.0f} 行/秒，"
+                      f"寫入 {r['loaded_rows']} 行，往返 {r['round_trips']} 次，"
+                      f"Sheets 請求 {r['sheet_requests']} 次，最大記憶體 {r['peak_rss_mb']} MB")
+            by_target = {r['target']: r for r in results if r['rows'] == rows}
+            if 'hr_gsheet2db' in by_target and 'hr_gsheet2db_parallel' in by_target:
+                speedup = by_target['hr_gsheet2db']['seconds'] / by_target['hr_gsheet2db_parallel']['seconds']
+                print(f"{'':<21} {rows:>8} 行: {args.workers} 條連線平行載入的加速 {speedup:.2f}x")
+
+    output = args.output or f"bench_loaders_{datetime.now():%Y%m%d%H%M%S}.json"
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'created': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'postgres': version,
+            'latency': args.latency,
+            'results': results,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"結果已存至 {output}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline)
+        if regressions:
+            names = ', '.join(f"{r['target']}（{r['rows']} 行）" for r in regressions)
+            print(f"每秒行數退步超過 {REGRESSION_TOLERANCE:.0%}: {names}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
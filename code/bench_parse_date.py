@@ -0,0 +1,78 @@
+"""
+parse_date 微型效能測試：舊的 strptime 迴圈（含第二次 strptime 轉 date）對比 DateNormalizer。
+執行：python bench_parse_date.py [筆數]
+"""
+import random
+import sys
+import timeit
+from datetime import date, datetime, timedelta
+
+from hr_date_parser import DATE_FORMATS, DateNormalizer
+
+
+def parse_date(date_str):
+    """舊版 hr_gsheet2db 的 parse_date（原樣保留作為對照）。"""
+    if not date_str or date_str == '-':
+        return 'NA'
+    for fmt in DATE_FORMATS:
+        try:
+            parsed_date = datetime.strptime(date_str.strip(), fmt)
+            return parsed_date.strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return 'NA'
+
+
+def legacy(value):
+    value = parse_date(value)
+    return None if value == 'NA' else datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def make_samples(n, seed=42):
+    """
+    到職日集中在少數日期，混入空值、'-' 與無法解析的字串，以及日/月可互換的寫法（03/04/2020、04-03-2020）；
+    日/月格式的行放在後段且以 %d/%m/%Y 居多，該欄學到的順序改變後，解讀仍須與舊的 parse_date 相同。
+    """
+    rng = random.Random(seed)
+    base = date(2000, 1, 1)
+    hire_dates = [base + timedelta(days=rng.randrange(9000)) for _ in range(600)]
+    samples = []
+    for _ in range(n):
+        roll = rng.random()
+        if roll < 0.05:
+            samples.append(rng.choice(['', '-', 'NA', 'N/A']))
+        elif roll < 0.10:
+            samples.append(rng.choice(hire_dates).strftime('%Y-%m-%d'))
+        elif roll < 0.15 and len(samples) > n // 2:
+            samples.append(rng.choice(hire_dates).strftime(rng.choice(['%d/%m/%Y'] * 8 + ['%m/%d/%Y', '%d-%m-%Y'])))
+        else:
+            samples.append(rng.choice(hire_dates).strftime('%Y/%m/%d'))
+    return samples
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    samples = make_samples(n)
+
+    normalizer = DateNormalizer()
+    mismatches = [s for s in samples if legacy(s) != normalizer(s)]
+    if mismatches:
+        print(f"結果不一致: {mismatches[:10]}")
+        sys.exit(1)
+
+    old = min(timeit.repeat(lambda: [legacy(s) for s in samples], number=1, repeat=3))
+    new = min(timeit.repeat(lambda: normalizer_run(samples), number=1, repeat=3))
+    print(f"筆數: {n}")
+    print(f"舊 parse_date: {old:.3f}s ({n / old:,.0f} 筆/秒)")
+    print(f"DateNormalizer: {new:.3f}s ({n / new:,.0f} 筆/秒)")
+    print(f"加速: {old / new:.1f}x")
+
+
+def normalizer_run(samples):
+    # 每次都用新的 DateNormalizer，把學習與快取暖機的成本也算進去
+    normalizer = DateNormalizer()
+    return [normalizer(s) for s in samples]
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+讀取排程測試：以 hr_fake_sheets 的假工作表（有配額、會回 429）執行 sheet_rows，
+比較令牌桶依配額排程，與不限速只靠 429 的 Retry-After 退讓兩種情況的請求數、被限流次數與時間。
+兩種情況讀到的資料都必須與工作表完全相同（順序也相同）。
+為了讓測試在幾秒內跑完，配額縮小為每 WINDOW 秒 QUOTA 個請求。
+執行：python bench_sheet_scheduler.py [筆數]
+"""
+import sys
+import time
+
+from hr_fake_sheets import FakeWorksheet
+from hr_pipeline import sheet_rows
+from hr_sheet_scheduler import SheetReadScheduler, TokenBucket
+
+QUOTA = 20
+WINDOW = 2.0
+INITIAL_BATCH = 200
+
+
+def make_sheet(n):
+    header = ['10 Number', 'Name', 'Department', 'Hire Date']
+    rows = [header] + [[f"{i:010d}", f"Name {i}", f"Dept {i % 40}", '2020/01/01' if i % 3 else '']
+                       for i in range(1, n + 1)]
+    # 格線比資料多，模擬試算表尾端的空白行
+    return FakeWorksheet(rows, row_count=n + 2000, quota=QUOTA, window=WINDOW,
+                         base_latency=0.01, latency_per_row=0.00002)
+
+
+def trimmed(row):
+    while row and row[-1] == '':
+        row = row[:-1]
+    return row
+
+
+def run(label, n, bucket):
+    sheet = make_sheet(n)
+    scheduler = SheetReadScheduler(bucket)
+
+    start = time.perf_counter()
+    rows = list(sheet_rows(sheet, batch_size=INITIAL_BATCH, scheduler=scheduler))
+    elapsed = time.perf_counter() - start
+
+    # API 不回傳每行尾端的空白儲存格
+    expected = [(row_num, trimmed(row)) for row_num, row in enumerate(sheet.rows[1:], start=2)]
+    if rows != expected:
+        print(f"{label}: 讀到的資料與工作表不同")
+        sys.exit(1)
+    print(f"{label}: {len(rows)} 筆，{elapsed:.2f} 秒，請求 {sheet.requests} 次，被限流 {sheet.throttled} 次")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f"假工作表配額：每 {WINDOW:g} 秒 {QUOTA} 個讀取請求")
+    run("令牌桶", n, TokenBucket(rate=QUOTA, per=WINDOW))
+    run("不限速", n, TokenBucket(rate=10 ** 6, per=1.0))
+
+
+if __name__ == '__main__':
+    main()
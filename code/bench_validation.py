@@ -0,0 +1,97 @@
+"""
+寫入前檢查的效能測試：以合成的員工資料（含超過長度的工號、部門代號、重複的標題列與工號，
+以及空白或 "NA" 的工號），比較 SchemaValidator（只檢查有限制的欄、記住合法的日期）與逐行逐格檢查的時間，並確認兩者拒絕的行與原因相同。
+去重的正確性在 tests/test_dedup.py。
+執行：python bench_validation.py [筆數]
+"""
+import sys
+import timeit
+from collections import Counter
+
+from hr_columnar import transform_columns
+from hr_date_parser import DateNormalizer
+from hr_fake_sheets import employee_sheet_rows
+from hr_pipeline import PIPELINE_CHUNK_SIZE, blank_values, chunked, clean_header
+from hr_schema import EMPLOYEE_RECORDS
+from hr_validation import SchemaValidator, _valid_date
+
+# 與 empty_value="NA" 的工作相同：空字串與 "NA" 都表示沒有工號，不算重複
+BLANKS = blank_values("NA")
+KEY_INDEX = EMPLOYEE_RECORDS.index_of("10_Number")
+
+
+def make_chunks(n):
+    """標題對應與日期正規化之後、寫入之前的資料（與 hr_sheet2db 的管線相同）。"""
+    rows = employee_sheet_rows(n)
+    mapper = EMPLOYEE_RECORDS.row_mapper(clean_header(rows[0]))
+    records = [(row_num, mapper(row)) for row_num, row in enumerate(rows[1:], start=2)]
+    # 一半空白的工號改為 "NA"，兩種寫法都要出現多次
+    for row_num, record in records[::2]:
+        if record[KEY_INDEX] == '':
+            record[KEY_INDEX] = 'NA'
+    column_fns = {i: DateNormalizer() for i, col in enumerate(EMPLOYEE_RECORDS.columns) if col.sql_type == 'DATE'}
+    return [transform_columns(chunk, column_fns) for chunk in chunked(records, PIPELINE_CHUNK_SIZE)]
+
+
+def check_rows(chunk, seen):
+    """逐行逐格的對照實作，回傳 [(row_num, 原因)]；seen 為之前各塊已寫入的工號。"""
+    rejected = []
+    for row_num, record in chunk:
+        reason = check_row(record)
+        if reason is None:
+            key = record[KEY_INDEX]
+            if key is None or key in BLANKS:
+                continue
+            if key in seen:
+                reason = 'UniqueViolation'
+            seen.add(key)
+        if reason is not None:
+            rejected.append((row_num, reason))
+    return rejected
+
+
+def check_row(record):
+    for col, value in zip(EMPLOYEE_RECORDS.columns, record):
+        if (col.not_null or col.primary_key) and value is None:
+            return 'NotNullViolation'
+        if col.sql_type == 'VARCHAR' and value and len(value) > col.max_length \
+                and value[col.max_length:].strip(' '):
+            return 'StringDataRightTruncation'
+        if col.sql_type == 'DATE' and value is not None and not _valid_date(value):
+            return 'InvalidDatetimeFormat'
+    return None
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    chunks = make_chunks(n)
+
+    # 兩者都記得整次執行看過的工號，每次執行（含每次計時）都重新開始
+    def run_validator():
+        validator = SchemaValidator(EMPLOYEE_RECORDS, blanks=BLANKS)
+        return [validator.split(chunk) for chunk in chunks]
+
+    def run_rows():
+        seen = set()
+        return [check_rows(chunk, seen) for chunk in chunks]
+
+    checked = [(row_num, type(error).__name__) for _, bad in run_validator() for row_num, _, error in bad]
+    rowwise = [item for rejected in run_rows() for item in rejected]
+    if checked != rowwise:
+        print("SchemaValidator 與逐格檢查的結果不同")
+        sys.exit(1)
+    keys = Counter(record[KEY_INDEX] for chunk in chunks for _, record in chunk)
+    if min(keys[blank] for blank in BLANKS) < 2:
+        print("測試資料中空白或 NA 的工號不到兩個，沒有測到")
+        sys.exit(1)
+
+    t_validator = min(timeit.repeat(run_validator, number=1, repeat=3))
+    t_rows = min(timeit.repeat(run_rows, number=1, repeat=3))
+    print(f"{n} 行，拒絕 {len(checked)} 行: {dict(Counter(reason for _, reason in checked))}")
+    print(f"逐格檢查: {t_rows:.3f}s ({n / t_rows:,.0f} 行/秒)")
+    print(f"SchemaValidator: {t_validator:.3f}s ({n / t_validator:,.0f} 行/秒)")
+    print(f"加速: {t_rows / t_validator:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
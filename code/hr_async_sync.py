@@ -0,0 +1,621 @@
+"""
+以 asyncio 執行的同步引擎，與 hr_jobs 讀同一份 hr_jobs.json 與設定，寫入的結果相同：
+- 讀取：以 aiohttp 直接呼叫 Sheets API 的 values:batchGet，最多 SHEETS_CONCURRENCY 個範圍同時在下載；
+  配額、429 與重試沿用 hr_sheet_scheduler 的規則，並與同一個行程中的執行緒共用令牌桶
+- 寫入：以 asyncpg 寫入，資料以二進位 COPY 送出，多個 DDL 合成一個請求，
+  狀態表的雜湊以 executemany 管線化送出；寫入目前這批的同時，後面的範圍已在下載
+- 標題對應、正規化（每 PIPELINE_CHUNK_SIZE 行一批，與 transform 步驟的分批相同）、寫入前檢查、
+  變動判斷與拒絕紀錄都使用與 hr_jobs 相同的元件，merge / swap / recreate 的交易邊界也相同
+- SQL 語句與續傳、換表、建索引的判斷都來自 hr_bulk_load、hr_sync_state、hr_table_swap、hr_indexes 與
+  hr_jobs，這裡只有 asyncpg 的執行層（%s 換成 $1, $2, ...）
+
+與 hr_jobs 不同的是不寫本地快照，也沒有 extract / transform / load 三段：swap / recreate 中斷後整個工作重跑；
+merge 與 hr_jobs 相同，每批 commit 時記錄進度，同一個試算表版本的下一次執行從上次 commit 的下一行繼續寫入
+（之前的行仍會讀取，只記下 key，用來判斷刪除）。
+設定 N_HR_SHEETS_API_URL / N_HR_DRIVE_API_URL 可改連本機的假伺服器（hr_fake_sheets.FakeSheetsServer）。
+執行：python hr_async_sync.py [工作名稱 ...]
+"""
+import asyncio
+import sys
+import time
+from collections import deque
+from urllib.parse import quote
+
+import aiohttp
+import asyncpg
+from google.auth.transport.requests import Request
+
+from hr_bulk_load import (MERGE_STAGE, build_insert_query, build_merge_query, delete_missing_keys_query,
+                          merge_stage_queries, staged_records)
+from hr_columnar import transform_stage
+from hr_connections import SHEETS_API_URL, google_credentials
+from hr_jobs import (MAX_PARALLEL_JOBS, check_stages, checkpoint_row, column_transforms, group_by_table, load_jobs,
+                     load_settings, merge_stages, merge_summary, new_deduplicator, new_metrics, new_validator,
+                     open_rejects, report_metrics)
+from hr_indexes import (INDEX_STATE_QUERY, bulk_load_message, drop_index_query, index_columns_query,
+                        rename_index_queries)
+from hr_metrics import NULL_METRICS
+from hr_pipeline import PIPELINE_CHUNK_SIZE, clean_header, map_rows
+from hr_retry import retry_call
+from hr_sheet_fetch import FetchPlan, column_letter
+from hr_sheet_scheduler import AdaptiveBatchSize, AsyncSheetReadScheduler, adaptive_ranges
+from hr_sync_state import (CLEAR_CHECKPOINT_QUERY, DELETE_ROW_HASHES_QUERY, LOAD_CHECKPOINT_QUERY,
+                           LOAD_REVISION_QUERY, LOAD_ROW_HASHES_QUERY, SAVE_CHECKPOINT_QUERY, SAVE_REVISION_QUERY,
+                           STATE_TABLES_DDL, ChangeTracker, resumable_row, save_row_hashes_query)
+from hr_table_swap import (LIST_OLD_COPIES_QUERY, SWAP_LOCK_QUERY, SWAP_RETRIES, TABLE_EXISTS_QUERY, old_copy_name,
+                           old_table_pattern, recreate_table_queries, shadow_table_name)
+from hr_validation import InvalidDatetimeFormat, NotNullViolation, StringDataRightTruncation, UniqueViolation
+
+# 每個工作同時在下載的範圍數（每個範圍一個 batchGet 請求）
+SHEETS_CONCURRENCY = 4
+
+# 單一 HTTP 請求的逾時秒數
+SHEETS_TIMEOUT = 120
+
+# 同一個 SQLSTATE 換成 hr_validation 中與 psycopg2 同名的例外；asyncpg 的例外名稱多了 Error 字尾，
+# 直接使用的話拒絕紀錄與 metrics 的原因會和同步版不同
+_REJECT_ERRORS = {cls.pgcode: cls for cls in (StringDataRightTruncation, InvalidDatetimeFormat, NotNullViolation,
+                                                UniqueViolation)}
+
+# COPY / INSERT 時只跳過這些錯誤的行，其他錯誤（連線中斷等）讓整個工作失敗
+_ROW_ERRORS = (asyncpg.DataError, asyncpg.IntegrityConstraintViolationError)
+
+
+class SheetsAPIError(Exception):
+    """HTTP 4xx / 5xx；與 gspread.exceptions.APIError 一樣帶有 response.status_code 與 response.headers。"""
+
+    def __init__(self, status_code, message, headers=None):
+        super().__init__(f"{status_code}: {message}")
+        self.response = _Response(status_code, headers or {})
+
+
+class _Response:
+    def __init__(self, status_code, headers):
+        self.status_code = status_code
+        self.headers = headers
+
+
+def sheet_range(title, a1):
+    """加上分頁名稱的範圍，例如 'Merge'!A2:Q801（名稱中的單引號重複一次）。"""
+    return f"'{title.replace(chr(39), chr(39) * 2)}'!{a1}"
+
+
+class AsyncSheetsClient:
+    """
+    Sheets v4 / Drive v3 的唯讀 client。credentials 為 google-auth 的憑證（None 表示不帶認證，
+    給本機的假伺服器使用）；所有請求都經過 scheduler。
+    """
+
+    def __init__(self, session, sheets_url, drive_url, credentials=None, scheduler=None):
+        self.session = session
+        self.credentials = credentials
+        self.sheets_url = sheets_url.rstrip('/')
+        self.drive_url = drive_url.rstrip('/')
+        self.scheduler = scheduler or AsyncSheetReadScheduler()
+        self._refresh_lock = asyncio.Lock()
+
+    async def _headers(self):
+        if self.credentials is None:
+            return {}
+        if not self.credentials.valid:
+            # 執行中 token 到期：只讓一個請求去換新的，換 token 是阻塞的呼叫，放到執行緒中
+            async with self._refresh_lock:
+                if not self.credentials.valid:
+                    await asyncio.to_thread(retry_call, self.credentials.refresh, Request())
+        return {'Authorization': f"Bearer {self.credentials.token}"}
+
+    async def _get(self, url, params=None):
+        async with self.session.get(url, params=params, headers=await self._headers()) as response:
+            if response.status >= 400:
+                raise SheetsAPIError(response.status, await response.text(), response.headers)
+            return await response.json()
+
+    async def get_json(self, url, params=None, sizer=None):
+        return await self.scheduler.call(self._get, url, params, sizer=sizer)
+
+    async def find_spreadsheet(self, name):
+        """以名稱找試算表 ID（與 gspread 的 client.open(name) 相同，經過 Drive 搜尋）。"""
+        escaped = name.replace('\\', '\\\\').replace("'", "\\'")
+        payload = await self.get_json(f"{self.drive_url}/files", {
+            'q': f"name = '{escaped}' and mimeType = 'application/vnd.google-apps.spreadsheet' and trashed = false",
+            'fields': 'files(id)', 'supportsAllDrives': 'true', 'includeItemsFromAllDrives': 'true',
+        })
+        files = payload.get('files', [])
+        if not files:
+            raise SheetsAPIError(404, f"找不到試算表 {name}")
+        return files[0]['id']
+
+    async def revision(self, spreadsheet_id):
+        """與 hr_sheet_revision.DriveRevisionSource 相同：Drive 檔案的 version / modifiedTime。"""
+        meta = await self.get_json(f"{self.drive_url}/files/{spreadsheet_id}",
+                                   {'fields': 'version,modifiedTime', 'supportsAllDrives': 'true'})
+        return meta.get('version') or meta['modifiedTime']
+
+    async def worksheet_rows(self, spreadsheet_id, title):
+        """分頁的格線行數（gspread 的 worksheet.row_count）。"""
+        meta = await self.get_json(f"{self.sheets_url}/spreadsheets/{spreadsheet_id}",
+                                   {'fields': 'sheets.properties(title,gridProperties.rowCount)'})
+        for sheet in meta.get('sheets', []):
+            if sheet['properties']['title'] == title:
+                return sheet['properties']['gridProperties']['rowCount']
+        raise SheetsAPIError(404, f"找不到分頁 {title}")
+
+    async def values(self, spreadsheet_id, a1):
+        payload = await self.get_json(f"{self.sheets_url}/spreadsheets/{spreadsheet_id}/values/{quote(a1, safe='')}")
+        return payload.get('values', [])
+
+    async def batch_get(self, spreadsheet_id, ranges, sizer=None):
+        """一個請求抓多個範圍，回傳與 ranges 對應的 [[行, ...], ...]（與 gspread 的 batch_get 相同）。"""
+        payload = await self.get_json(f"{self.sheets_url}/spreadsheets/{spreadsheet_id}/values:batchGet",
+                                      [('ranges', a1) for a1 in ranges], sizer=sizer)
+        return [block.get('values', []) for block in payload.get('valueRanges', [])]
+
+
+async def fetch_blocks(fetch, first_row, last_row, sizer, concurrency=SHEETS_CONCURRENCY):
+    """
+    hr_sheet_fetch.prefetch_ranges 的 asyncio 版本：同時最多 concurrency 個範圍在下載，
+    依原本順序 yield (start, rows)；每個範圍的行數在送出時才由 sizer 決定。
+    """
+    ranges = adaptive_ranges(first_row, last_row, sizer)
+    pending = deque()
+
+    def submit_next():
+        item = next(ranges, None)
+        if item is None:
+            return False
+        pending.append((item[0], asyncio.ensure_future(fetch(*item))))
+        return True
+
+    try:
+        while len(pending) < concurrency and submit_next():
+            pass
+        while pending:
+            start, task = pending.popleft()
+            rows = await task
+            submit_next()
+            yield start, rows
+    finally:
+        # 中途結束時取消還在下載的範圍
+        for _, task in pending:
+            task.cancel()
+
+
+async def sheet_rows(fetch, first_row, last_row, batch_size, scheduler, concurrency=SHEETS_CONCURRENCY):
+    """與 hr_pipeline.sheet_rows 相同的 (row_num, row) 串流，fetch(start, end) 為 coroutine function。"""
+    sizer = AdaptiveBatchSize(batch_size)
+    async for start, rows in fetch_blocks(scheduler.fetcher(fetch, sizer), first_row, last_row, sizer,
+                                          concurrency):
+        for row_num, row in enumerate(rows, start=start):
+            yield row_num, row
+
+
+async def run_pipeline(source, stages, sink, chunk_size=PIPELINE_CHUNK_SIZE):
+    """
+    hr_pipeline.run_pipeline 的 asyncio 版本：source 為 async 的 (row_num, row) 串流，sink 為 coroutine function。
+    stages 仍是同步的產生器函式，每 PIPELINE_CHUNK_SIZE 行套用一次（與 transform 步驟的分批相同，
+    DateNormalizer 學到的格式順序也相同），輸出每 chunk_size 筆交給 sink。回傳送進 sink 的總筆數。
+    與 hr_pipeline 相同，階段的輸出邊取邊交給 sink：sink 執行時各階段只處理到這一批的最後一行，
+    merge 每批寫入的雜湊與 dedup 的進度不會包含還沒寫入的行。
+    """
+    def process(rows, stages=stages):
+        stream = rows
+        for stage in stages:
+            stream = stage(stream)
+        return stream
+
+    total = 0
+    buffer, out = [], []
+
+    async def drain(rows):
+        nonlocal out, total
+        for item in rows:
+            out.append(item)
+            if len(out) >= chunk_size:
+                chunk, out = out, []
+                await sink(chunk)
+                total += len(chunk)
+
+    async for item in source:
+        buffer.append(item)
+        if len(buffer) >= PIPELINE_CHUNK_SIZE:
+            await drain(process(buffer))
+            buffer = []
+    await drain(process(buffer))
+    # 串流結束：有 finish 的階段（hr_dedup.dedup_stage）產生暫存的行，再經過它之後的階段
+    for i, stage in enumerate(stages):
+        if hasattr(stage, 'finish'):
+            await drain(process(stage.finish(), stages[i + 1:]))
+    if out:
+        await sink(out)
+        total += len(out)
+    return total
+
+
+def _reject_error(error):
+    cls = _REJECT_ERRORS.get(getattr(error, 'sqlstate', None))
+    if cls is None:
+        return error
+    return cls(str(error), getattr(error, 'column_name', None))
+
+
+def _numbered(query):
+    """共用語句中 psycopg2 的 %s 依序換成 asyncpg 的 $1, $2, ...（這些語句中沒有其他 % 字元）。"""
+    parts = query.split('%s')
+    return parts[0] + ''.join(f'${i}{part}' for i, part in enumerate(parts[1:], start=1))
+
+
+async def copy_chunk(conn, table, columns, chunk, on_reject):
+    """
+    在目前的交易中以二進位 COPY 寫入一批，不 commit。失敗時該批退回逐行插入（每行一個 SAVEPOINT），
+    有問題的行交給 on_reject(row_num, record, error)。回傳 (成功筆數, 跳過筆數)。
+    """
+    # asyncpg 會替表名加上引號，這裡的表名都沒有加引號建立，PostgreSQL 中是小寫
+    try:
+        async with conn.transaction():
+            await conn.copy_records_to_table(table.lower(), records=[record for _, record in chunk],
+                                             columns=list(columns))
+        return len(chunk), 0
+    except _ROW_ERRORS:
+        pass
+
+    insert_query = _numbered(build_insert_query(table, columns))
+    loaded = rejected = 0
+    for row_num, record in chunk:
+        try:
+            async with conn.transaction():
+                await conn.execute(insert_query, *record)
+        except _ROW_ERRORS as e:
+            on_reject(row_num, record, _reject_error(e))
+            rejected += 1
+        else:
+            loaded += 1
+    return loaded, rejected
+
+
+# ---------- 狀態表（hr_sync_state 的語句） ----------
+
+async def load_revision(conn, sync_name):
+    return await conn.fetchval(_numbered(LOAD_REVISION_QUERY), sync_name)
+
+
+async def finish_sync(conn, sync_name, revision):
+    """記錄成功同步的版本並刪除進度（hr_jobs.load_job 的 save_revision + clear_checkpoint），同一個交易。"""
+    async with conn.transaction():
+        await conn.execute(_numbered(SAVE_REVISION_QUERY), sync_name, revision)
+        await conn.execute(_numbered(CLEAR_CHECKPOINT_QUERY), sync_name)
+
+
+async def resume_point(conn, sync_name, revision):
+    """與 hr_sync_state.resume_point 相同：同一個版本上次中斷時回傳已 commit 的最後一行，別的版本的進度刪除。"""
+    checkpoint = await conn.fetchrow(_numbered(LOAD_CHECKPOINT_QUERY), sync_name)
+    resumed = resumable_row(checkpoint, revision)
+    if checkpoint is not None and resumed is None:
+        await conn.execute(_numbered(CLEAR_CHECKPOINT_QUERY), sync_name)
+    return resumed
+
+
+async def save_checkpoint(conn, sync_name, revision, last_row):
+    """不 commit；與該批資料、雜湊在同一個交易。"""
+    await conn.execute(_numbered(SAVE_CHECKPOINT_QUERY), sync_name, revision, last_row)
+
+
+async def load_row_hashes(conn, sync_name):
+    return dict(tuple(row) for row in await conn.fetch(_numbered(LOAD_ROW_HASHES_QUERY), sync_name))
+
+
+async def save_row_hashes(conn, sync_name, tracker):
+    """寫入目前累積的新雜湊，不 commit；executemany 會把所有 INSERT 管線化送出。"""
+    if not tracker.pending:
+        return
+    await conn.executemany(save_row_hashes_query('($1, $2, $3)'),
+                           [(sync_name, key, h) for key, h in tracker.pending.items()])
+    tracker.pending = {}
+
+
+async def delete_row_hashes(conn, sync_name, keys):
+    if keys:
+        await conn.execute(_numbered(DELETE_ROW_HASHES_QUERY), sync_name, list(keys))
+
+
+# ---------- 寫入（hr_table_swap / hr_indexes / hr_bulk_load 的語句與 hr_jobs 的判斷） ----------
+
+async def _table_exists(conn, table):
+    return await conn.fetchval(_numbered(TABLE_EXISTS_QUERY), table.lower())
+
+
+async def _rename_indexes(conn, table):
+    for query in rename_index_queries(table, [tuple(row) for row in await conn.fetch(index_columns_query(table))]):
+        await conn.execute(query)
+
+
+async def _build_indexes(conn, job, table, concurrently):
+    """與 hr_indexes.build_indexes 相同，回傳建立了哪些索引；不在交易中時才能 CONCURRENTLY。"""
+    built = []
+    for index in job.schema.indexes:
+        name = index.name(table)
+        state = await conn.fetchval(_numbered(INDEX_STATE_QUERY), name)
+        if state or (state is False and not concurrently):
+            continue
+        if state is False:
+            await conn.execute(drop_index_query(name))
+        try:
+            await conn.execute(index.create_query(table, concurrently=concurrently, blanks=job.blank_values))
+        except asyncpg.PostgresError:
+            if concurrently:
+                await conn.execute(drop_index_query(name))
+            raise
+        built.append(name)
+    return built
+
+
+async def _finish_bulk_load(conn, job, table, concurrently):
+    """與 hr_indexes.finish_bulk_load 相同：建立缺少的索引後 ANALYZE。"""
+    start = time.perf_counter()
+    built = await _build_indexes(conn, job, table, concurrently)
+    await conn.execute(f'ANALYZE {table}')
+    job.log(bulk_load_message(table, built, concurrently, time.perf_counter() - start))
+
+
+async def _swap_in_shadow(conn, job, keep):
+    """與 hr_table_swap.swap_in_shadow 相同：短交易中換表，等鎖逾時重試，只保留最新 keep 份舊表。"""
+    shadow = shadow_table_name(job.table)
+    old_copy = old_copy_name(job.table)
+    for attempt in range(1, SWAP_RETRIES + 1):
+        try:
+            async with conn.transaction():
+                await conn.execute(SWAP_LOCK_QUERY)
+                if await _table_exists(conn, job.table):
+                    await conn.execute(f'ALTER TABLE {job.table} RENAME TO {old_copy}')
+                    await _rename_indexes(conn, old_copy)
+                await conn.execute(f'ALTER TABLE {shadow} RENAME TO {job.table}')
+                await _rename_indexes(conn, job.table)
+            break
+        except asyncpg.LockNotAvailableError:
+            if attempt == SWAP_RETRIES:
+                raise
+            job.log(f"換表等待鎖逾時，第 {attempt} 次重試")
+            await asyncio.sleep(attempt)
+
+    old_copies = await conn.fetch(_numbered(LIST_OLD_COPIES_QUERY), old_table_pattern(job.table))
+    for row in old_copies[keep:]:
+        await conn.execute(f"DROP TABLE IF EXISTS {row['tablename']}")
+        job.log(f"已刪除舊表 {row['tablename']}")
+
+
+async def _replace_table(conn, job, rows, stages, settings, stage, report_reject, dedup=None):
+    """swap / recreate：整張表在一個交易中以 COPY 寫入，與 hr_jobs._replace_table 相同（先檢查再去重）。"""
+    schema = job.schema
+    target = shadow_table_name(job.table) if job.strategy == "swap" else job.table
+    # DROP 與 CREATE 以一個請求送出
+    await conn.execute(';\n'.join(recreate_table_queries(target, schema.create_table_query())))
+    job.log(f"已建立影子表 {target}" if job.strategy == "swap" else f"表格 {job.table} 已重新創建")
+
+    loaded = rejected = 0
+    precheck_rejected = 0
+
+    def reject_before_load(row_num, record, error):
+        nonlocal precheck_rejected
+        precheck_rejected += 1
+        report_reject(row_num, record, error)
+
+    async def write(chunk):
+        nonlocal loaded, rejected
+        stage.add(rows_out=len(chunk))
+        ok, bad = await copy_chunk(conn, target, schema.names, chunk, report_reject)
+        loaded += ok
+        rejected += bad
+
+    async with conn.transaction():
+        await run_pipeline(rows, stages + check_stages(new_validator(job, dedup), reject_before_load, dedup), write)
+    job.log(f"寫入 {loaded} 行，跳過 {rejected + precheck_rejected} 行（模式: copy）")
+    await _finish_bulk_load(conn, job, target, concurrently=job.strategy != "swap")
+
+    if job.strategy == "swap":
+        await _swap_in_shadow(conn, job, settings['HR_KEEP_OLD_COPIES'])
+        job.log(f"已將 {target} 換為 {job.table}")
+
+
+async def _merge_table(conn, job, rows, stages, stage, rejects, revision=None, dedup=None):
+    """
+    merge：與 hr_jobs._merge_table 相同，每批在一個交易中合併並寫入雜湊與進度，最後刪除已消失的 key。
+    同一個 revision 上次中斷時，已 commit 的行只記下 key，從下一行繼續寫入。
+    """
+    schema = job.schema
+    merge_query = build_merge_query(job.table, MERGE_STAGE, schema.names, schema.key)
+    created = not await _table_exists(conn, job.table)
+    await conn.execute(schema.create_table_query(job.table, if_not_exists=True))
+
+    tracker = ChangeTracker(await load_row_hashes(conn, job.name))
+    resume_after = await resume_point(conn, job.name, revision) or 0
+    if resume_after:
+        job.log(f"試算表版本 {revision} 上次寫入到第 {resume_after} 行中斷，從下一行繼續")
+    report_reject, merge = merge_stages(job, tracker, stage, rejects, dedup, resume_after)
+    # 暫存表的 DROP / CREATE / ALTER 以一個請求送出
+    create_stage = ';\n'.join(merge_stage_queries(job.table))
+
+    async def merge_chunk(chunk):
+        stage.add(rows_out=len(chunk))
+        stage_columns, staged = staged_records(schema.names, chunk)
+        async with conn.transaction():
+            await conn.execute(create_stage)
+            await copy_chunk(conn, MERGE_STAGE, stage_columns, list(staged),
+                             lambda row_num, record, e: report_reject(row_num, record[:-1], e))
+            await conn.execute(merge_query)
+            # 雜湊、進度與資料在同一個交易寫入，中斷時三者一致
+            await save_row_hashes(conn, job.name, tracker)
+            if revision is not None:
+                await save_checkpoint(conn, job.name, revision, checkpoint_row(chunk, dedup))
+
+    await run_pipeline(rows, stages + merge, merge_chunk, chunk_size=job.batch_size)
+    if dedup is not None:
+        tracker.mark_seen(dedup.rejected_keys())
+
+    # 刪除已從試算表移除的 key；與 delete_missing_keys 相同，沒有任何 key 時不動作
+    deleted = 0
+    seen = tracker.seen_keys()
+    async with conn.transaction():
+        if seen:
+            status = await conn.execute(_numbered(delete_missing_keys_query(job.table, schema.key)), seen)
+            deleted = int(status.split()[-1])
+        await delete_row_hashes(conn, job.name, tracker.deleted_keys())
+    await _finish_bulk_load(conn, job, job.table, concurrently=not created)
+    job.log(merge_summary(job, tracker, deleted))
+
+
+# ---------- 工作 ----------
+
+def _scan_keys(dedup, job, values):
+    """
+    不是 streaming 的去重策略先看過 key 欄（與 hr_jobs.load_job 讀快照的 key 欄相同），記憶體只有這一欄。
+    values 為 key 欄從第 1 行起的儲存格 [[值], ...]，與寫入時一樣先經過 key 欄的正規化。
+    """
+    normalize = column_transforms(job).get(dedup.key_index) or (lambda value: value)
+    dedup.scan((row_num, normalize(row[0] if row else '')) for row_num, row in enumerate(values[1:], start=2))
+
+
+async def _key_column(sheets, spreadsheet_id, job, position, row_count):
+    if position is None:
+        return []
+    column = column_letter(position)
+    return await sheets.values(spreadsheet_id, sheet_range(job.worksheet, f"{column}1:{column}{row_count}"))
+
+
+async def _source(sheets, spreadsheet_id, job, stage, dedup=None):
+    """
+    回傳 (row_num, row) 的串流與要先套用的管線階段（標題對應），與 hr_jobs._sheet_records 相同的範圍與欄位。
+    dedup 不是 streaming 時在這裡先讀 key 欄 scan()。
+    """
+    schema = job.schema
+    row_count = await sheets.worksheet_rows(spreadsheet_id, job.worksheet)
+    header = (await sheets.values(spreadsheet_id, sheet_range(job.worksheet, '1:1')) or [[]])[0]
+    if not header:
+        raise ValueError(f"{job.worksheet} 中沒有數據")
+    header = clean_header(header)
+
+    def counted(fetch):
+        async def fetch_range(start, end):
+            rows = await fetch(start, end)
+            stage.add(requests=1, rows_in=len(rows))
+            return rows
+        return fetch_range
+
+    scan = dedup is not None and not dedup.streaming
+    if job.strategy != "merge":
+        if scan:
+            position = schema.positions(header)[dedup.key_index]
+            _scan_keys(dedup, job, await _key_column(sheets, spreadsheet_id, job, position, row_count))
+
+        async def fetch(start, end):
+            return (await sheets.batch_get(spreadsheet_id, [sheet_range(job.worksheet, f"{start}:{end}")]))[0]
+        rows = sheet_rows(counted(fetch), 2, row_count, job.batch_size, sheets.scheduler)
+        return rows, [map_rows(schema.row_mapper(header, missing_column=job.empty_value))]
+
+    positions = schema.positions(header)
+    missing = [name for name, p in zip(schema.names, positions) if p is None]
+    if missing:
+        raise ValueError(f"工作表中找不到欄位: {', '.join(missing)}")
+
+    # 與 find_last_data_row 相同：key 欄最後一個非空白儲存格的行號
+    plan = FetchPlan(header, schema.fetch_columns())
+    keys = await _key_column(sheets, spreadsheet_id, job, plan.positions[schema.index_of(schema.key)], row_count)
+    total_rows = len(keys)
+    if scan:
+        _scan_keys(dedup, job, keys)
+    job.log(f"總行數: {total_rows}，抓取範圍: {', '.join(plan.ranges(2, total_rows))}")
+
+    async def fetch(start, end):
+        blocks = await sheets.batch_get(spreadsheet_id, [sheet_range(job.worksheet, a1)
+                                                         for a1 in plan.ranges(start, end)])
+        return plan.assemble(blocks, start, end)
+    return sheet_rows(counted(fetch), 2, total_rows, job.batch_size, sheets.scheduler), []
+
+
+async def run_job_async(job, settings, sheets, pool, metrics=NULL_METRICS):
+    """
+    一個工作：讀版本 → 串流下載、正規化、檢查並寫入 → 記錄版本。
+    sheets 為 AsyncSheetsClient，pool 為 asyncpg 的連線池。回傳 False 表示試算表未變動而略過。
+    """
+    with metrics.timed('sync') as stage:
+        spreadsheet_id = job.spreadsheet_id or await sheets.find_spreadsheet(job.spreadsheet_name)
+        async with pool.acquire() as conn:
+            await conn.execute('\n'.join(STATE_TABLES_DDL))
+            # 讀版本要在抓資料之前，抓取期間的修改才會在下次執行時被偵測到
+            revision = await sheets.revision(spreadsheet_id)
+            if job.skip_if_unchanged and settings['HR_SKIP_IF_UNCHANGED'] \
+                    and await load_revision(conn, job.name) == revision:
+                job.log(f"試算表自上次同步後未變動（版本 {revision}），略過本次同步")
+                return False
+
+            with open_rejects(job, settings) as rejects:
+                dedup = new_deduplicator(job, stage, rejects)
+                rows, stages = await _source(sheets, spreadsheet_id, job, stage, dedup)
+                stages = stages + [transform_stage(column_transforms(job), mode=settings['HR_TRANSFORM_MODE'])]
+                if job.strategy == "merge":
+                    await _merge_table(conn, job, rows, stages, stage, rejects, revision, dedup)
+                else:
+                    def report_reject(row_num, record, error):
+                        stage.reject(error)
+                        rejects.add(row_num, record, error)
+                    await _replace_table(conn, job, rows, stages, settings, stage, report_reject, dedup)
+                if dedup is not None and dedup.summary():
+                    job.log(dedup.summary())
+            await finish_sync(conn, job.name, revision)
+    job.log("資料已成功上傳至 PostgreSQL 資料庫")
+    return True
+
+
+def connect_options(settings):
+    return {
+        'host': settings['POSTGRES_SERVER'],
+        'port': int(settings['POSTGRES_PORT']) if settings['POSTGRES_PORT'] else None,
+        'database': settings['POSTGRES_DB'],
+        'user': settings['POSTGRES_USER'],
+        'password': settings['POSTGRES_PASSWORD'],
+    }
+
+
+async def run_jobs_async(jobs, max_parallel=MAX_PARALLEL_JOBS, settings=None, credentials=None):
+    """
+    與 hr_jobs.run_jobs 相同：同一個目標表的工作依序執行，不同目標表最多 max_parallel 個同時進行，
+    回傳失敗的 [(工作名稱, 例外), ...]。credentials 預設以 CREDENTIALS_FILE 認證。
+    """
+    settings = settings or load_settings()
+    # 改連本機的假伺服器時不需要認證
+    if credentials is None and settings['HR_SHEETS_API_URL'] == SHEETS_API_URL:
+        credentials = await asyncio.to_thread(google_credentials, settings['CREDENTIALS_FILE'])
+    limit = asyncio.Semaphore(max_parallel)
+
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=SHEETS_TIMEOUT)) as session, \
+            asyncpg.create_pool(min_size=1, max_size=max_parallel, **connect_options(settings)) as pool:
+        sheets = AsyncSheetsClient(session, settings['HR_SHEETS_API_URL'], settings['HR_DRIVE_API_URL'], credentials)
+
+        async def run_group(group):
+            failures = []
+            async with limit:
+                for job in group:
+                    metrics = new_metrics(job, settings)
+                    try:
+                        await run_job_async(job, settings, sheets, pool, metrics)
+                    except Exception as e:
+                        job.log(f"同步失敗: {e}")
+                        failures.append((job.name, e))
+                    finally:
+                        report_metrics(metrics, settings)
+            return failures
+
+        results = await asyncio.gather(*(run_group(group) for group in group_by_table(jobs)))
+    return [failure for failures in results for failure in failures]
+
+
+def main():
+    jobs = load_jobs()
+    if len(sys.argv) > 1:
+        jobs = [job for job in jobs if job.name in sys.argv[1:]]
+    failures = asyncio.run(run_jobs_async(jobs))
+    for name, error in failures:
+        print(f"失敗: {name}: {error}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
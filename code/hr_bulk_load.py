@@ -0,0 +1,299 @@
+import io
+import psycopg2
+
+# 寫入模式
+# "copy": 以 COPY ... FROM STDIN 分塊串流寫入，整批只 commit 一次
+# "row" : 舊做法，每行一個 INSERT + commit（保留用來比較）
+LOAD_MODES = ("copy", "row")
+
+# 每次 COPY 送出的筆數
+COPY_CHUNK_SIZE = 5000
+
+# merge_records 使用的暫存表名稱
+MERGE_STAGE = '_merge_stage'
+
+
+def quote_columns(columns):
+    return ', '.join(f'"{col}"' for col in columns)
+
+
+def build_insert_query(table, columns):
+    placeholders = ', '.join(['%s'] * len(columns))
+    return f'INSERT INTO {table} ({quote_columns(columns)}) VALUES ({placeholders})'
+
+
+def _copy_text(value):
+    """
+    將單一值轉為 COPY text 格式的欄位字串。
+    None 寫成 \\N（NULL），日期用 ISO 格式，其餘字串跳脫反斜線、Tab 與換行。
+    """
+    if value is None:
+        return '\\N'
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return (str(value)
+            .replace('\\', '\\\\')
+            .replace('\t', '\\t')
+            .replace('\n', '\\n')
+            .replace('\r', '\\r'))
+
+
+def _copy_buffer(chunk):
+    buf = io.StringIO()
+    for _, record in chunk:
+        buf.write('\t'.join(_copy_text(value) for value in record))
+        buf.write('\n')
+    buf.seek(0)
+    return buf
+
+
+def _chunks(records, chunk_size):
+    chunk = []
+    for item in records:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _default_reject(row_num, record, error):
+    print(f"跳過無效的資料在第 {row_num} 行: {record}, 錯誤: {error}")
+
+
+def _insert_rows_with_savepoints(cursor, insert_query, chunk, on_reject):
+    """COPY 失敗時的退路：同一個交易內逐行插入，每行一個 SAVEPOINT，只跳過有問題的行。"""
+    loaded = rejected = 0
+    for row_num, record in chunk:
+        cursor.execute('SAVEPOINT bulk_row')
+        try:
+            cursor.execute(insert_query, record)
+        except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+            cursor.execute('ROLLBACK TO SAVEPOINT bulk_row')
+            on_reject(row_num, record, e)
+            rejected += 1
+        else:
+            cursor.execute('RELEASE SAVEPOINT bulk_row')
+            loaded += 1
+    return loaded, rejected
+
+
+def _copy_chunks(cursor, table, columns, records, chunk_size, on_reject):
+    """在目前交易中以 COPY 分塊寫入，不 commit。回傳 (成功筆數, 跳過筆數)。"""
+    copy_query = f'COPY {table} ({quote_columns(columns)}) FROM STDIN'
+    insert_query = build_insert_query(table, columns)
+    loaded = rejected = 0
+
+    for chunk in _chunks(records, chunk_size):
+        cursor.execute('SAVEPOINT bulk_chunk')
+        try:
+            cursor.copy_expert(copy_query, _copy_buffer(chunk))
+        except (psycopg2.DataError, psycopg2.IntegrityError):
+            cursor.execute('ROLLBACK TO SAVEPOINT bulk_chunk')
+            ok, bad = _insert_rows_with_savepoints(cursor, insert_query, chunk, on_reject)
+            loaded += ok
+            rejected += bad
+        else:
+            cursor.execute('RELEASE SAVEPOINT bulk_chunk')
+            loaded += len(chunk)
+    return loaded, rejected
+
+
+def copy_records(conn, table, columns, records, chunk_size=COPY_CHUNK_SIZE, on_reject=None):
+    """
+    以 COPY ... FROM STDIN 分塊寫入 records，全部完成後只 commit 一次。
+    records 為 (row_num, record) 的序列。某一塊 COPY 失敗時，該塊退回逐行插入，
+    有問題的行交給 on_reject(row_num, record, error) 回報，其餘行照常寫入。
+    回傳 (成功筆數, 跳過筆數)。
+    """
+    on_reject = on_reject or _default_reject
+    try:
+        with conn.cursor() as cursor:
+            result = _copy_chunks(cursor, table, columns, records, chunk_size, on_reject)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return result
+
+
+def build_merge_query(table, source, columns, key):
+    """
+    由暫存表 source 合併進 table 的 INSERT ... ON CONFLICT。
+    同一批中重複的 key 以列號最大（最後出現）的一行為準，
+    並且只有欄位真的有變動時才 UPDATE，沒變的行不會產生新版本與 WAL。
+    """
+    cols = quote_columns(columns)
+    updates = [col for col in columns if col != key]
+    set_clause = ',\n            '.join(f'"{col}" = EXCLUDED."{col}"' for col in updates)
+    current = ', '.join(f'{table}."{col}"' for col in updates)
+    incoming = ', '.join(f'EXCLUDED."{col}"' for col in updates)
+    return f'''
+        INSERT INTO {table} ({cols})
+        SELECT DISTINCT ON ("{key}") {cols}
+        FROM {source}
+        ORDER BY "{key}", _row_num DESC
+        ON CONFLICT ("{key}") DO UPDATE SET
+            {set_clause}
+        WHERE ({current}) IS DISTINCT FROM ({incoming})
+    '''
+
+
+def merge_stage_queries(table, stage=MERGE_STAGE):
+    """merge 每批的暫存表：與 table 相同的欄位再加上 _row_num，commit 時自動刪除。"""
+    return [f'DROP TABLE IF EXISTS {stage}',
+            f'CREATE TEMP TABLE {stage} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP',
+            f'ALTER TABLE {stage} ADD COLUMN _row_num INTEGER']
+
+
+def staged_records(columns, records):
+    """
+    寫入暫存表的欄位與行：每行最後加上行號，build_merge_query 的 DISTINCT ON 依它留下同一批中最後出現的行。
+    回傳 (欄位, 行的產生器)。
+    """
+    return list(columns) + ['_row_num'], ((row_num, list(record) + [row_num]) for row_num, record in records)
+
+
+def merge_records(conn, table, columns, key, records, on_reject=None, merge_query=None):
+    """
+    把一批 records 以 COPY 載入暫存表，再用單一個 set-based INSERT ... ON CONFLICT 合併進 table。
+    merge_query 可傳入事先以 build_merge_query(table, MERGE_STAGE, ...) 建好的語句，省去每批重建。
+    不 commit，交易邊界由呼叫端決定（暫存表在 commit 時自動刪除）。
+    回傳 (實際新增或更新的筆數, 跳過筆數)。
+    """
+    on_reject = on_reject or _default_reject
+    if not records:
+        return 0, 0
+
+    stage = MERGE_STAGE
+    with conn.cursor() as cursor:
+        for query in merge_stage_queries(table, stage):
+            cursor.execute(query)
+
+        stage_columns, staged = staged_records(columns, records)
+        _, rejected = _copy_chunks(cursor, stage, stage_columns, staged, COPY_CHUNK_SIZE,
+                                   lambda row_num, record, e: on_reject(row_num, record[:-1], e))
+
+        cursor.execute(merge_query or build_merge_query(table, stage, columns, key))
+        return cursor.rowcount, rejected
+
+
+def delete_keys(conn, table, key, keys):
+    """刪除 table 中 key 屬於 keys 的行，不 commit。回傳刪除筆數。"""
+    if not keys:
+        return 0
+    with conn.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE "{key}" = ANY(%s)', (list(keys),))
+        return cursor.rowcount
+
+
+def delete_missing_keys_query(table, key):
+    return f'DELETE FROM {table} WHERE NOT ("{key}" = ANY(%s))'
+
+
+def delete_missing_keys(conn, table, key, seen_keys):
+    """
+    刪除 table 中 key 不在本次試算表裡的行（員工已從試算表移除），不 commit。
+    seen_keys 為空時不動作，避免抓取失敗時把整張表清空。回傳刪除筆數。
+    """
+    if not seen_keys:
+        return 0
+    with conn.cursor() as cursor:
+        cursor.execute(delete_missing_keys_query(table, key), (list(seen_keys),))
+        return cursor.rowcount
+
+
+def insert_records(conn, table, columns, records, on_reject=None, insert_query=None):
+    """舊的逐行寫入：每行一個 INSERT，成功就 commit，失敗就 rollback 並回報。"""
+    on_reject = on_reject or _default_reject
+    insert_query = insert_query or build_insert_query(table, columns)
+    loaded = rejected = 0
+
+    with conn.cursor() as cursor:
+        for row_num, record in records:
+            try:
+                cursor.execute(insert_query, record)
+            except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+                conn.rollback()
+                on_reject(row_num, record, e)
+                rejected += 1
+            else:
+                conn.commit()
+                loaded += 1
+    return loaded, rejected
+
+
+class TableWriter:
+    """
+    串流寫入：可多次呼叫 write(records)，finish() 回傳 (成功筆數, 跳過筆數)。
+    "copy" 模式下所有塊都在同一個交易中，finish() 時才 commit 一次；
+    "row" 模式與 insert_records 相同，每行各自 commit。
+    """
+
+    def __init__(self, conn, table, columns, mode="copy", on_reject=None, chunk_size=COPY_CHUNK_SIZE):
+        if mode not in LOAD_MODES:
+            raise ValueError(f"未知的寫入模式: {mode}（可用: {', '.join(LOAD_MODES)}）")
+        self.conn = conn
+        self.table = table
+        self.columns = columns
+        self.mode = mode
+        self.on_reject = on_reject or _default_reject
+        self.chunk_size = chunk_size
+        self.loaded = 0
+        self.rejected = 0
+        self._cursor = conn.cursor() if mode == "copy" else None
+        self._insert_query = build_insert_query(table, columns) if mode == "row" else None
+
+    def write(self, records):
+        if self.mode == "copy":
+            ok, bad = _copy_chunks(self._cursor, self.table, self.columns, records,
+                                   self.chunk_size, self.on_reject)
+        else:
+            ok, bad = insert_records(self.conn, self.table, self.columns, records, self.on_reject,
+                                     insert_query=self._insert_query)
+        self.loaded += ok
+        self.rejected += bad
+
+    def finish(self):
+        if self._cursor is not None:
+            self._cursor.close()
+            self._cursor = None
+        self.conn.commit()
+        return self.loaded, self.rejected
+
+    def abort(self):
+        if self._cursor is not None:
+            self._cursor.close()
+            self._cursor = None
+        self.conn.rollback()
+
+
+def load_records(conn, table, columns, records, mode="copy", on_reject=None):
+    """依 mode 選擇 COPY 批次寫入或逐行寫入，回傳 (成功筆數, 跳過筆數)。"""
+    writer = TableWriter(conn, table, columns, mode=mode, on_reject=on_reject)
+    try:
+        writer.write(records)
+    except Exception:
+        writer.abort()
+        raise
+    return writer.finish()
+
+
+def replace_keys_from_stage(conn, table, stage, columns, key, changed_keys, removed_keys):
+    """
+    以暫存表 stage 的內容取代 table 中 changed_keys 的所有行，並刪除 removed_keys，不 commit。
+    回傳 (寫入筆數, 刪除筆數)。
+    """
+    changed_keys = list(changed_keys)
+    deleted = delete_keys(conn, table, key, changed_keys + list(removed_keys))
+    if not changed_keys:
+        return 0, deleted
+
+    cols = quote_columns(columns)
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({cols}) SELECT {cols} FROM {stage} WHERE "{key}" = ANY(%s)',
+            (changed_keys,)
+        )
+        return cursor.rowcount, deleted
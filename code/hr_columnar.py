@@ -0,0 +1,69 @@
+"""
+欄位式批次轉換：把一批行轉成欄位陣列，每個欄位只對「不重複的值」做一次正規化，再依原順序填回各行。
+Div、Department、Cost_Centre、Department_Code 與日期欄位的不重複值很少，大部分儲存格都不必再處理。
+
+沒有使用 NumPy：字串欄位要先在 Python 中以 dict 查出每格的代碼，成本和直接查出結果相同，
+轉成 NumPy object 陣列再取值只會多一次複製。
+"""
+from hr_pipeline import PIPELINE_CHUNK_SIZE, chunked
+
+# 轉換模式："columnar" 欄位式去重轉換；"row" 逐行逐格轉換
+TRANSFORM_MODES = ("columnar", "row")
+
+
+# 先看每欄前幾個值的重複程度；不重複值超過一半時（姓名、編號等）直接逐格轉換，省下查表的成本
+UNIQUE_PROBE = 64
+
+
+def map_unique(values, fn, probe=UNIQUE_PROBE):
+    """對 values 中每個不重複的值只呼叫一次 fn（依第一次出現的順序），回傳與 values 等長的結果。"""
+    results = {}
+    head = values[:probe]
+    for value in head:
+        if value not in results:
+            results[value] = fn(value)
+    if len(results) > len(head) // 2:
+        return list(map(fn, values))
+
+    # 依第一次出現的順序，fn 看到的值的順序與逐行轉換相同（不是 set 的雜湊順序）
+    for value in dict.fromkeys(values):
+        if value not in results:
+            results[value] = fn(value)
+    return list(map(results.__getitem__, values))
+
+
+def transform_columns(chunk, column_fns):
+    """
+    chunk 為 [(row_num, record), ...]，column_fns 為 {欄位序號: fn}，沒列出的欄位原樣保留。
+    fn 必須只依賴輸入值（同樣的值得到同樣的結果），輸出才會與逐行轉換完全相同。
+    """
+    if not chunk:
+        return []
+    row_nums = [row_num for row_num, _ in chunk]
+    columns = [list(col) for col in zip(*(record for _, record in chunk))]
+    for index, fn in column_fns.items():
+        columns[index] = map_unique(columns[index], fn)
+    return list(zip(row_nums, map(list, zip(*columns))))
+
+
+def transform_rows(chunk, column_fns):
+    """逐行逐格的轉換，與 transform_columns 結果相同，作為對照。"""
+    out = []
+    for row_num, record in chunk:
+        record = list(record)
+        for index, fn in column_fns.items():
+            record[index] = fn(record[index])
+        out.append((row_num, record))
+    return out
+
+
+def transform_stage(column_fns, mode="columnar", batch_size=PIPELINE_CHUNK_SIZE):
+    """管線階段：每 batch_size 行做一次轉換。"""
+    if mode not in TRANSFORM_MODES:
+        raise ValueError(f"未知的轉換模式: {mode}（可用: {', '.join(TRANSFORM_MODES)}）")
+    transform = transform_columns if mode == "columnar" else transform_rows
+
+    def stage(rows):
+        for chunk in chunked(rows, batch_size):
+            yield from transform(chunk, column_fns)
+    return stage
@@ -0,0 +1,198 @@
+"""
+所有載入程式共用的連線層：
+- PostgreSQL：每組連線參數一個有上限的連線池，借出前檢查連線是否還活著，斷線就換一條新的
+- Google Sheets：access token 快取在磁碟上，到期前的執行都直接沿用，不必每次重新換 token
+- 建立連線、取得 token 遇到暫時性錯誤時以 hr_retry 指數退避重試；開啟試算表經過 hr_sheet_scheduler 的讀取排程
+
+寫入中的交易失敗時仍由呼叫端 rollback，不會自動重送。
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import gspread
+import psycopg2
+from google.auth.transport.requests import Request
+from google.oauth2.service_account import Credentials
+from psycopg2.pool import ThreadedConnectionPool
+
+from hr_retry import retry_call
+from hr_sheet_scheduler import default_scheduler
+
+# 每組連線參數的連線池大小
+POOL_MIN_CONNECTIONS = 1
+POOL_MAX_CONNECTIONS = 4
+
+# 連線閒置超過這個秒數，借出前先以 SELECT 1 確認還活著
+HEALTH_CHECK_IDLE_SECONDS = 30
+
+# Google 認證
+GOOGLE_SCOPES = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+CREDENTIALS_FILE = 'cred.json'
+TOKEN_CACHE_FILE = os.path.join(os.path.expanduser('~'), '.cache', 'hr_sheet2db', 'google_token.json')
+TOKEN_EXPIRY_MARGIN = timedelta(minutes=5)  # 剩不到 5 分鐘就到期的 token 不再沿用
+
+# REST API 的位址（hr_async_sync 直接呼叫，可改成本機的假伺服器）
+SHEETS_API_URL = 'https://sheets.googleapis.com/v4'
+DRIVE_API_URL = 'https://www.googleapis.com/drive/v3'
+
+
+# ---------- PostgreSQL ----------
+
+_pools = {}
+_pools_lock = threading.Lock()
+_last_used = {}
+
+
+def _pool_for(params):
+    key = tuple(sorted(params.items()))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.closed:
+            pool = _pools[key] = retry_call(ThreadedConnectionPool, POOL_MIN_CONNECTIONS,
+                                            POOL_MAX_CONNECTIONS, **params)
+        return pool
+
+
+def _healthy(conn):
+    if conn.closed:
+        return False
+    last_used = _last_used.get(id(conn))
+    if last_used is None or time.monotonic() - last_used < HEALTH_CHECK_IDLE_SECONDS:
+        return True  # 剛建立或剛用過的連線
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _checkout(pool):
+    # 連線池中可能有伺服器已關閉的連線，最多換 POOL_MAX_CONNECTIONS + 1 次
+    for _ in range(POOL_MAX_CONNECTIONS + 1):
+        conn = retry_call(pool.getconn)
+        if _healthy(conn):
+            return conn
+        _last_used.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+    raise psycopg2.OperationalError("無法從連線池取得可用的連線")
+
+
+@contextmanager
+def db_connection(**params):
+    """
+    從連線池借一條連線（參數同 psycopg2.connect），離開時歸還。
+    歸還前未 commit 的交易會 rollback；連線已中斷則直接丟掉，下次借用時重建。
+    """
+    pool = _pool_for(params)
+    conn = _checkout(pool)
+    try:
+        yield conn
+    finally:
+        broken = bool(conn.closed)
+        if not broken:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        if broken:
+            _last_used.pop(id(conn), None)
+        else:
+            _last_used[id(conn)] = time.monotonic()
+        pool.putconn(conn, close=broken)
+
+
+@contextmanager
+def direct_connection(**params):
+    """
+    不經過連線池的獨立連線（例如平行載入時每個工作執行緒一條），建立時同樣重試暫時性錯誤。
+    離開時直接關閉，未 commit 的交易由伺服器 rollback。
+    """
+    conn = retry_call(psycopg2.connect, **params)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            if not pool.closed:
+                pool.closeall()
+        _pools.clear()
+        _last_used.clear()
+
+
+atexit.register(close_pools)
+
+
+# ---------- Google Sheets ----------
+
+def _read_cached_token(path, account):
+    try:
+        with open(path, encoding='utf-8') as f:
+            cached = json.load(f).get(account)
+    except (OSError, ValueError):
+        return None
+    if not cached:
+        return None
+    expiry = datetime.fromisoformat(cached['expiry'])
+    if expiry - TOKEN_EXPIRY_MARGIN <= datetime.utcnow():
+        return None
+    return cached['token'], expiry
+
+
+def _write_cached_token(path, account, token, expiry):
+    """以 0600 權限寫入暫存檔再改名，多個工作同時寫入也不會留下寫一半的檔案。"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        with open(path, encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    cache[account] = {'token': token, 'expiry': expiry.isoformat()}
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(cache, f)
+    os.replace(tmp, path)
+
+
+def google_credentials(credentials_file=CREDENTIALS_FILE, scopes=GOOGLE_SCOPES, cache_file=TOKEN_CACHE_FILE):
+    """
+    讀取服務帳號金鑰；磁碟上有尚未到期的 access token 就直接沿用，否則換一個新的並寫回快取。
+    執行中 token 到期時，gspread 使用的 AuthorizedSession 仍會自動更新。
+    """
+    creds = Credentials.from_service_account_file(credentials_file, scopes=scopes)
+    account = f"{creds.service_account_email} {' '.join(sorted(scopes))}"
+
+    cached = _read_cached_token(cache_file, account)
+    if cached:
+        creds.token, creds.expiry = cached
+        return creds
+
+    retry_call(creds.refresh, Request())
+    try:
+        _write_cached_token(cache_file, account, creds.token, creds.expiry)
+    except OSError as e:
+        print(f"無法寫入 token 快取 {cache_file}: {e}")
+    return creds
+
+
+def sheets_client(credentials_file=CREDENTIALS_FILE):
+    return gspread.authorize(google_credentials(credentials_file))
+
+
+def open_spreadsheet(client, name=None, key=None):
+    """以名稱或 ID 開啟試算表；讀取試算表資訊也算一個讀取請求，同樣經過排程器。"""
+    if key is not None:
+        return default_scheduler().call(client.open_by_key, key)
+    return default_scheduler().call(client.open, name)
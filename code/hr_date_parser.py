@@ -0,0 +1,119 @@
+import re
+from collections import OrderedDict
+from datetime import date
+
+# 與舊的 parse_date 相同的格式與初始嘗試順序
+DATE_FORMATS = [
+    '%Y-%m-%d',
+    '%m/%d/%Y',
+    '%d-%m-%Y',
+    '%Y/%m/%d',
+    '%d/%m/%Y',
+    '%m-%d-%Y',
+    '%Y.%m.%d',
+    '%d.%m.%Y'
+    # 根據需要添加更多格式
+]
+
+# 每個欄位最多快取幾個不同的日期字串
+DATE_CACHE_SIZE = 4096
+
+# 與 strptime 相同：%Y 為 4 位數，%m、%d 為 1~2 位數
+_FIELD_PATTERNS = {'%Y': r'(\d{4})', '%m': r'(\d{1,2})', '%d': r'(\d{1,2})'}
+
+_MISSING = object()
+
+
+def _compile_format(fmt):
+    """把 strptime 格式轉為 regex，以及年、月、日各在第幾個 group。"""
+    pattern = ''
+    fields = []
+    for part in re.split(r'(%[Ymd])', fmt):
+        if part in _FIELD_PATTERNS:
+            pattern += _FIELD_PATTERNS[part]
+            fields.append(part)
+        else:
+            pattern += re.escape(part)
+    groups = (fields.index('%Y') + 1, fields.index('%m') + 1, fields.index('%d') + 1)
+    return re.compile(pattern), groups
+
+
+def _shape(fmt):
+    # 只差在日、月位置互換的格式（例如 %m/%d/%Y 與 %d/%m/%Y）才可能同時符合同一個字串；
+    # 其他格式的分隔符號或 4 位數年份的位置不同，不會同時符合
+    return fmt.replace('%d', '%m')
+
+
+def _match(parser, text):
+    """以一個格式解析，不符合或不是合法日期（例如 13 月）時回傳 None。"""
+    _, regex, (y, m, d) = parser
+    match = regex.fullmatch(text)
+    if not match:
+        return None
+    try:
+        return date(int(match.group(y)), int(match.group(m)), int(match.group(d)))
+    except ValueError:
+        return None
+
+
+class DateNormalizer:
+    """
+    單一欄位的日期正規化，直接回傳 datetime.date，無法解析或空值回傳 None。
+    - 以 regex + int 解析，不再逐一嘗試 strptime 並捕捉 ValueError
+    - 記錄各格式命中次數，該欄最常見的格式會逐漸排到最前面先試
+    - 重複的日期字串（到職日大量重複）直接查快取，超過 cache_size 時淘汰最久未用的
+    日/月可互換的字串（例如 01/02/2024）一律以 formats 中較前面的格式解讀（與舊的 parse_date 相同），
+    不受先前看過哪些值影響：結果只依賴輸入值，分批方式、讀取順序或 hr_columnar 的欄位式轉換都不會改變結果。
+    """
+
+    def __init__(self, formats=DATE_FORMATS, cache_size=DATE_CACHE_SIZE):
+        self._parsers = [(fmt,) + _compile_format(fmt) for fmt in formats]
+        # 每個格式之前（優先順序較高）且可能符合同一個字串的格式
+        self._ambiguous = {parser[0]: [p for p in self._parsers[:i] if _shape(p[0]) == _shape(parser[0])]
+                           for i, parser in enumerate(self._parsers)}
+        self._hits = dict.fromkeys(formats, 0)
+        self._cache = OrderedDict()
+        self.cache_size = cache_size
+
+    @property
+    def dominant_format(self):
+        return self._parsers[0][0]
+
+    def __call__(self, value):
+        if not value:
+            return None
+        result = self._cache.get(value, _MISSING)
+        if result is not _MISSING:
+            self._cache.move_to_end(value)
+            return result
+
+        result = self._parse(value)
+        self._cache[value] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+    def _parse(self, value):
+        text = value.strip()
+        if not text or text == '-':
+            return None
+
+        for i, parser in enumerate(self._parsers):
+            result = _match(parser, text)
+            if result is None:
+                continue  # 不符合或例如 13 月，交給下一個格式
+            # 優先順序較高的格式也能解析時（日/月可互換），以它為準，學到的順序只影響先試哪個格式
+            for earlier in self._ambiguous[parser[0]]:
+                earlier_result = _match(earlier, text)
+                if earlier_result is not None:
+                    result = earlier_result
+                    break
+            self._learn(i, parser[0])
+            return result
+        return None
+
+    def _learn(self, index, fmt):
+        self._hits[fmt] += 1
+        # 命中次數超過前一個格式時往前移一格
+        if index and self._hits[fmt] > self._hits[self._parsers[index - 1][0]]:
+            self._parsers[index - 1], self._parsers[index] = self._parsers[index], self._parsers[index - 1]
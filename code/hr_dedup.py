@@ -0,0 +1,210 @@
+"""
+同一次執行中 key（例如 10_number）重複的行在寫入前以雜湊表找出，依策略只留一行（或一行都不留），
+寫入時不會再有 key 衝突：COPY 進有 UNIQUE 索引的表不會整批失敗，ON CONFLICT 也不會在同一個語句中
+更新同一行兩次，merge 的每行雜湊也不會被同一個 key 的兩行來回覆寫。
+- "first-wins"   ：最先出現的一行為準（與 UNIQUE 索引存在時依序寫入的結果相同）
+- "last-wins"    ：最後出現的一行為準（與 ON CONFLICT DO UPDATE 依序覆寫的結果相同）
+- "prefer-active"：在職的行優先；同樣在職或同樣不在職時，最後出現的為準
+- "reject-all"   ：重複的 key 一行都不寫
+
+去重在 SchemaValidator 之後：檢查不過的行不參與去重，一個 key 最先（或最後）出現的那一行檢查不過時，
+由同一個 key 其他檢查通過的行勝出，key 不會因此從表中消失。
+沒有留下的行以 DuplicateKey 交給 on_reject，寫進拒絕紀錄與 metrics；訊息中列出這個 key 出現在哪幾行。
+
+記憶體只與不重複的 key 數成正比，不會收齊整次的行：
+- first-wins 看到一行就能決定；merge（upsert=True）的 last-wins 直接放行，由 merge_records 的
+  DISTINCT ON 與逐批 ON CONFLICT 以後出現的行覆寫，被覆寫的行只計入 summary()
+- 其他情況分兩趟：scan() 先讀一次 key 欄（hr_jobs 的快照、試算表的單一欄），記下哪些 key 重複、
+  最後出現在哪一行；apply() 串流時只暫存重複 key 的行，經過它最後出現的行後依策略選出勝出的一行
+"""
+from collections import deque
+
+from hr_bulk_load import _default_reject
+from hr_pipeline import BLANK_VALUES
+from hr_validation import ValidationError
+
+DEDUP_POLICIES = ("first-wins", "last-wins", "prefer-active", "reject-all")
+
+# active 欄中表示在職的值（不分大小寫）
+ACTIVE_VALUES = ('y', 'yes', 'true', '1', 'active')
+
+
+class DuplicateKey(ValidationError):
+    pgcode = '23505'
+
+
+def active_test(schema):
+    """prefer-active 判斷在職的方式：有 active 欄時看它的值，否則離職日期為空即在職；兩者都沒有時回傳 None。"""
+    names = {name.lower(): i for i, name in enumerate(schema.names)}
+    if 'active' in names:
+        index = names['active']
+        return lambda record: str(record[index] or '').strip().lower() in ACTIVE_VALUES
+    if 'resigned_date' in names:
+        index = names['resigned_date']
+        return lambda record: record[index] in (None, '')
+    return None
+
+
+class KeyDeduplicator:
+    """
+    依 schema.key 去重，一次執行用一個。key 為 None 或 blanks 中表示沒有值的寫法（空字串、工作的
+    empty_value）的行不比對，原樣放行，與 UNIQUE 索引相同。on_reject(row_num, record, 錯誤) 收到沒有留下的行。
+    upsert 為 True 表示寫入端以 ON CONFLICT 依序覆寫（merge），last-wins 不必先讀 key 欄。
+    """
+
+    def __init__(self, schema, policy, on_reject=None, blanks=BLANK_VALUES, upsert=False):
+        if policy not in DEDUP_POLICIES:
+            raise ValueError(f"未知的去重策略: {policy}（可用: {', '.join(DEDUP_POLICIES)}）")
+        self.policy = policy
+        self.upsert = upsert
+        self.key = schema.key
+        self.key_index = schema.index_of(schema.key)
+        self.is_active = active_test(schema) if policy == "prefer-active" else None
+        if policy == "prefer-active" and self.is_active is None:
+            raise ValueError(f"{schema.table} 沒有 active 或 resigned_date 欄位，不能使用 prefer-active")
+        self.on_reject = on_reject or _default_reject
+        self.blanks = frozenset(blanks)
+        self.scanned = False
+        self.dropped = 0
+        self.overwritten = 0
+        # 只記重複的 key：key -> [出現的行號, ...]
+        self.conflicts = {}
+        # scan() 找出的重複 key 依最後出現的行號排序：[(行號, key), ...]
+        self._due = deque()
+        self._last = {}
+        # 重複的 key 在決定前暫存的行；只有這些行留在記憶體中
+        self._held = {}
+        # 已放行的 key -> 行號
+        self._kept = {}
+        # reject-all 時一行都沒寫入的 key
+        self._rejected = set()
+
+    @property
+    def streaming(self):
+        """不必先 scan()：first-wins 看到一行就能決定，merge 的 last-wins 交給 ON CONFLICT 依序覆寫。"""
+        return self.policy == "first-wins" or (self.upsert and self.policy == "last-wins")
+
+    def _blank(self, key):
+        return key is None or key in self.blanks
+
+    def scan(self, keys):
+        """第一趟：keys 為 (row_num, key)，通常只讀 key 欄；記下重複的 key 與它們最後出現的行號。"""
+        first = {}
+        for row_num, key in keys:
+            if self._blank(key):
+                continue
+            if key not in first:
+                first[key] = row_num
+                continue
+            rows = self.conflicts.get(key)
+            if rows is None:
+                rows = self.conflicts[key] = [first[key]]
+            rows.append(row_num)
+        self._last = {key: rows[-1] for key, rows in self.conflicts.items()}
+        self._due = deque(sorted((row_num, key) for key, row_num in self._last.items()))
+        self.scanned = True
+        return self
+
+    def _winner(self, rows):
+        """依策略在同一個 key 檢查通過的行中選出勝出的一行；reject-all 有兩行以上時回傳 None。"""
+        if self.policy == "first-wins":
+            return rows[0]
+        if self.policy == "last-wins":
+            return rows[-1]
+        if self.policy == "prefer-active":
+            return ([item for item in rows if self.is_active(item[1])] or rows)[-1]
+        return rows[0] if len(rows) == 1 else None
+
+    def _error(self, key, kept):
+        rows = ', '.join(map(str, self.conflicts[key]))
+        kept = 'all rejected' if kept is None else f'kept row {kept}'
+        return DuplicateKey(f'duplicate key value ("{self.key}")=({key}) in rows {rows}; {kept} ({self.policy})',
+                            self.key)
+
+    def _decide(self, key):
+        rows = self._held.pop(key, None)
+        if not rows:
+            # 這個 key 的行都沒通過檢查
+            return
+        winner = self._winner(rows)
+        if winner is None:
+            self._rejected.add(key)
+        else:
+            self._kept[key] = winner[0]
+            yield winner
+        for item in rows:
+            if item is not winner:
+                self.dropped += 1
+                self.on_reject(item[0], item[1], self._error(key, winner and winner[0]))
+
+    def _release(self, row_num):
+        """最後出現的行號不大於 row_num 的重複 key：所有的行都已經過，可以決定了。"""
+        due = self._due
+        while due and (row_num is None or due[0][0] <= row_num):
+            yield from self._decide(due.popleft()[1])
+
+    def _duplicate(self, row_num, record, key):
+        """scan() 沒看到重複的 key（streaming，或讀 key 欄之後試算表又被修改）：依到目前為止看到的行處理。"""
+        rows = self.conflicts.setdefault(key, [self._kept[key]])
+        rows.append(row_num)
+        if self.upsert and self.policy == "last-wins":
+            self.overwritten += 1
+            self._kept[key] = row_num
+            return True
+        self.dropped += 1
+        self.on_reject(row_num, record, self._error(key, self._kept[key]))
+        return False
+
+    def apply(self, records):
+        """
+        第二趟：records 為檢查過的 (row_num, record)，依行號遞增，可以分成多次呼叫。沒有重複的 key 直接放行；
+        重複的 key 暫存到串流經過它最後出現的行，勝出的行在那時才產生，其餘交給 on_reject。
+        """
+        if not (self.streaming or self.scanned):
+            raise ValueError(f"{self.policy} 去重前要先以 scan() 讀過 key 欄")
+        for row_num, record in records:
+            key = record[self.key_index]
+            if self._blank(key):
+                yield row_num, record
+            elif key in self._last:
+                self._held.setdefault(key, []).append((row_num, record))
+            elif key not in self._kept:
+                self._kept[key] = row_num
+                yield row_num, record
+            elif self._duplicate(row_num, record, key):
+                yield row_num, record
+            yield from self._release(row_num)
+
+    def finish(self):
+        """串流結束：最後出現的那幾行沒有通過檢查、還在暫存中的 key 在這裡決定。"""
+        return self._release(None)
+
+    def checkpoint(self, row_num):
+        """
+        merge 每批 commit 時可以記為進度的行號：還有行在暫存中時退到最早的那一行之前，
+        續傳時暫存中還沒寫入的行不會被當成已 commit 而略過。
+        """
+        held = [rows[0][0] for rows in self._held.values()]
+        return min([row_num] + [first - 1 for first in held])
+
+    def rejected_keys(self):
+        """reject-all 中一行都沒寫入的 key；merge 時仍要當作在試算表中，不可刪除資料庫中既有的行。"""
+        return list(self._rejected)
+
+    def summary(self):
+        if not self.conflicts:
+            return None
+        if self.overwritten:
+            return f"重複的 {self.key}: {len(self.conflicts)} 個，{self.overwritten} 行被後出現的行覆寫（策略: {self.policy}）"
+        return f"重複的 {self.key}: {len(self.conflicts)} 個，未寫入 {self.dropped} 行（策略: {self.policy}）"
+
+
+def dedup_stage(dedup):
+    """
+    管線階段：接在 validation_stage 之後。不是 streaming 的策略要先以 dedup.scan() 讀過 key 欄。
+    暫存到串流結束的行由 finish 產生，hr_pipeline.run_pipeline 與 hr_async_sync.run_pipeline 會在最後呼叫它。
+    """
+    def stage(rows):
+        return dedup.apply(rows)
+    stage.finish = dedup.finish
+    return stage
@@ -0,0 +1,418 @@
+"""
+本機用的假試算表，介面與 gspread 讀取相關的部分相同，不需要網路或金鑰：
+- FakeWorksheet：每分鐘（window 秒）超過 quota 個請求時丟出 429，回應帶 Retry-After；
+  每個請求依行數模擬延遲；與 API 相同，範圍尾端的空白行、每行尾端的空白儲存格不會回傳
+- FakeSpreadsheet / FakeClient：open()、open_by_key()、worksheet()，以及 Drive 版本查詢
+- FakeSheetsServer：以本機 HTTP 提供同一份資料的 Sheets v4 / Drive v3 讀取 API（給 hr_async_sync 使用）
+- employee_sheet_rows() / merge_sheet_rows()：產生合成的員工資料，欄位的重複程度、
+  不規則的日期與超過欄位長度的值都仿照正式資料（見 skipped_records.txt）
+給效能測試與 tests/ 中的測試使用。
+"""
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from hr_sheet_fetch import column_letter
+
+_RANGE = re.compile(r'^([A-Z]*)(\d+):([A-Z]*)(\d+)$')
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None, payload=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.payload = payload
+
+    def json(self):
+        return self.payload
+
+
+class FakeAPIError(Exception):
+    """與 gspread.exceptions.APIError 一樣帶有 response.status_code 與 response.headers。"""
+
+    def __init__(self, status_code, message, retry_after=None):
+        headers = {'Retry-After': f"{retry_after:.3f}"} if retry_after is not None else {}
+        super().__init__(f"{status_code}: {message}")
+        self.response = FakeResponse(status_code, headers)
+
+
+def _column_index(letters):
+    index = 0
+    for ch in letters:
+        index = index * 26 + ord(ch) - ord('A') + 1
+    return index - 1
+
+
+def _trim(cells):
+    end = len(cells)
+    while end and cells[end - 1] == '':
+        end -= 1
+    return list(cells[:end])
+
+
+class FakeWorksheet:
+    """
+    rows 為第 1 行起的所有資料（含表頭）；row_count 可大於資料行數，模擬尾端的空白格線。
+    requests / throttled 記錄收到的請求數與被拒絕的次數。
+    """
+
+    def __init__(self, rows, row_count=None, quota=60, window=60.0, base_latency=0.0,
+                 latency_per_row=0.0, title='工作表1'):
+        self.rows = [list(row) for row in rows]
+        self.row_count = row_count or len(self.rows)
+        self.col_count = max((len(row) for row in self.rows), default=0)
+        self.quota = quota
+        self.window = window
+        self.base_latency = base_latency
+        self.latency_per_row = latency_per_row
+        self.title = title
+        self.requests = 0
+        self.throttled = 0
+        self._served = deque()
+        self._lock = threading.Lock()
+
+    def _request(self, rows=0):
+        """模擬配額：window 秒內已處理 quota 個請求時拒絕，Retry-After 為最早那個請求過期的時間。"""
+        with self._lock:
+            now = time.monotonic()
+            while self._served and self._served[0] <= now - self.window:
+                self._served.popleft()
+            self.requests += 1
+            if len(self._served) >= self.quota:
+                self.throttled += 1
+                raise FakeAPIError(429, "Quota exceeded for quota metric 'Read requests'",
+                                   retry_after=self._served[0] + self.window - now)
+            self._served.append(now)
+        delay = self.base_latency + self.latency_per_row * rows
+        if delay:
+            time.sleep(delay)
+
+    def _block(self, a1):
+        match = _RANGE.match(a1)
+        if not match:
+            raise FakeAPIError(400, f"無法解析範圍 {a1}")
+        first_col, start, last_col, end = match.groups()
+        start, end = int(start), int(end)
+        first = _column_index(first_col) if first_col else 0
+        last = _column_index(last_col) if last_col else self.col_count - 1
+        block = [_trim(row[first:last + 1]) for row in self.rows[start - 1:end]]
+        while block and not block[-1]:
+            block.pop()
+        return block, end - start + 1
+
+    def get(self, a1):
+        block, rows = self._block(a1)
+        self._request(rows)
+        return block
+
+    def batch_get(self, ranges):
+        """多個範圍只算一個請求。"""
+        blocks = [self._block(a1) for a1 in ranges]
+        self._request(max((rows for _, rows in blocks), default=0))
+        return [block for block, _ in blocks]
+
+    def get_all_values(self):
+        self._request(len(self.rows))
+        return [_trim(row) for row in self.rows]
+
+    def row_values(self, row):
+        self._request(1)
+        return _trim(self.rows[row - 1]) if row <= len(self.rows) else []
+
+    def col_values(self, col):
+        self._request(len(self.rows))
+        letter = column_letter(col - 1)
+        return [cells[0] if cells else '' for cells in self._block(f"{letter}1:{letter}{len(self.rows)}")[0]]
+
+
+class FakeSpreadsheet:
+    """worksheets 為 {分頁名稱: FakeWorksheet}；version 模擬 Drive 的檔案版本。"""
+
+    def __init__(self, client, spreadsheet_id, title, worksheets, version=1):
+        self.client = client
+        self.id = spreadsheet_id
+        self.title = title
+        self.worksheets = worksheets
+        self.version = version
+
+    def worksheet(self, title):
+        try:
+            return self.worksheets[title]
+        except KeyError:
+            raise FakeAPIError(404, f"找不到分頁 {title}")
+
+    def edit(self, title, row, values):
+        """模擬有人修改試算表：分頁 title 的第 row 行換成 values，Drive 的版本加一。"""
+        sheet = self.worksheet(title)
+        sheet.rows.extend([] for _ in range(row - len(sheet.rows)))
+        sheet.rows[row - 1] = list(values)
+        sheet.row_count = max(sheet.row_count, row)
+        sheet.col_count = max(sheet.col_count, len(values))
+        self.version += 1
+
+
+class FakeClient:
+    """取代 gspread.Client；request() 只支援 hr_sheet_revision 查詢 Drive 版本的請求。"""
+
+    def __init__(self):
+        self.spreadsheets = []
+
+    def add(self, title, worksheets, spreadsheet_id=None):
+        spreadsheet = FakeSpreadsheet(self, spreadsheet_id or f"fake-{len(self.spreadsheets) + 1}", title, worksheets)
+        self.spreadsheets.append(spreadsheet)
+        return spreadsheet
+
+    def open(self, title):
+        for spreadsheet in self.spreadsheets:
+            if spreadsheet.title == title:
+                return spreadsheet
+        raise FakeAPIError(404, f"找不到試算表 {title}")
+
+    def open_by_key(self, key):
+        for spreadsheet in self.spreadsheets:
+            if spreadsheet.id == key:
+                return spreadsheet
+        raise FakeAPIError(404, f"找不到試算表 {key}")
+
+    def request(self, method, url, params=None):
+        for spreadsheet in self.spreadsheets:
+            if spreadsheet.id in url:
+                return FakeResponse(200, payload={'version': str(spreadsheet.version)})
+        return FakeResponse(404, payload={})
+
+
+# ---------- 本機 HTTP 伺服器 ----------
+
+def _split_sheet_range(a1):
+    """'分頁'!A1:B2 或 分頁!A1:B2 拆成 (分頁名稱, A1:B2)。"""
+    title, _, cells = a1.rpartition('!')
+    if title.startswith("'") and title.endswith("'"):
+        title = title[1:-1].replace("''", "'")
+    return title, cells
+
+
+class FakeSheetsServer:
+    """
+    以 FakeClient 的資料回應 hr_async_sync 用到的請求（不檢查認證）：
+    GET /v4/spreadsheets/{id}、/v4/spreadsheets/{id}/values/{range}、/v4/spreadsheets/{id}/values:batchGet、
+    /drive/v3/files?q=name = '...'、/drive/v3/files/{id}。
+    每個請求一個執行緒，FakeWorksheet 的配額與延遲照常作用；錯誤以 JSON 回應並帶 Retry-After。
+    with FakeSheetsServer(client) as server: 使用 server.sheets_url / server.drive_url。
+    """
+
+    def __init__(self, client, host='127.0.0.1', port=0):
+        self.client = client
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                try:
+                    status, payload, headers = 200, server.handle(self.path), {}
+                except FakeAPIError as e:
+                    status, headers = e.response.status_code, e.response.headers
+                    payload = {'error': {'code': status, 'message': str(e)}}
+                body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        base = f"http://{host}:{self.httpd.server_address[1]}"
+        self.sheets_url = f"{base}/v4"
+        self.drive_url = f"{base}/drive/v3"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='fake-sheets-server', daemon=True)
+
+    def handle(self, path):
+        url = urlsplit(path)
+        query = parse_qs(url.query)
+        parts = [unquote(part) for part in url.path.strip('/').split('/')]
+
+        if parts[:3] == ['drive', 'v3', 'files']:
+            if len(parts) == 4:
+                response = self.client.request('get', parts[3])
+                if response.status_code != 200:
+                    raise FakeAPIError(response.status_code, f"找不到檔案 {parts[3]}")
+                return response.json()
+            name = re.search(r"name = '((?:[^'\\]|\\.)*)'", query.get('q', [''])[0])
+            name = re.sub(r"\\(.)", r"\1", name.group(1)) if name else None
+            return {'files': [{'id': s.id} for s in self.client.spreadsheets if s.title == name]}
+
+        if parts[:2] != ['v4', 'spreadsheets'] or len(parts) < 3:
+            raise FakeAPIError(404, f"不支援的路徑 {url.path}")
+        spreadsheet = self.client.open_by_key(parts[2])
+        if len(parts) == 3:
+            return {'sheets': [{'properties': {'title': title, 'gridProperties': {
+                'rowCount': sheet.row_count, 'columnCount': sheet.col_count}}}
+                for title, sheet in spreadsheet.worksheets.items()]}
+
+        if parts[3] == 'values:batchGet':
+            ranges = [_split_sheet_range(a1) for a1 in query.get('ranges', [])]
+            titles = {title for title, _ in ranges}
+            if len(titles) != 1:
+                raise FakeAPIError(400, "一個 batchGet 只支援同一個分頁的範圍")
+            blocks = spreadsheet.worksheet(titles.pop()).batch_get([cells for _, cells in ranges])
+            return {'valueRanges': [{'range': a1, 'values': block} if block else {'range': a1}
+                                    for a1, block in zip(query['ranges'], blocks)]}
+
+        if parts[3] == 'values' and len(parts) == 5:
+            title, cells = _split_sheet_range(parts[4])
+            block = spreadsheet.worksheet(title).get(cells)
+            return {'range': parts[4], 'values': block} if block else {'range': parts[4]}
+        raise FakeAPIError(404, f"不支援的路徑 {url.path}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+# ---------- 合成的員工資料 ----------
+
+EMPLOYEE_HEADER = ["Div", "Formal Name", "Department", "Cost Centre", "Reporting date", "Resigned date",
+                   "10 Number", "Department Code", "Cost Centre Code"]
+
+MERGE_HEADER = ["Div", "Last Name", "First Name", "Middle Name", "Formal Name", "Department", "Cost Centre",
+                "Reporting Date", "Resigned Date", "10 Number", "Type", "Department Code", "Cost Centre Code",
+                "Transfer Record", "Remark", "Card Number", "ADM Remark", "Updated By", "Updated At", "Active"]
+
+_DIVS = ["BBI-HO", "BBI-P1", "BBI-P2", "PBG-HQ", "PBG-RD", "PBG-QA", "SVC", "LOG"]
+_TYPES = ["Direct", "Indirect", "Contractor", "Intern", "Expatriate"]
+_LAST_NAMES = ["SANTOS", "REYES", "CRUZ", "BAUTISTA", "GARCIA", "MENDOZA", "TORRES", "LEYCANO", "SERRANO",
+               "RAMOS", "CHEN", "LIN", "WANG", "HUANG", "NGUYEN", "TRAN"]
+_FIRST_NAMES = ["HENRY", "MARLON", "JOSE", "MARIA", "ANNA", "MARK", "JOHN", "GRACE", "KEVIN", "AMY",
+                "DANIEL", "ROSE", "PAUL", "JOY", "RYAN", "LUIS"]
+
+
+def _dirty_date(rng, day):
+    """大多數是 YYYY/MM/DD，少數為其他格式、空白、文字或不存在的日期。"""
+    roll = rng.random()
+    if roll < 0.85:
+        return day.strftime('%Y/%m/%d')
+    if roll < 0.90:
+        return day.isoformat()
+    if roll < 0.93:
+        return f"{day.month}/{day.day}/{day.year}"
+    if roll < 0.95:
+        return ''
+    if roll < 0.97:
+        return rng.choice(['N/A', '待確認', '-', ' '])
+    return f"{day.year}/02/{rng.choice([30, 31])}"
+
+
+def _departments(rng, count=150):
+    departments = []
+    for i in range(count):
+        div = _DIVS[i % len(_DIVS)]
+        name = f"{div.replace('-', ' ')} {rng.choice(['ADM', 'MFG', 'ENG', 'FIN', 'HR', 'IT'])}-{i:03d}"
+        departments.append((div, name, f"{i // 30 + 1:02d}{i % 30 + 1:02d}{rng.randrange(100):02d}{i % 7:02d}"))
+    return departments
+
+
+def _employee_number(i):
+    return f"{10 + i % 15}{i:08d}"
+
+
+def _employee(rng, i, departments, base=date(1995, 1, 1)):
+    """一筆員工的共用欄位；少數工號重複、缺漏或超過 10 碼，少數部門代號超過 8 碼。"""
+    div, department, code = rng.choice(departments)
+    hired = base + timedelta(days=rng.randrange(11000))
+    roll = rng.random()
+    if roll < 0.003 and i > 1:
+        number = _employee_number(rng.randrange(1, i))  # 與前面的人重複
+    elif roll < 0.005:
+        number = ''
+    elif roll < 0.010:
+        number = _employee_number(i) + str(rng.randrange(10))
+    else:
+        number = _employee_number(i)
+    if rng.random() < 0.005:
+        code += '0'
+    resigned = hired + timedelta(days=rng.randrange(200, 6000)) if rng.random() < 0.2 else None
+    return {
+        'div': div,
+        'last': rng.choice(_LAST_NAMES),
+        'first': rng.choice(_FIRST_NAMES),
+        'middle': rng.choice('ABCDEFGHJKLMNPQRS') + '.',
+        'department': department,
+        'code': code,
+        'reporting': _dirty_date(rng, hired),
+        'resigned': _dirty_date(rng, resigned) if resigned else '',
+        'number': number,
+    }
+
+
+def employee_sheet_rows(n, seed=42):
+    """「引用-HR 10碼工號」工作表1 的標題列加上 n 行資料；第 2 行與正式資料一樣重複了標題。"""
+    rng = random.Random(seed)
+    departments = _departments(rng)
+    rows = [list(EMPLOYEE_HEADER), list(EMPLOYEE_HEADER)]
+    for i in range(1, n):
+        e = _employee(rng, i, departments)
+        rows.append([
+            e['div'] if rng.random() > 0.002 else '',
+            f"{e['last']},{e['first']} {e['middle']}",
+            e['department'],
+            e['department'],
+            e['reporting'],
+            e['resigned'],
+            e['number'],
+            e['code'],
+            e['code'],
+        ])
+    return rows
+
+
+def merge_sheet_rows(n, seed=42):
+    """Merge 工作表（A:T 共 20 欄）的標題列加上 n 行資料；備註偶爾超過欄位長度。"""
+    rng = random.Random(seed)
+    departments = _departments(rng)
+    rows = [list(MERGE_HEADER)]
+    for i in range(1, n + 1):
+        e = _employee(rng, i, departments)
+        remark = ''
+        if rng.random() < 0.05:
+            remark = rng.choice(['調職', '留職停薪', '轉正職', 'Transferred from ' + e['department']])
+            if rng.random() < 0.1:
+                remark = (remark + ' ') * 12
+        rows.append([
+            e['div'],
+            e['last'],
+            e['first'],
+            e['middle'],
+            f"{e['last']},{e['first']} {e['middle']}",
+            e['department'],
+            e['department'],
+            e['reporting'],
+            e['resigned'],
+            e['number'],
+            rng.choice(_TYPES),
+            e['code'],
+            e['code'],
+            '',
+            remark,
+            f"{rng.randrange(10 ** 10):010d}" if rng.random() < 0.7 else '',
+            '',
+            'hr-sync',
+            '',
+            'N' if e['resigned'] else 'Y',
+        ])
+    return rows
@@ -1,177 +1,78 @@
 from airflow import DAG
+from airflow.decorators import task, task_group
 from airflow.operators.python_operator import PythonOperator
 from datetime import datetime
 
-from dotenv import load_dotenv
-# 加載 .env 文件中的環境變數
-load_dotenv()
-
 import os
-import psycopg2
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-
-# DB 資訊
-POSTGRES_SERVER = os.getenv('N_POSTGRES_SERVER')
-POSTGRES_DB = os.getenv('N_POSTGRES_DB')
-POSTGRES_USER = os.getenv('N_POSTGRES_USER')
-POSTGRES_PASSWORD = os.getenv('N_POSTGRES_PASSWORD')
-POSTGRES_PORT = os.getenv('N_POSTGRES_PORT')
-
-
-# 定義 "hr_gsheet2db" 小程式
-def hr_gsheet2db():
-    # Google Sheets API 資訊
-    my_spreadsheet_name = "引用-HR 10碼工號"
-    my_Googlesheet_PageName = "工作表1"
-
-    # 設定 Google Sheets API 認證
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    creds = ServiceAccountCredentials.from_json_keyfile_name('cred.json', scope)
-    client = gspread.authorize(creds)
-
-    def parse_date(date_str):
-        """
-        嘗試將日期字串解析為 'YYYY-MM-DD' 格式。
-        如果日期是空的，返回 'NA'。
-        """
-        if not date_str or date_str == '-':
-            return 'NA'
-        
-        date_formats = [
-            '%Y-%m-%d',
-            '%m/%d/%Y',
-            '%d-%m-%Y',
-            '%Y/%m/%d',
-            '%d/%m/%Y',
-            '%m-%d-%Y',
-            '%Y.%m.%d',
-            '%d.%m.%Y'
-            # 根據需要添加更多格式
-        ]
-        
-        for fmt in date_formats:
-            try:
-                parsed_date = datetime.strptime(date_str.strip(), fmt)
-                return parsed_date.strftime('%Y-%m-%d')
-            except ValueError:
-                continue
-        return 'NA'  # 所有格式均無法匹配時返回 'NA'
+import sys
+
+# 排程器每隔幾秒就會重新解析這個檔案，模組層級只放 DAG 定義：
+# psycopg2、gspread、認證、.env 與工作設定檔都在任務執行時才載入，解析時不做網路或資料庫連線
+
+# 讓 DAG 能匯入同目錄下的共用模組（/opt/airflow/dags/hr/）
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# 同時同步的目標表數上限（動態展開的任務中最多幾個同時執行）
+HR_MAX_PARALLEL_JOBS = int(os.getenv('N_HR_MAX_PARALLEL_JOBS', '3'))
+
 
+# 讀取 hr_jobs.json，每個目標表展開成一個任務；同一個目標表的工作在同一個任務中依序執行
+def list_hr_jobs():
+    from hr_jobs import group_by_table, load_jobs
+    return [[job.name for job in group] for group in group_by_table(load_jobs())]
+
+
+# 以下三個任務對每個目標表各執行一次，彼此之間只傳快照檔案路徑：
+# load 失敗重試時重讀 transform 的快照，不會重新下載試算表。
+# 錯誤直接拋出讓任務失敗，Airflow 才會依 retries 重試
+
+# 對每個工作執行 step(job, settings, metrics)，量測結果（失敗時也一樣）以 key "metrics" 推到 XCom：{工作名稱: 摘要}
+def run_with_metrics(job_names, step):
+    from airflow.operators.python import get_current_context
+    from hr_jobs import load_jobs, load_settings, new_metrics, report_metrics
+
+    settings = load_settings()
+    jobs = {job.name: job for job in load_jobs()}
+    results, summaries = {}, {}
     try:
-        # 打開 Google Sheets
-        spreadsheet = client.open(my_spreadsheet_name)
-        sheet = spreadsheet.worksheet(my_Googlesheet_PageName)
-
-        # 取得所有資料
-        data = sheet.get_all_values()
-        if not data:
-            raise ValueError("Google Sheets 中沒有數據")
-
-        header = data[0] if len(data) > 0 else []
-        rows = data[1:] if len(data) > 1 else []
-
-        # 處理空的列名
-        header = [f'col_{i+1}' if col.strip() == '' else col.strip() for i, col in enumerate(header)]
-
-        # 連接到 PostgreSQL 資料庫
-        conn = psycopg2.connect(
-            host=POSTGRES_SERVER,
-            port=POSTGRES_PORT,
-            dbname=POSTGRES_DB,
-            user=POSTGRES_USER,
-            password=POSTGRES_PASSWORD
-        )
-        cursor = conn.cursor()
-
-        # 刪除已存在的表格（如果存在）
-        cursor.execute('DROP TABLE IF EXISTS employee_records_for_IT_use')
-        conn.commit()
-        print("已刪除表格 employee_records_for_IT_use（如果存在）")
-
-        # 創建新表格
-        create_table_query = '''
-        CREATE TABLE employee_records_for_IT_use (
-            "Div" VARCHAR(50),
-            "Formal_Name" VARCHAR(100),
-            "Department" VARCHAR(100),
-            "Cost_Centre" VARCHAR(50),
-            "Reporting_date" DATE,
-            "Resigned_date" DATE,
-            "10_Number" VARCHAR(10),
-            "Department_Code" VARCHAR(8),
-            "Cost_Centre_Code" VARCHAR(8)
-        );
-        '''
-        cursor.execute(create_table_query)
-        conn.commit()
-        print("表格 employee_records_for_IT_use 已成功創建")
-
-        # 根據 Google Sheets 的資料結構插入資料
-        columns = [
-            "Div", "Formal_Name", "Department", "Cost_Centre", 
-            "Reporting_date", "Resigned_date", "10_Number", 
-            "Department_Code", "Cost_Centre_Code"
-        ]
-        columns_str = ', '.join(f'"{col}"' for col in columns)
-        placeholders = ', '.join(['%s'] * len(columns))
-        insert_query = f'INSERT INTO employee_records_for_IT_use ({columns_str}) VALUES ({placeholders})'
-
-        for row_num, row in enumerate(rows, start=2):  # start=2 表示從第二行開始（第一行是標題）
+        for name in job_names:
+            metrics = new_metrics(jobs[name], settings)
             try:
-                # Match each row with corresponding columns
-                record = []
-                for col in columns:
-                    if col in header:
-                        value = row[header.index(col)].strip()
-                        # 如果欄位是空的，替換為 'NA'
-                        if not value:
-                            value = "NA"
-                    else:
-                        value = "NA"
-                    record.append(value)
-                
-                # 清理並解析日期欄位
-                record[4] = parse_date(record[4])  # Reporting_date
-                record[5] = parse_date(record[5])  # Resigned_date
-
-                # 如果日期是 'NA'，將其替換為 None（對應 SQL 中的 NULL）
-                record[4] = None if record[4] == 'NA' else datetime.strptime(record[4], '%Y-%m-%d').date()
-                record[5] = None if record[5] == 'NA' else datetime.strptime(record[5], '%Y-%m-%d').date()
-
-                cursor.execute(insert_query, record)
-            except psycopg2.IntegrityError:
-                conn.rollback()  # 跳過重複
-                print(f"跳過重複的 '10_Number' 在第 {row_num} 行: {record[6]}")
-            except psycopg2.DataError as e:
-                conn.rollback()  # 跳過無效資料
-                print(f"跳過無效的資料在第 {row_num} 行: {record}, 錯誤: {e}")
-            except Exception as e:
-                conn.rollback()
-                print(f"處理第 {row_num} 行時發生未預期的錯誤: {record}, 錯誤: {e}")
-            else:
-                conn.commit()
-
-        print("資料已成功上傳至 PostgreSQL 資料庫")
-
-    except gspread.SpreadsheetNotFound:
-        print("找不到指定的 Google Sheets 文件。請確保文件名稱正確。")
-    except gspread.WorksheetNotFound:
-        print("找不到指定的分頁。請確保分頁名稱正確。")
-    except psycopg2.Error as e:
-        print(f"發生 PostgreSQL 錯誤: {e}")
-        if 'conn' in locals():
-            conn.rollback()
-    except Exception as e:
-        print(f"發生未預期的錯誤: {e}")
-        if 'conn' in locals():
-            conn.rollback()
+                results[name] = step(jobs[name], settings, metrics)
+            finally:
+                summaries[name] = report_metrics(metrics, settings)
     finally:
-        # 關閉連接
-        if 'cursor' in locals():
-            cursor.close()
-        if 'conn' in locals():
-            conn.close()
+        if settings['HR_METRICS']:
+            get_current_context()['ti'].xcom_push(key='metrics', value=summaries)
+    return results
+
+
+# 下載試算表並存成本地快照，回傳 {工作名稱: 快照路徑}；試算表未變動的工作為 None
+def extract_hr_jobs(job_names):
+    from hr_jobs import extract_job
+
+    return run_with_metrics(job_names, lambda job, settings, metrics: extract_job(job, settings, metrics=metrics))
+
+
+# 正規化快照中的資料，另存一個快照
+def transform_hr_jobs(snapshots):
+    from hr_jobs import transform_job
+
+    results = run_with_metrics(
+        [name for name, path in snapshots.items() if path],
+        lambda job, settings, metrics: transform_job(job, snapshots[job.name], settings, metrics)
+    )
+    return {name: results.get(name) for name in snapshots}
+
+
+# 定義 "hr_gsheet2db" 小程式：把正規化後的快照寫入資料庫，同一個目標表的工作依序執行
+def hr_gsheet2db(snapshots):
+    from hr_jobs import load_job
+
+    run_with_metrics(
+        [name for name, path in snapshots.items() if path],
+        lambda job, settings, metrics: load_job(job, snapshots[job.name], settings, metrics)
+    )
 
 # 設置 DAG 的預設參數
 default_args = {
@@ -187,9 +88,19 @@ with DAG(
     catchup=False                        # 不執行過去的未執行任務
 ) as dag:
 
-    # 定義 PythonOperator 任務來執行 "hr_gsheet2db"
-    hr_gsheet2db_task = PythonOperator(
-        task_id='import_hr_gsheet2db',     # 任務的唯一 ID
-        python_callable=hr_gsheet2db      # 指定要執行的 Python 函數
+    # 列出要同步的目標表
+    list_hr_jobs_task = PythonOperator(
+        task_id='list_hr_jobs',
+        python_callable=list_hr_jobs
     )
 
+    # 每個目標表各一組 extract → transform → load（mapped task group），
+    # 組內依序執行、各組之間互不等待，一個慢的分頁不會卡住其他分頁
+    @task_group(group_id='hr_sheet_sync')
+    def hr_sheet_sync(job_names):
+        extract = task(task_id='extract_hr_gsheet', max_active_tis_per_dag=HR_MAX_PARALLEL_JOBS)(extract_hr_jobs)
+        transform = task(task_id='transform_hr_gsheet', max_active_tis_per_dag=HR_MAX_PARALLEL_JOBS)(transform_hr_jobs)
+        load = task(task_id='import_hr_gsheet2db', max_active_tis_per_dag=HR_MAX_PARALLEL_JOBS)(hr_gsheet2db)
+        load(transform(extract(job_names)))
+
+    hr_sheet_sync.expand(job_names=list_hr_jobs_task.output)
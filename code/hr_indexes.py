@@ -0,0 +1,137 @@
+"""
+目標表的索引在大量寫入時不存在，寫完才一次建立，建立後立即 ANALYZE，查詢規劃器馬上有新的統計資料：
+- swap    ：在影子表上建立（讀取端看不到影子表，不必 CONCURRENTLY），ANALYZE 後才換表
+- recreate：表已對讀取端公開，以 CREATE INDEX CONCURRENTLY 建立，不擋讀寫
+- merge   ：只有第一次建表時是大量寫入；之後每次同步只補建缺少的索引（CONCURRENTLY）並 ANALYZE
+
+UNIQUE 索引不包含表示沒有值的寫法（hr_pipeline.BLANK_VALUES 與工作的 empty_value），由 blanks 傳入。
+索引名稱固定為 <表名>_<欄位>_idx（小寫，超過 63 個字元時截斷並加上雜湊），表改名時索引一併改名，
+換表、保留的舊表與回滾後名稱都不會衝突。索引的定義在 hr_schema.Index。
+"""
+import hashlib
+import time
+
+import psycopg2
+
+from hr_pipeline import BLANK_VALUES
+
+# PostgreSQL 識別字的長度上限（NAMEDATALEN - 1）
+INDEX_NAME_MAX = 63
+
+
+def index_name(table, columns):
+    name = f"{table}_{'_'.join(columns)}_idx".lower()
+    if len(name) <= INDEX_NAME_MAX:
+        return name
+    # 太長時 PostgreSQL 會自行截斷，不同的表可能截成同一個名稱；改為截斷後加上雜湊
+    digest = hashlib.md5(name.encode('utf-8')).hexdigest()[:8]
+    return f"{name[:INDEX_NAME_MAX - 9]}_{digest}"
+
+
+def index_columns_query(table):
+    """table 上（主鍵以外）每個索引的名稱與欄位；以字串代入表名，psycopg2 與 asyncpg 都能直接執行。"""
+    return f"""
+        SELECT i.relname, array_agg(a.attname ORDER BY k.ord)
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        CROSS JOIN LATERAL unnest(x.indkey::int2[]) WITH ORDINALITY AS k(attnum, ord)
+        JOIN pg_attribute a ON a.attrelid = x.indrelid AND a.attnum = k.attnum
+        WHERE x.indrelid = '{table.lower()}'::regclass AND NOT x.indisprimary
+        GROUP BY i.relname
+    """
+
+
+def rename_index_queries(table, indexes):
+    """indexes 為 index_columns_query 的結果；回傳把每個索引改為 table 的名稱的 ALTER INDEX。"""
+    current = {name for name, _ in indexes}
+    queries = []
+    for name, columns in sorted(indexes):
+        new_name = index_name(table, columns)
+        # 同一組欄位有兩個索引時只改第一個，另一個維持原名
+        if new_name not in current:
+            queries.append(f'ALTER INDEX {name} RENAME TO {new_name}')
+            current.add(new_name)
+    return queries
+
+
+def rename_indexes(cursor, table):
+    """表改名後呼叫：索引名稱改為跟著新的表名。"""
+    cursor.execute(index_columns_query(table))
+    for query in rename_index_queries(table, cursor.fetchall()):
+        cursor.execute(query)
+
+
+# 索引的狀態：沒有結果表示不存在；False 表示上次 CONCURRENTLY 建立失敗留下的無效索引
+INDEX_STATE_QUERY = "SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)"
+
+
+def drop_index_query(name):
+    """刪除無效或建立失敗的索引；失敗的 CONCURRENTLY 會留下無效的索引，不刪掉下次會被當成已存在。"""
+    return f'DROP INDEX CONCURRENTLY IF EXISTS {name}'
+
+
+def _index_state(cursor, name):
+    """None 表示不存在；False 表示上次 CONCURRENTLY 建立失敗留下的無效索引。"""
+    cursor.execute(INDEX_STATE_QUERY, (name,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _build_concurrently(conn, table, index, blanks):
+    name = index.name(table)
+    conn.commit()
+    conn.autocommit = True  # CREATE INDEX CONCURRENTLY 不能在交易中執行
+    try:
+        with conn.cursor() as cursor:
+            state = _index_state(cursor, name)
+            if state:
+                return False
+            if state is False:
+                cursor.execute(drop_index_query(name))
+            try:
+                cursor.execute(index.create_query(table, concurrently=True, blanks=blanks))
+            except psycopg2.Error:
+                cursor.execute(drop_index_query(name))
+                raise
+        return True
+    finally:
+        conn.autocommit = False
+
+
+def build_indexes(conn, table, indexes, concurrently=False, blanks=BLANK_VALUES):
+    """建立 table 上缺少的索引，回傳建立了哪些索引的名稱；concurrently 為 False 時在一個交易中建立並 commit。"""
+    built = []
+    if concurrently:
+        for index in indexes:
+            if _build_concurrently(conn, table, index, blanks):
+                built.append(index.name(table))
+        return built
+
+    with conn.cursor() as cursor:
+        for index in indexes:
+            if _index_state(cursor, index.name(table)) is None:
+                cursor.execute(index.create_query(table, blanks=blanks))
+                built.append(index.name(table))
+    conn.commit()
+    return built
+
+
+def analyze_table(conn, table):
+    with conn.cursor() as cursor:
+        cursor.execute(f'ANALYZE {table}')
+    conn.commit()
+
+
+def bulk_load_message(table, built, concurrently, elapsed):
+    if built:
+        return (f"已建立索引 {', '.join(built)}{'（CONCURRENTLY）' if concurrently else ''}並 ANALYZE {table}，"
+                f"{elapsed:.1f} 秒")
+    return f"已 ANALYZE {table}，{elapsed:.1f} 秒"
+
+
+def finish_bulk_load(conn, table, indexes, concurrently=False, log=print, blanks=BLANK_VALUES):
+    """寫入完成後建立索引並 ANALYZE。"""
+    start = time.perf_counter()
+    built = build_indexes(conn, table, indexes, concurrently, blanks)
+    analyze_table(conn, table)
+    log(bulk_load_message(table, built, concurrently, time.perf_counter() - start))
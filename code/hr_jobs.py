@@ -0,0 +1,552 @@
+"""
+多個試算表 / 分頁的同步工作，由 hr_jobs.json 設定：每個工作指定試算表（ID 或名稱）、分頁、
+目標表與 hr_schema 中的欄位定義，以及寫入方式：
+- "swap"     : 寫入影子表後一次換上（原 hr_gsheet2db_dag 的做法）
+- "recreate" : 舊的 DROP TABLE + 重建
+- "merge"    : 依 key 增量合併，刪除已從試算表消失的 key（原 hr_merge2gsheet 的做法）
+
+每個工作分成 extract（下載並存成本地快照）→ transform（正規化，另存快照）→ load（寫入資料庫）三步，
+DAG 中各自是一個任務，load 失敗重試時不必重新下載。
+每個步驟的時間、行數、請求、陳述式與拒絕原因記在 hr_metrics.RunMetrics，結束時以 report_metrics() 輸出。
+
+run_jobs() 同時執行多個工作：同一個目標表的工作依序在同一個 worker 中執行，
+不同目標表之間最多 max_parallel 個同時進行，一個慢的分頁不會卡住其他分頁。
+執行：python hr_jobs.py [工作名稱 ...]
+"""
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+
+from dotenv import load_dotenv
+
+from hr_bulk_load import MERGE_STAGE, TableWriter, build_merge_query, delete_missing_keys, merge_records
+from hr_columnar import transform_stage
+from hr_connections import (CREDENTIALS_FILE, DRIVE_API_URL, SHEETS_API_URL, db_connection, direct_connection,
+                            open_spreadsheet, sheets_client)
+from hr_date_parser import DateNormalizer
+from hr_dedup import DEDUP_POLICIES, KeyDeduplicator, active_test, dedup_stage
+from hr_indexes import finish_bulk_load
+from hr_metrics import NULL_METRICS, RunMetrics, connection_factory
+from hr_parallel_load import ShardedTableWriter
+from hr_pipeline import (SOURCE_BATCH_SIZE, blank_values, clean_header, clean_text, map_records, map_rows, run_pipeline,
+                         sheet_rows)
+from hr_rejects import REJECTS_DIR, RejectSink, reject_targets
+from hr_schema import get_schema
+from hr_sheet_fetch import FetchPlan, find_last_data_row
+from hr_sheet_scheduler import default_scheduler
+from hr_sheet_revision import DriveRevisionSource, check_unchanged
+from hr_snapshot import evict_snapshots, read_manifest, read_snapshot, snapshot_path, write_snapshot
+from hr_sync_state import (SYNC_MODES, ChangeTracker, clear_checkpoint, create_state_tables, delete_row_hashes,
+                           fingerprint, load_row_hashes, resume_point, save_checkpoint, save_revision,
+                           save_row_hashes)
+from hr_table_swap import create_shadow_table, recreate_table_queries, swap_in_shadow, table_exists
+from hr_validation import SchemaValidator, validation_stage
+
+JOBS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'hr_jobs.json')
+
+# 同時執行的工作（目標表）數上限；連線池每組參數最多 4 條連線，不要超過
+MAX_PARALLEL_JOBS = 3
+
+JOB_STRATEGIES = ("swap", "recreate", "merge")
+
+# 沒有指定 dedup 時的去重策略：merge 與 ON CONFLICT 依序覆寫相同，整表重建與 UNIQUE 索引相同
+DEFAULT_DEDUP_POLICY = {"swap": "first-wins", "recreate": "first-wins", "merge": "last-wins"}
+
+
+class SheetJob:
+    """
+    一個同步工作。name 同時是 hr_sync_state 中的同步名稱（版本與每行雜湊都以它區分）。
+    empty_value 不是 None 時，文字欄位去除空白並把空值換成 empty_value；DATE 欄位一律解析為 date。
+    blank_values 為表示沒有值的寫法（空字串與 empty_value），key 與 UNIQUE 索引中不算重複。
+    dedup 為同一次執行中 key 重複時的處理方式（hr_dedup.DEDUP_POLICIES），預設依 strategy。
+    """
+
+    def __init__(self, name, worksheet, schema, table=None, spreadsheet_id=None, spreadsheet_name=None,
+                 strategy="swap", empty_value=None, batch_size=SOURCE_BATCH_SIZE, sync_mode="incremental",
+                 skip_if_unchanged=True, dedup=None):
+        if (spreadsheet_id is None) == (spreadsheet_name is None):
+            raise ValueError(f"工作 {name} 必須指定 spreadsheet_id 或 spreadsheet_name 其中一個")
+        if strategy not in JOB_STRATEGIES:
+            raise ValueError(f"工作 {name} 的寫入方式未知: {strategy}（可用: {', '.join(JOB_STRATEGIES)}）")
+        if sync_mode not in SYNC_MODES:
+            raise ValueError(f"工作 {name} 的同步模式未知: {sync_mode}（可用: {', '.join(SYNC_MODES)}）")
+        self.name = name
+        self.worksheet = worksheet
+        self.schema = get_schema(schema)
+        self.table = table or self.schema.table
+        self.spreadsheet_id = spreadsheet_id
+        self.spreadsheet_name = spreadsheet_name
+        self.strategy = strategy
+        self.empty_value = empty_value
+        self.blank_values = blank_values(empty_value)
+        self.batch_size = batch_size
+        self.sync_mode = sync_mode
+        self.skip_if_unchanged = skip_if_unchanged
+        if strategy == "merge" and self.schema.key is None:
+            raise ValueError(f"工作 {name} 使用 merge，但 {schema} 沒有 key 欄位")
+        self.dedup = dedup or DEFAULT_DEDUP_POLICY[strategy]
+        if self.dedup not in DEDUP_POLICIES:
+            raise ValueError(f"工作 {name} 的去重策略未知: {self.dedup}（可用: {', '.join(DEDUP_POLICIES)}）")
+        if self.dedup == "prefer-active" and active_test(self.schema) is None:
+            raise ValueError(f"工作 {name} 使用 prefer-active，但 {schema} 沒有 active 或 resigned_date 欄位")
+
+    def log(self, message):
+        # 多個工作同時執行時，以工作名稱區分輸出
+        print(f"[{self.name}] {message}")
+
+
+def load_jobs(path=JOBS_FILE):
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+    jobs = [SheetJob(**job) for job in config['jobs']]
+    names = [job.name for job in jobs]
+    duplicated = {name for name in names if names.count(name) > 1}
+    if duplicated:
+        raise ValueError(f"工作名稱重複: {', '.join(sorted(duplicated))}")
+    return jobs
+
+
+def group_by_table(jobs):
+    """依目標表分組（保留原本順序）；同一組的工作必須依序執行。"""
+    groups = {}
+    for job in jobs:
+        groups.setdefault(job.table, []).append(job)
+    return list(groups.values())
+
+
+def load_settings():
+    """加載 .env 文件中的環境變數並讀取所有工作共用的設定。"""
+    load_dotenv()
+
+    return {
+        # DB 資訊
+        'POSTGRES_SERVER': os.getenv('N_POSTGRES_SERVER'),
+        'POSTGRES_DB': os.getenv('N_POSTGRES_DB'),
+        'POSTGRES_USER': os.getenv('N_POSTGRES_USER'),
+        'POSTGRES_PASSWORD': os.getenv('N_POSTGRES_PASSWORD'),
+        'POSTGRES_PORT': os.getenv('N_POSTGRES_PORT'),
+
+        # Google 服務帳號金鑰
+        'CREDENTIALS_FILE': os.getenv('N_HR_CREDENTIALS_FILE', CREDENTIALS_FILE),
+
+        # 寫入模式："copy" 以 COPY 批次寫入並只 commit 一次；"row" 為舊的逐行 INSERT（比較用）
+        'HR_LOAD_MODE': os.getenv('N_HR_LOAD_MODE', 'copy'),
+
+        # swap / recreate 以 "copy" 寫入時使用的平行連線數；大於 1 時依 key 的雜湊分片，各自 COPY 後一次合併
+        'HR_LOAD_WORKERS': int(os.getenv('N_HR_LOAD_WORKERS', '1')),
+
+        # 轉換模式："columnar" 每欄只正規化不重複的值；"row" 逐行逐格轉換（比較用）
+        'HR_TRANSFORM_MODE': os.getenv('N_HR_TRANSFORM_MODE', 'columnar'),
+
+        # 換表後保留幾份舊表，方便回滾
+        'HR_KEEP_OLD_COPIES': int(os.getenv('N_HR_KEEP_OLD_COPIES', '2')),
+
+        # 試算表自上次成功同步後沒有變動時，直接結束不抓資料
+        'HR_SKIP_IF_UNCHANGED': os.getenv('N_HR_SKIP_IF_UNCHANGED', 'true').lower() == 'true',
+
+        # 其他 psycopg2.connect 參數（例如 connect_timeout、connection_factory），不由環境變數設定
+        'POSTGRES_OPTIONS': {},
+
+        # 量測每個步驟的時間與行數；停用時幾乎沒有額外成本
+        'HR_METRICS': os.getenv('N_HR_METRICS', 'true').lower() == 'true',
+
+        # 另外匯出量測結果：StatsD 的 host:port，以及 Prometheus textfile collector 的目錄（未設定則不匯出）
+        'HR_STATSD_ADDRESS': os.getenv('N_HR_STATSD_ADDRESS'),
+        'HR_PROMETHEUS_DIR': os.getenv('N_HR_PROMETHEUS_DIR'),
+
+        # 被拒絕的行寫到哪裡："file"（gzip JSONL）、"table"（<目標表>_rejects），可用逗號同時指定，或 "off"
+        'HR_REJECTS': os.getenv('N_HR_REJECTS', 'file'),
+        'HR_REJECTS_DIR': os.getenv('N_HR_REJECTS_DIR', REJECTS_DIR),
+
+        # hr_async_sync 使用的 Sheets / Drive API 位址
+        'HR_SHEETS_API_URL': os.getenv('N_HR_SHEETS_API_URL', SHEETS_API_URL),
+        'HR_DRIVE_API_URL': os.getenv('N_HR_DRIVE_API_URL', DRIVE_API_URL),
+    }
+
+
+def column_transforms(job):
+    """依欄位型別產生 transform_stage 用的 {欄位序號: fn}；每個 DATE 欄位各自學習主要格式。"""
+    column_fns = {}
+    for i, column in enumerate(job.schema.columns):
+        if column.sql_type == 'DATE':
+            column_fns[i] = DateNormalizer()
+        elif job.empty_value is not None:
+            column_fns[i] = partial(clean_text, empty=job.empty_value)
+    return column_fns
+
+
+def new_metrics(job, settings):
+    return RunMetrics(job.name) if settings.get('HR_METRICS') else NULL_METRICS
+
+
+def report_metrics(metrics, settings):
+    """輸出 JSON log，並依設定送到 StatsD / 寫入 Prometheus 檔案，回傳給 XCom 的摘要。"""
+    if not metrics.enabled:
+        return {}
+    metrics.log()
+    if settings.get('HR_STATSD_ADDRESS'):
+        metrics.send_statsd(settings['HR_STATSD_ADDRESS'])
+    if settings.get('HR_PROMETHEUS_DIR'):
+        metrics.write_prometheus(settings['HR_PROMETHEUS_DIR'])
+    return metrics.summary()
+
+
+def open_rejects(job, settings):
+    """這次執行的拒絕紀錄；"table" 另外借連線寫入，不在載入的交易中。"""
+    targets = reject_targets(settings['HR_REJECTS'], job.name, job.table, connect=lambda: _db_connection(settings),
+                             directory=settings['HR_REJECTS_DIR'])
+    return RejectSink(job.name, job.schema.names, job.schema.key, targets, log=job.log)
+
+
+def _db_params(settings, metrics=NULL_METRICS):
+    options = dict(settings.get('POSTGRES_OPTIONS', {}))
+    if metrics.enabled:
+        # 計算陳述式與 commit 的連線類別；呼叫端已指定 connection_factory 時以呼叫端為準
+        options.setdefault('connection_factory', connection_factory())
+    return dict(
+        host=settings['POSTGRES_SERVER'],
+        port=settings['POSTGRES_PORT'],
+        dbname=settings['POSTGRES_DB'],
+        user=settings['POSTGRES_USER'],
+        password=settings['POSTGRES_PASSWORD'],
+        **options
+    )
+
+
+def _db_connection(settings, metrics=NULL_METRICS):
+    return db_connection(**_db_params(settings, metrics))
+
+
+@contextmanager
+def _worker_connection(settings, metrics=NULL_METRICS, stage=None):
+    """平行載入的每個工作執行緒一條不經過連線池的連線，陳述式與 commit 記到同一個步驟。"""
+    with direct_connection(**_db_params(settings, metrics)) as conn, metrics.bind(conn, stage):
+        yield conn
+
+
+def _sheet_records(sheet, job, header, metrics=NULL_METRICS, stage=None):
+    """依 schema 的欄位順序串流讀出工作表資料（尚未正規化）。"""
+    schema = job.schema
+    stage = stage or metrics.stage('extract')
+    if job.strategy != "merge":
+        def fetch(start, end):
+            return sheet.get(f"{start}:{end}")
+        return map_rows(schema.row_mapper(header, missing_column=job.empty_value))(
+            sheet_rows(sheet, batch_size=job.batch_size, fetch=metrics.count_fetch(stage, fetch)))
+
+    positions = schema.positions(header)
+    missing = [name for name, p in zip(schema.names, positions) if p is None]
+    if missing:
+        raise ValueError(f"工作表中找不到欄位: {', '.join(missing)}")
+
+    # 只抓目標表需要的欄位；row_count 是格線大小，改以 key 欄最後一個非空白儲存格作為實際資料行數
+    plan = FetchPlan(header, schema.fetch_columns())
+    total_rows = default_scheduler().call(find_last_data_row, sheet, plan.positions[schema.index_of(schema.key)])
+    job.log(f"總行數: {total_rows}，抓取範圍: {', '.join(plan.ranges(2, total_rows))}")
+    return sheet_rows(sheet, last_row=total_rows, batch_size=job.batch_size,
+                      fetch=metrics.count_fetch(stage, lambda start, end: plan.fetch(sheet, start, end)))
+
+
+def extract_job(job, settings=None, client=None, metrics=NULL_METRICS):
+    """
+    下載工作表並存成本地快照，回傳快照路徑；試算表自上次成功同步後未變動時回傳 None。
+    本次讀到的試算表版本記在快照的 manifest 中，load 成功後才寫入狀態表。
+    client 預設以 CREDENTIALS_FILE 認證的 gspread client。
+    """
+    settings = settings or load_settings()
+    with metrics.timed('extract') as stage:
+        client = client or sheets_client(settings['CREDENTIALS_FILE'])
+        spreadsheet = open_spreadsheet(client, name=job.spreadsheet_name, key=job.spreadsheet_id)
+        sheet = spreadsheet.worksheet(job.worksheet)
+
+        # 讀版本要在抓資料之前，抓取期間的修改才會在下次執行時被偵測到
+        with _db_connection(settings, metrics) as conn, metrics.bind(conn, stage):
+            create_state_tables(conn)
+            unchanged, revision = check_unchanged(conn, job.name, DriveRevisionSource(spreadsheet))
+        if job.skip_if_unchanged and settings['HR_SKIP_IF_UNCHANGED'] and unchanged:
+            job.log(f"試算表自上次同步後未變動（版本 {revision}），略過本次同步")
+            return None
+
+        # 只讀標題列，資料本體由管線分批串流讀取
+        header = default_scheduler().call(sheet.row_values, 1)
+        if not header:
+            raise ValueError(f"{job.worksheet} 中沒有數據")
+        header = clean_header(header)
+
+        evict_snapshots(job.name)
+        path = snapshot_path(job.name, 'extract')
+        manifest = write_snapshot(path, _sheet_records(sheet, job, header, metrics, stage),
+                                  job=job.name, stage='extract', revision=revision, columns=job.schema.names)
+        stage.add(rows_out=manifest['rows'])
+    job.log(f"已下載 {manifest['rows']} 行至 {path}")
+    return path
+
+
+def transform_job(job, path, settings=None, metrics=NULL_METRICS):
+    """讀取 extract 的快照，依欄位型別正規化後存成新的快照，回傳路徑。"""
+    settings = settings or load_settings()
+    with metrics.timed('transform') as stage:
+        manifest = read_manifest(path)
+        out = snapshot_path(job.name, 'transform')
+        transform = transform_stage(column_transforms(job), mode=settings['HR_TRANSFORM_MODE'])
+        written = write_snapshot(out, transform(read_snapshot(path)), job=job.name, stage='transform',
+                                 revision=manifest['revision'], columns=manifest['columns'])
+        stage.add(rows_in=manifest['rows'], rows_out=written['rows'])
+    job.log(f"已正規化 {manifest['rows']} 行至 {out}")
+    return out
+
+
+def new_deduplicator(job, stage, rejects):
+    """key 重複的行交給拒絕紀錄；沒有 key 欄位的表不去重，回傳 None。merge 以 ON CONFLICT 依序覆寫。"""
+    if job.schema.key is None:
+        return None
+
+    def report_duplicate(row_num, record, error):
+        stage.reject(error)
+        rejects.add(row_num, record, error)
+    return KeyDeduplicator(job.schema, job.dedup, report_duplicate, job.blank_values, upsert=job.strategy == "merge")
+
+
+def new_validator(job, dedup=None):
+    """寫入前的檢查；有 dedup 時 key 的 UNIQUE 索引交給它依 job.dedup 處理。"""
+    return SchemaValidator(job.schema, job.table, job.blank_values, dedup_key=dedup and dedup.key)
+
+
+def check_stages(validator, on_reject, dedup=None):
+    """先檢查再去重：檢查不過的行不參與去重，同一個 key 其他檢查通過的行仍可勝出。"""
+    stages = [validation_stage(validator, on_reject)]
+    if dedup is not None:
+        stages.append(dedup_stage(dedup))
+    return stages
+
+
+def checkpoint_row(chunk, dedup=None):
+    """merge 的一批 commit 後可以記為進度的行號；dedup 暫存中的行比這批更早時退到那一行之前。"""
+    row_num = max(row_num for row_num, _ in chunk)
+    return row_num if dedup is None else dedup.checkpoint(row_num)
+
+
+def merge_stages(job, tracker, stage, rejects, dedup=None, resume_after=0):
+    """
+    merge 的管線階段與寫入失敗時的處理，與 hr_async_sync 共用：回傳 (report_reject, 階段)。
+    先檢查再去重，再以 tracker 只留下新增與變動的 key。resume_after 以前的行在上次執行已 commit，只記下 key；
+    檢查不過的 key 仍在試算表中，資料庫中既有的行保留不動。
+    """
+    key_index = job.schema.index_of(job.schema.key)
+
+    def report_reject(row_num, record, error):
+        tracker.discard(record[key_index])
+        stage.reject(error)
+        rejects.add(row_num, record, error)
+
+    def reject_invalid(row_num, record, error):
+        # 檢查在判斷變動之前，要先記下 key；續傳前的行之前已經回報過
+        tracker.mark_seen([record[key_index]])
+        if row_num > resume_after:
+            report_reject(row_num, record, error)
+
+    def select_changed(row_num, row):
+        # 沒有 key 的行略過
+        if not row[key_index]:
+            return None
+        if row_num <= resume_after:
+            tracker.mark_seen([row[key_index]])
+            return None
+        kind = tracker.classify(row[key_index], fingerprint([row]))
+        if job.sync_mode == "full" or kind != 'unchanged':
+            return row
+        return None
+
+    return report_reject, check_stages(new_validator(job, dedup), reject_invalid, dedup) + [map_records(select_changed)]
+
+
+def merge_summary(job, tracker, deleted):
+    counts = tracker.counts
+    return (f"新增: {counts['insert']}，變動: {counts['update']}，"
+            f"未變動而略過: {counts['unchanged'] if job.sync_mode == 'incremental' else 0}，刪除: {deleted}")
+
+
+def _replace_table(conn, job, records, settings, metrics=NULL_METRICS, stage=None, rejects=None, dedup=None):
+    """
+    swap / recreate：整張表以試算表目前的內容重建；索引在寫入完成後才建立。
+    dedup 為 new_deduplicator 的 KeyDeduplicator，在檢查之後去重（不是 streaming 的策略要已 scan 過 key 欄）。
+    """
+    schema = job.schema
+    stage = stage or metrics.stage('load')
+    rejects = rejects or RejectSink(job.name, schema.names, schema.key, log=job.log)
+    create_table_query = schema.create_table_query()
+
+    if job.strategy == "swap":
+        # 新資料寫入影子表，正式表在換表前維持原樣
+        target = create_shadow_table(conn, job.table, create_table_query)
+        job.log(f"已建立影子表 {target}")
+    else:
+        with conn.cursor() as cursor:
+            for query in recreate_table_queries(job.table, create_table_query):
+                cursor.execute(query)
+        conn.commit()
+        target = job.table
+        job.log(f"表格 {job.table} 已重新創建")
+
+    def report_reject(row_num, record, error):
+        stage.reject(error)
+        rejects.add(row_num, record, error)
+
+    mode = settings['HR_LOAD_MODE']
+    workers = settings.get('HR_LOAD_WORKERS', 1)
+    if mode == "copy" and workers > 1:
+        # 依 key 的雜湊分到 workers 條連線各自 COPY，最後在 conn 的一個交易中合併進 target
+        writer = ShardedTableWriter(conn, lambda: _worker_connection(settings, metrics, stage), target, schema.names,
+                                    schema.index_of(schema.key) if schema.key else None, workers,
+                                    on_reject=report_reject)
+        mode = f"copy x{workers}"
+    else:
+        writer = TableWriter(conn, target, schema.names, mode=mode, on_reject=report_reject)
+    # 不符合欄位型別、長度的行在 Python 中先擋下，不會送到資料庫
+    precheck_rejected = 0
+
+    def reject_before_load(row_num, record, error):
+        nonlocal precheck_rejected
+        precheck_rejected += 1
+        report_reject(row_num, record, error)
+
+    try:
+        run_pipeline(records, check_stages(new_validator(job, dedup), reject_before_load, dedup),
+                     metrics.count_sink(stage, writer.write))
+        loaded, rejected = writer.finish()
+    except Exception:
+        writer.abort()
+        raise
+    rejected += precheck_rejected
+    job.log(f"寫入 {loaded} 行，跳過 {rejected} 行（模式: {mode}）")
+
+    # 影子表還沒有人讀，直接建立索引；recreate 的表已公開，以 CONCURRENTLY 建立不擋讀寫
+    finish_bulk_load(conn, target, schema.indexes, concurrently=job.strategy != "swap", log=job.log,
+                     blanks=job.blank_values)
+
+    if job.strategy == "swap":
+        swap_in_shadow(conn, job.table, keep=settings['HR_KEEP_OLD_COPIES'])
+        job.log(f"已將 {target} 換為 {job.table}")
+
+
+def _merge_table(conn, job, records, settings, metrics=NULL_METRICS, stage=None, rejects=None, revision=None,
+                 dedup=None):
+    """
+    merge：只送出新增與變動的 key，再刪除已從試算表消失的 key。
+    給了 revision 時每批 commit 一併記錄進度；同一版本的快照重試時，已 commit 的行只記下 key 不再寫入。
+    第一次建表時整張表都是新增，索引等寫完才建立；之後只補建缺少的索引。
+    dedup 與 _replace_table 相同；檢查不過的 key 與 reject-all 丟掉的 key 仍在試算表中，不會被當成已刪除。
+    """
+    schema = job.schema
+    stage = stage or metrics.stage('load')
+    rejects = rejects or RejectSink(job.name, schema.names, schema.key, log=job.log)
+    merge_query = build_merge_query(job.table, MERGE_STAGE, schema.names, schema.key)
+    created = not table_exists(conn, job.table)
+    with conn.cursor() as cursor:
+        cursor.execute(schema.create_table_query(job.table, if_not_exists=True))
+    conn.commit()
+
+    # 以上次同步的每行雜湊判斷哪些 key 有變動
+    tracker = ChangeTracker(load_row_hashes(conn, job.name))
+    resume_after = resume_point(conn, job.name, revision) or 0
+    if resume_after:
+        job.log(f"試算表版本 {revision} 上次寫入到第 {resume_after} 行中斷，從下一行繼續")
+    report_reject, stages = merge_stages(job, tracker, stage, rejects, dedup, resume_after)
+
+    def merge_chunk(chunk):
+        merge_records(conn, job.table, schema.names, schema.key, chunk,
+                      on_reject=report_reject, merge_query=merge_query)
+        # 雜湊、進度與資料在同一個交易寫入，中斷時三者一致
+        save_row_hashes(conn, job.name, tracker)
+        if revision is not None:
+            save_checkpoint(conn, job.name, revision, checkpoint_row(chunk, dedup))
+        conn.commit()
+
+    # 每批的進度不再逐批輸出，由 metrics 的 rows_out / commits 與最後的摘要取代
+    run_pipeline(records, stages, metrics.count_sink(stage, merge_chunk), chunk_size=job.batch_size)
+    if dedup is not None:
+        tracker.mark_seen(dedup.rejected_keys())
+
+    # 刪除已從試算表移除的 key
+    deleted = delete_missing_keys(conn, job.table, schema.key, tracker.seen_keys())
+    delete_row_hashes(conn, job.name, tracker.deleted_keys())
+    conn.commit()
+    # 剛建立的表還沒有人讀，不必 CONCURRENTLY
+    finish_bulk_load(conn, job.table, schema.indexes, concurrently=not created, log=job.log, blanks=job.blank_values)
+
+    job.log(merge_summary(job, tracker, deleted))
+
+
+def load_job(job, path, settings=None, metrics=NULL_METRICS):
+    """
+    把 transform 的快照寫入資料庫，成功後記錄快照中的試算表版本。重試時直接重讀同一個快照。
+    job.dedup 不是 streaming 的策略先讀一次快照的 key 欄找出重複的 key，寫入時再讀一次，只寫入勝出的行。
+    """
+    settings = settings or load_settings()
+    with metrics.timed('load') as stage:
+        manifest = read_manifest(path)
+        stage.add(rows_in=manifest['rows'])
+        with _db_connection(settings, metrics) as conn, metrics.bind(conn, stage), \
+                open_rejects(job, settings) as rejects:
+            records = read_snapshot(path)
+            dedup = new_deduplicator(job, stage, rejects)
+            if dedup is not None and not dedup.streaming:
+                dedup.scan((row_num, record[dedup.key_index]) for row_num, record in read_snapshot(path))
+            if job.strategy == "merge":
+                _merge_table(conn, job, records, settings, metrics, stage, rejects, manifest['revision'], dedup)
+            else:
+                _replace_table(conn, job, records, settings, metrics, stage, rejects, dedup)
+            if dedup is not None and dedup.summary():
+                job.log(dedup.summary())
+
+            save_revision(conn, job.name, manifest['revision'])
+            clear_checkpoint(conn, job.name)
+            conn.commit()
+    job.log("資料已成功上傳至 PostgreSQL 資料庫")
+
+
+def run_job(job, settings=None, client=None, metrics=NULL_METRICS):
+    """依序執行 extract → transform → load；每個工作使用自己的 gspread client 與借來的資料庫連線。"""
+    settings = settings or load_settings()
+    path = extract_job(job, settings, client, metrics)
+    if path is not None:
+        load_job(job, transform_job(job, path, settings, metrics), settings, metrics)
+
+
+def run_jobs(jobs, max_parallel=MAX_PARALLEL_JOBS, settings=None):
+    """同時執行多個工作，回傳失敗的 [(工作名稱, 例外), ...]；一個工作失敗不影響其他工作。"""
+    settings = settings or load_settings()
+
+    def run_group(group):
+        failures = []
+        for job in group:
+            metrics = new_metrics(job, settings)
+            try:
+                run_job(job, settings, metrics=metrics)
+            except Exception as e:
+                job.log(f"同步失敗: {e}")
+                failures.append((job.name, e))
+            finally:
+                report_metrics(metrics, settings)
+        return failures
+
+    with ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix='hr-job') as pool:
+        futures = [pool.submit(run_group, group) for group in group_by_table(jobs)]
+        return [failure for future in futures for failure in future.result()]
+
+
+def main():
+    jobs = load_jobs()
+    if len(sys.argv) > 1:
+        jobs = [job for job in jobs if job.name in sys.argv[1:]]
+    failures = run_jobs(jobs)
+    for name, error in failures:
+        print(f"失敗: {name}: {error}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,20 @@
 import os
-import psycopg2
-import gspread
-from datetime import datetime
 from dotenv import load_dotenv
-from oauth2client.service_account import ServiceAccountCredentials
+from hr_bulk_load import delete_missing_keys, merge_records
+from hr_connections import db_connection, open_spreadsheet, sheets_client
+from hr_date_parser import DateNormalizer
+from hr_dedup import KeyDeduplicator, dedup_stage
+from hr_indexes import finish_bulk_load
+from hr_pipeline import map_records, run_pipeline, sheet_rows
+from hr_rejects import RejectSink, reject_targets
+from hr_schema import HR_MERGE
+from hr_sheet_fetch import FetchPlan, find_last_data_row
+from hr_sheet_scheduler import default_scheduler
+from hr_sheet_revision import DriveRevisionSource, check_unchanged
+from hr_sync_state import (ChangeTracker, clear_checkpoint, create_state_tables, delete_row_hashes, fingerprint,
+                           load_row_hashes, resume_point, save_checkpoint, save_revision, save_row_hashes)
+from hr_table_swap import table_exists
+from hr_validation import SchemaValidator, validation_stage
 
 # 加載 .env 文件中的環境變數
 load_dotenv()
@@ -25,132 +36,186 @@ my_Googlesheet_PageName = "Merge"                                   #員工彙
 # 設定 Google Sheets API 認證
 # 機器人 auto-update@pbg-it.iam.gserviceaccount.com
 
-scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-creds = ServiceAccountCredentials.from_json_keyfile_name('cred.json', scope)   #/opt/airflow/dags/hr/cred.json
-client = gspread.authorize(creds)
+# 只在執行時才認證，匯入這個檔案（例如被放進 dags 資料夾而被排程器解析）不會連網；
+# access token 快取在磁碟上，到期前的執行都直接沿用
+def get_client():
+    return sheets_client('cred.json')   #/opt/airflow/dags/hr/cred.json
 
 # 批次處理大小
 BATCH_SIZE = 800
 
+# 預先抓取：同時抓取的執行緒數，以及最多暫存幾批（限制記憶體）
+FETCH_WORKERS = 2
+FETCH_QUEUE_DEPTH = 4
+
+# 同步模式："incremental" 只送出新增、變動與已刪除的員工；"full" 全部重送
+SYNC_MODE = "incremental"
+
+# 試算表自上次成功同步後沒有變動時，直接結束不抓資料
+SKIP_IF_UNCHANGED = True
+
+# 同一個 10_number 出現多次時的處理方式（hr_dedup.DEDUP_POLICIES）；last-wins 與過去 ON CONFLICT 依序覆寫的結果相同，
+# 邊讀邊寫入。prefer-active / reject-all 先讀一次 10_number 欄找出重複的工號，只暫存這些工號的行
+DEDUP_POLICY = "last-wins"
+
+# 被拒絕的行寫到 hr_rejects 的 gzip JSONL，前 20 行仍會印出
+REJECTS_TARGETS = "file"
+
+# hr_merge_for_IT_use 的欄位、型別與在 Merge 工作表中的預設位置都定義在 hr_schema
+MERGE_COLUMNS = HR_MERGE.names
+
+# 各欄位在每行中的位置（依 MERGE_COLUMNS 的順序）
+REPORTING_DATE = HR_MERGE.index_of("reporting_date")
+RESIGNED_DATE = HR_MERGE.index_of("resigned_date")
+KEY = HR_MERGE.index_of(HR_MERGE.key)
+
 # 確認 Google Sheet 的資料
-def check_google_sheet():
-    sheet = client.open_by_key(my_spreadsheet_id).worksheet(my_Googlesheet_PageName)
-    titles = sheet.row_values(1)  # 取得第一行的標題
-    total_rows = sheet.row_count  # 總行數
+def check_google_sheet(spreadsheet):
+    sheet = spreadsheet.worksheet(my_Googlesheet_PageName)
+    # 讀取都經過共用的排程器，遵守讀取配額並處理 429
+    scheduler = default_scheduler()
+    titles = scheduler.call(sheet.row_values, 1)  # 取得第一行的標題
+    plan = FetchPlan(titles, HR_MERGE.fetch_columns())
+    # row_count 是格線大小，改以 10_number 欄最後一個非空白儲存格作為實際資料行數
+    total_rows = scheduler.call(find_last_data_row, sheet, plan.position_of(HR_MERGE.key))
     print(f"標題: {titles}")
-    print(f"總行數: {total_rows}")
-    return total_rows
+    print(f"總行數: {total_rows}（格線 {sheet.row_count} 行）")
+    print(f"抓取範圍: {', '.join(plan.ranges(2, total_rows))}")
+    return plan, total_rows
 
-# 建立資料表
+# 建立資料表；回傳是否為新建（新表的索引等第一次寫完才建立）
 def create_table_if_not_exists(conn):
+    created = not table_exists(conn, HR_MERGE.table)
     with conn.cursor() as cursor:
-        cursor.execute(""" 
-            CREATE TABLE IF NOT EXISTS hr_merge_for_IT_use (
-                div VARCHAR(13),
-                last_name VARCHAR(50),
-                first_name VARCHAR(50),
-                middle_name VARCHAR(13),
-                formal_name VARCHAR(255),
-                department VARCHAR(50),
-                cost_centre VARCHAR(50),
-                reporting_date DATE,
-                resigned_date DATE,
-                "10_number" VARCHAR(10) PRIMARY KEY,
-                type VARCHAR(21),
-                department_code VARCHAR(15),
-                cost_centre_code VARCHAR(16),
-                transfer_record VARCHAR(50),
-                remark VARCHAR(87),
-                card_number VARCHAR(59),
-                adm_remark VARCHAR(94),
-                active VARCHAR(6)
-            );
-        """)
+        cursor.execute(HR_MERGE.create_table_query(HR_MERGE.table, if_not_exists=True))
         conn.commit()
+    return created
 
 # 批量插入或更新資料
-def upsert_data(sheet, total_rows, conn):
-    with conn.cursor() as cursor:
-        for start in range(2, total_rows + 1, BATCH_SIZE):
-            end = min(start + BATCH_SIZE - 1, total_rows)
-            batch_data = sheet.get(f"A{start}:S{end}")
-
-            for idx, row in enumerate(batch_data, start=start):
-                # 檢查每行的資料長度
-                if len(row) < 20:
-                    print(f"行 {idx} 資料不足，長度為 {len(row)}: {row}")
-                    while len(row) < 20:
-                        row.append('')  # 使用空字串補齊
-
-                # 處理空字串的日期欄位
-                reporting_date = row[7] if row[7] else None
-                resigned_date = row[8] if row[8] else None
-
-                # 確保日期格式正確，轉換為 YYYY-MM-DD 格式
-                if reporting_date:
-                    try:
-                        reporting_date = datetime.strptime(reporting_date, '%Y/%m/%d').strftime('%Y-%m-%d')
-                    except ValueError:
-                        reporting_date = None  # 日期格式錯誤時設為 None
-
-                if resigned_date:
-                    try:
-                        resigned_date = datetime.strptime(resigned_date, '%Y/%m/%d').strftime('%Y-%m-%d')
-                    except ValueError:
-                        resigned_date = None  # 日期格式錯誤時設為 None
-
-                # 假設 row[9] 是 "10_number" 欄位
-                if row[9]:  
-                    cursor.execute("""
-                        INSERT INTO hr_merge_for_IT_use (
-                            div, last_name, first_name, middle_name, formal_name, 
-                            department, cost_centre, reporting_date, resigned_date, 
-                            "10_number", type, department_code, cost_centre_code, 
-                            transfer_record, remark, card_number, adm_remark, active
-                        ) 
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                        ON CONFLICT ("10_number") DO UPDATE SET
-                            div = EXCLUDED.div,
-                            last_name = EXCLUDED.last_name,
-                            first_name = EXCLUDED.first_name,
-                            middle_name = EXCLUDED.middle_name,
-                            formal_name = EXCLUDED.formal_name,
-                            department = EXCLUDED.department,
-                            cost_centre = EXCLUDED.cost_centre,
-                            reporting_date = EXCLUDED.reporting_date,
-                            resigned_date = EXCLUDED.resigned_date,
-                            type = EXCLUDED.type,
-                            department_code = EXCLUDED.department_code,
-                            cost_centre_code = EXCLUDED.cost_centre_code,
-                            transfer_record = EXCLUDED.transfer_record,
-                            remark = EXCLUDED.remark,
-                            card_number = EXCLUDED.card_number,
-                            adm_remark = EXCLUDED.adm_remark,
-                            active = EXCLUDED.active
-                    """, (
-                        row[0], row[1], row[2], row[3], row[4], 
-                        row[5], row[6], reporting_date, resigned_date, 
-                        row[9], row[10], row[11], row[12], 
-                        row[13], row[14], row[15], row[16], row[19]
-                    ))
-
-            conn.commit()
-            print(f"已處理行數: {end - start + 1}")
+# 每批 commit 時一併記錄已處理到第幾行與試算表版本（revision）；中斷後以同一版本重新執行時，
+# 從上次 commit 的下一行繼續，之前的行只讀 10_number 一欄用來判斷刪除。版本不同則從頭開始
+def upsert_data(sheet, plan, total_rows, conn, sync_mode=SYNC_MODE, revision=None):
+    table = HR_MERGE.table
+
+    # 合併語句整次執行只產生一次
+    merge_query = HR_MERGE.merge_query()
+
+    # 日期直接轉為 date，不再轉成字串讓 PostgreSQL 再解析一次
+    parse_reporting_date = DateNormalizer()
+    parse_resigned_date = DateNormalizer()
+
+    # 以上次同步的每行雜湊判斷哪些員工有變動（中斷前已 commit 的批次，新雜湊也已寫入）
+    tracker = ChangeTracker(load_row_hashes(conn, table))
+
+    rejects = RejectSink(table, MERGE_COLUMNS, HR_MERGE.key, reject_targets(REJECTS_TARGETS, table))
+
+    # 重複的 10_number 只留下勝出的一行；續傳時只比對本次讀到的行
+    dedup = KeyDeduplicator(HR_MERGE, DEDUP_POLICY, rejects.add, upsert=True)
+
+    first_row = 2
+    resumed = resume_point(conn, table, revision)
+    keys = None
+    if (resumed is not None and resumed < total_rows) or not dedup.streaming:
+        keys = default_scheduler().call(sheet.col_values, plan.position_of(HR_MERGE.key) + 1)
+    if resumed is not None and resumed < total_rows:
+        tracker.mark_seen(keys[1:resumed])
+        first_row = resumed + 1
+        print(f"試算表版本 {revision} 上次同步到第 {resumed} 行中斷，從第 {first_row} 行繼續")
+    if not dedup.streaming:
+        dedup.scan(enumerate(keys[first_row - 1:total_rows], start=first_row))
+
+    def report_reject(row_num, record, error):
+        tracker.discard(record[KEY])
+        rejects.add(row_num, record, error)
+
+    def reject_invalid(row_num, record, error):
+        # 檢查在判斷變動之前：這個員工仍在試算表中，資料庫中既有的行保留不動
+        tracker.mark_seen([record[KEY]])
+        report_reject(row_num, record, error)
+
+    def fetch(start, end):
+        # 只抓目標表需要的欄位，每行依 MERGE_COLUMNS 的順序排列
+        return plan.fetch(sheet, start, end)
+
+    def parse_dates(row_num, row):
+        # 解析日期欄位，空字串或格式錯誤時設為 None
+        row[REPORTING_DATE] = parse_reporting_date(row[REPORTING_DATE])
+        row[RESIGNED_DATE] = parse_resigned_date(row[RESIGNED_DATE])
+        return row
+
+    def select_changed(row_num, row):
+        # 沒有工號（10_number）的行略過
+        if not row[KEY]:
+            return None
+        kind = tracker.classify(row[KEY], fingerprint([row]))
+        if sync_mode == "full" or kind != 'unchanged':
+            return row
+        return None
+
+    def merge_chunk(records):
+        # 整批載入暫存表後，以單一 INSERT ... ON CONFLICT 合併；沒有變動的行不會被更新
+        changed, rejected = merge_records(conn, table, MERGE_COLUMNS, HR_MERGE.key, records,
+                                          on_reject=report_reject, merge_query=merge_query)
+        # 雜湊、進度與資料在同一個交易寫入，中斷時三者一致
+        save_row_hashes(conn, table, tracker)
+        if revision is not None:
+            # dedup 暫存中還沒寫入的行不算已處理
+            save_checkpoint(conn, table, revision, dedup.checkpoint(max(row_num for row_num, _ in records)))
+        conn.commit()
+        print(f"已處理至第 {records[-1][0]} 行，新增或更新: {changed}，跳過: {rejected}")
+
+    # 先檢查再去重：檢查不過的行不參與去重，同一個員工檢查通過的其他行仍可勝出
+    validator = SchemaValidator(HR_MERGE, dedup_key=HR_MERGE.key)
+
+    # 背景執行緒預先抓取後面的範圍，寫入資料庫的同時下一批已在下載
+    # 拒絕紀錄在背景寫出，結束（包括中途出錯）時寫完剩下的部分
+    with rejects:
+        run_pipeline(
+            sheet_rows(sheet, first_row=first_row, last_row=total_rows, batch_size=BATCH_SIZE, fetch=fetch,
+                       workers=FETCH_WORKERS, queue_depth=FETCH_QUEUE_DEPTH),
+            [map_records(parse_dates), validation_stage(validator, reject_invalid), dedup_stage(dedup),
+             map_records(select_changed)],
+            merge_chunk,
+            chunk_size=BATCH_SIZE
+        )
+    if dedup.summary():
+        print(dedup.summary())
+    # reject-all 丟掉的員工仍在試算表中，資料庫中既有的行保留不動
+    tracker.mark_seen(dedup.rejected_keys())
+
+    # 刪除已從試算表移除的員工
+    deleted = delete_missing_keys(conn, table, HR_MERGE.key, tracker.seen_keys())
+    delete_row_hashes(conn, table, tracker.deleted_keys())
+    conn.commit()
+
+    counts = tracker.counts
+    print(f"新增: {counts['insert']}，變動: {counts['update']}，"
+          f"未變動而略過: {counts['unchanged'] if sync_mode == 'incremental' else 0}，刪除: {deleted}")
 
 
 if __name__ == "__main__":
-    # 連接到 PostgreSQL 資料庫
-    conn = psycopg2.connect(
+    # 從連線池借用 PostgreSQL 連線，離開時歸還（未 commit 的交易會 rollback）
+    with db_connection(
         host=POSTGRES_SERVER,
-        database=POSTGRES_DB,
+        dbname=POSTGRES_DB,
         user=POSTGRES_USER,
         password=POSTGRES_PASSWORD,
         port=POSTGRES_PORT
-    )
-
-    try:
-        total_rows = check_google_sheet()
-        create_table_if_not_exists(conn)
-        upsert_data(client.open_by_key(my_spreadsheet_id).worksheet(my_Googlesheet_PageName), total_rows, conn)
-    finally:
-        conn.close()
+    ) as conn:
+        client = get_client()
+        created = create_table_if_not_exists(conn)
+        create_state_tables(conn)
+
+        spreadsheet = open_spreadsheet(client, key=my_spreadsheet_id)
+        unchanged, revision = check_unchanged(conn, HR_MERGE.table, DriveRevisionSource(spreadsheet))
+        if SKIP_IF_UNCHANGED and unchanged:
+            print(f"試算表自上次同步後未變動（版本 {revision}），略過本次同步")
+        else:
+            plan, total_rows = check_google_sheet(spreadsheet)
+            upsert_data(spreadsheet.worksheet(my_Googlesheet_PageName), plan, total_rows, conn, revision=revision)
+            # 補建缺少的索引（表已公開時以 CONCURRENTLY）並更新統計資料
+            finish_bulk_load(conn, HR_MERGE.table, HR_MERGE.indexes, concurrently=not created)
+            # 全部完成：記錄版本並刪除進度
+            save_revision(conn, HR_MERGE.table, revision)
+            clear_checkpoint(conn, HR_MERGE.table)
+            conn.commit()
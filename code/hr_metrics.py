@@ -0,0 +1,275 @@
+"""
+同步工作的量測：每個步驟（extract / transform / load）的時間、進出行數、抓取的請求數與位元組數、
+送出的 SQL 陳述式與 commit 次數，以及依原因分類的拒絕筆數。
+
+- RunMetrics：一個工作一次執行的量測；log() 輸出一行一個步驟的 JSON，summary() 給 Airflow XCom，
+  to_prometheus() / write_prometheus() / send_statsd() 匯出給監控系統
+- NULL_METRICS：停用時使用，所有方法都不做事，也不會替 fetch、sink 或連線多包一層
+
+計數都是以「一個請求」或「一批」為單位累加，不會在每一行上多做事。
+資料庫的陳述式與 commit 由 connection_factory() 的連線類別計算，借出連線時以 bind() 指定記到哪個步驟。
+"""
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# 匯出時指標名稱的前綴
+METRICS_PREFIX = 'hr_sync'
+
+# 累加的欄位，依輸出順序排列
+STAGE_FIELDS = ('seconds', 'rows_in', 'rows_out', 'requests', 'bytes_fetched', 'statements', 'commits')
+
+# StatsD 沒有指定埠號時使用的預設值
+STATSD_PORT = 8125
+
+
+def reject_reason(error):
+    """拒絕的原因：字串直接使用，例外取類別名稱（psycopg2 2.8 以後為 StringDataRightTruncation 等）。"""
+    if isinstance(error, str):
+        return error
+    return type(error).__name__
+
+
+class StageMetrics:
+    """一個步驟的累計值；prefetch 的執行緒也會寫入，所以加鎖。"""
+
+    def __init__(self, name):
+        self.name = name
+        self.counts = dict.fromkeys(STAGE_FIELDS, 0)
+        self.counts['seconds'] = 0.0
+        self.rejects = {}
+        self._lock = threading.Lock()
+
+    def add(self, **counts):
+        with self._lock:
+            for key, n in counts.items():
+                self.counts[key] += n
+
+    def reject(self, error):
+        reason = reject_reason(error)
+        with self._lock:
+            self.rejects[reason] = self.rejects.get(reason, 0) + 1
+
+    def as_dict(self):
+        with self._lock:
+            result = dict(self.counts, seconds=round(self.counts['seconds'], 3))
+            result['rejects'] = dict(self.rejects)
+        if result['seconds'] and result['rows_out']:
+            result['rows_per_second'] = round(result['rows_out'] / result['seconds'], 1)
+        return result
+
+
+class _NullStage:
+    name = None
+
+    def add(self, **counts):
+        pass
+
+    def reject(self, error):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+def _fetched_bytes(rows):
+    # 以儲存格文字的 UTF-8 長度估計下載量（不含 JSON 的括號與引號）
+    return sum(len(''.join(row).encode('utf-8')) for row in rows)
+
+
+class RunMetrics:
+    """一個工作（job）一次執行的量測。"""
+
+    enabled = True
+
+    def __init__(self, job):
+        self.job = job
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def stage(self, name):
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = StageMetrics(name)
+            return stage
+
+    @contextmanager
+    def timed(self, name):
+        """量測 with 區塊的時間，累加到步驟 name，yield 該步驟。"""
+        stage = self.stage(name)
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage.add(seconds=time.perf_counter() - start)
+
+    def count_fetch(self, stage, fetch):
+        """包裝 fetch(start, end)：每個請求累加請求數、取得的行數與位元組數。"""
+        def counted(start, end):
+            rows = fetch(start, end)
+            stage.add(requests=1, rows_in=len(rows), bytes_fetched=_fetched_bytes(rows))
+            return rows
+        return counted
+
+    def count_sink(self, stage, sink):
+        """包裝 run_pipeline 的 sink：每批累加寫出的行數。"""
+        def counted(chunk):
+            stage.add(rows_out=len(chunk))
+            return sink(chunk)
+        return counted
+
+    @contextmanager
+    def bind(self, conn, stage):
+        """連線是 connection_factory() 建立的時候，區塊內送出的陳述式與 commit 記到 stage。"""
+        if not hasattr(conn, 'metrics'):
+            yield conn
+            return
+        previous, conn.metrics = conn.metrics, stage
+        try:
+            yield conn
+        finally:
+            conn.metrics = previous
+
+    def summary(self):
+        stages = {name: stage.as_dict() for name, stage in self.stages.items()}
+        rejects = {}
+        for stage in stages.values():
+            for reason, n in stage['rejects'].items():
+                rejects[reason] = rejects.get(reason, 0) + n
+        return {
+            'job': self.job,
+            'seconds': round(sum(stage['seconds'] for stage in stages.values()), 3),
+            'rejects': rejects,
+            'stages': stages,
+        }
+
+    def log(self):
+        """每個步驟輸出一行 JSON，方便以 job / stage 篩選與彙整。"""
+        for name, stage in self.summary()['stages'].items():
+            print(json.dumps(dict(event='hr_sync_stage', job=self.job, stage=name, **stage), ensure_ascii=False))
+
+    def to_prometheus(self):
+        """Prometheus 文字格式（textfile collector 可直接讀取）。"""
+        lines = []
+        stages = self.summary()['stages']
+        for field in STAGE_FIELDS:
+            metric = f"{METRICS_PREFIX}_{field}"
+            lines.append(f"# TYPE {metric} gauge")
+            for name, stage in stages.items():
+                lines.append(f'{metric}{{job="{self.job}",stage="{name}"}} {stage[field]}')
+        metric = f"{METRICS_PREFIX}_rejects"
+        lines.append(f"# TYPE {metric} gauge")
+        for name, stage in stages.items():
+            for reason, n in stage['rejects'].items():
+                lines.append(f'{metric}{{job="{self.job}",stage="{name}",reason="{reason}"}} {n}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, directory):
+        """寫入 directory 下的 .prom 檔（先寫暫存檔再改名），每個工作與步驟組合一個檔案。"""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{METRICS_PREFIX}_{self.job}_{'_'.join(self.stages)}.prom")
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        os.replace(path + '.tmp', path)
+        return path
+
+    def to_statsd(self):
+        lines = []
+        for name, stage in self.summary()['stages'].items():
+            prefix = f"{METRICS_PREFIX}.{self.job}.{name}"
+            lines.append(f"{prefix}.seconds:{int(stage['seconds'] * 1000)}|ms")
+            for field in STAGE_FIELDS[1:]:
+                lines.append(f"{prefix}.{field}:{stage[field]}|c")
+            for reason, n in stage['rejects'].items():
+                lines.append(f"{prefix}.rejects.{reason}:{n}|c")
+        return lines
+
+    def send_statsd(self, address):
+        """以 UDP 送到 StatsD（address 為 host 或 host:port）；監控系統連不上不影響同步。"""
+        host, _, port = address.partition(':')
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                for line in self.to_statsd():
+                    sock.sendto(line.encode('utf-8'), (host, int(port or STATSD_PORT)))
+        except OSError as e:
+            print(f"無法送出 StatsD 指標至 {address}: {e}")
+
+
+class _NullMetrics:
+    """停用量測時使用：不計時、不包裝，回傳原本的 fetch / sink。"""
+
+    enabled = False
+    job = None
+    stages = {}
+
+    def stage(self, name):
+        return _NULL_STAGE
+
+    def timed(self, name):
+        return nullcontext(_NULL_STAGE)
+
+    def count_fetch(self, stage, fetch):
+        return fetch
+
+    def count_sink(self, stage, sink):
+        return sink
+
+    def bind(self, conn, stage):
+        return nullcontext(conn)
+
+    def summary(self):
+        return {}
+
+    def log(self):
+        pass
+
+
+NULL_METRICS = _NullMetrics()
+
+
+_connection_class = None
+_connection_lock = threading.Lock()
+
+
+def connection_factory():
+    """
+    psycopg2.connect 的 connection_factory：計算送出的陳述式（executemany 每一行算一個）、
+    COPY 與 commit，記到連線目前 bind 的步驟。只在啟用量測時才匯入 psycopg2 並建立類別。
+    """
+    global _connection_class
+    with _connection_lock:
+        if _connection_class is not None:
+            return _connection_class
+
+        import psycopg2.extensions
+
+        class MetricsCursor(psycopg2.extensions.cursor):
+            def execute(self, query, vars=None):
+                self.connection.metrics.add(statements=1)
+                return super().execute(query, vars)
+
+            def executemany(self, query, vars_list):
+                vars_list = list(vars_list)
+                self.connection.metrics.add(statements=len(vars_list))
+                return super().executemany(query, vars_list)
+
+            def copy_expert(self, sql, file, size=8192):
+                self.connection.metrics.add(statements=1)
+                return super().copy_expert(sql, file, size)
+
+        class MetricsConnection(psycopg2.extensions.connection):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                self.cursor_factory = MetricsCursor
+                self.metrics = _NULL_STAGE
+
+            def commit(self):
+                self.metrics.add(commits=1)
+                return super().commit()
+
+        _connection_class = MetricsConnection
+        return _connection_class
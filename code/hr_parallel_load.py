@@ -0,0 +1,138 @@
+"""
+平行載入：依 key 的雜湊把行分到 N 個分片，每個分片由自己的執行緒與連線以 COPY 寫入一張 UNLOGGED 暫存表，
+全部寫完後在主連線的一個交易中依原本的行號順序 INSERT ... SELECT 進目標表，並刪除暫存表。
+COPY 的解析、型別轉換與約束檢查分散到 N 個 PostgreSQL backend，不再只用到一顆 CPU；
+最後的 INSERT ... SELECT 只是表對表的複製，比解析 COPY 便宜得多。
+
+- 重複的 key 在分片之前就已處理：hr_dedup 依工作的策略每個 key 只留一行，hr_validation 擋下 UNIQUE 索引重複的值。
+  目標表的索引（hr_indexes）要等寫入完成才建立，分片暫存表以 LIKE 目標表 INCLUDING INDEXES 建立時
+  只會帶上 CREATE TABLE 中的主鍵（沒有主鍵的表則沒有任何約束），分片本身不負責去重
+- 有主鍵的表：同一個 key 一定在同一個分片，漏網的重複主鍵在分片中被逐行拒絕（先出現的一行保留），
+  最後的 INSERT ... SELECT 不會再衝突；沒有主鍵的表完全依賴前面的去重，INSERT ... SELECT 原樣寫入，
+  之後建立 UNIQUE 索引時才會發現重複
+- 暫存表必須是一般（UNLOGGED）表，其他連線寫入的內容主連線才看得到；失敗時由 abort() 刪除，
+  下次建立前也會先 DROP
+"""
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from hr_bulk_load import COPY_CHUNK_SIZE, _copy_chunks, _default_reject, quote_columns
+
+# 預設的平行連線數；工作連線不經過連線池，不受 POOL_MAX_CONNECTIONS 限制
+LOAD_WORKERS = 4
+
+# 每個分片最多幾批在等待寫入，限制記憶體用量
+SHARD_QUEUE_DEPTH = 4
+
+
+def shard_of(key, shards):
+    """以 CRC32 決定分片（與 hash() 不同，每個行程的結果都相同）；同一個 key 一定在同一個分片。"""
+    return zlib.crc32(str(key).encode('utf-8')) % shards
+
+
+def shard_table_name(table, index):
+    return f"{table}__shard_{index}"
+
+
+class ShardedTableWriter:
+    """
+    介面與 hr_bulk_load.TableWriter 相同：write(records) 可多次呼叫，finish() 回傳 (成功筆數, 跳過筆數)，
+    失敗時呼叫 abort()。conn 為主連線，最後的合併在它的交易中；connect() 回傳一條新連線的 context manager。
+    key_index 為 record 中用來分片的欄位序號，None 時依行號分片。
+    """
+
+    def __init__(self, conn, connect, table, columns, key_index, workers=LOAD_WORKERS, on_reject=None,
+                 chunk_size=COPY_CHUNK_SIZE):
+        self.conn = conn
+        self.table = table
+        self.columns = list(columns)
+        self.key_index = key_index
+        self.workers = workers
+        self.on_reject = on_reject or _default_reject
+        self.chunk_size = chunk_size
+        self.loaded = 0
+        self.rejected = 0
+        self.shards = [shard_table_name(table, i) for i in range(workers)]
+        self._pending = [deque() for _ in range(workers)]
+        self._create_shards()
+
+        # ExitStack 依相反順序關閉：先等執行緒結束，再關連線
+        self._stack = ExitStack()
+        try:
+            self._conns = [self._stack.enter_context(connect()) for _ in range(workers)]
+            self._threads = [self._stack.enter_context(ThreadPoolExecutor(max_workers=1,
+                                                                          thread_name_prefix=f'hr-shard-{i}'))
+                             for i in range(workers)]
+        except Exception:
+            self._stack.close()
+            self._drop_shards()
+            raise
+
+    def _create_shards(self):
+        with self.conn.cursor() as cursor:
+            for shard in self.shards:
+                cursor.execute(f'DROP TABLE IF EXISTS {shard}')
+                cursor.execute(f'CREATE UNLOGGED TABLE {shard} '
+                               f'(LIKE {self.table} INCLUDING DEFAULTS INCLUDING INDEXES)')
+                cursor.execute(f'ALTER TABLE {shard} ADD COLUMN _row_num INTEGER')
+        self.conn.commit()
+
+    def _drop_shards(self):
+        with self.conn.cursor() as cursor:
+            for shard in self.shards:
+                cursor.execute(f'DROP TABLE IF EXISTS {shard}')
+        self.conn.commit()
+
+    def _copy(self, index, part):
+        """在第 index 個工作執行緒中執行：以該分片的連線 COPY，交易到 finish() 才 commit。"""
+        with self._conns[index].cursor() as cursor:
+            return _copy_chunks(cursor, self.shards[index], self.columns + ['_row_num'], part, self.chunk_size,
+                                lambda row_num, record, e: self.on_reject(row_num, record[:-1], e))
+
+    def _collect(self, future):
+        ok, bad = future.result()
+        self.loaded += ok
+        self.rejected += bad
+
+    def write(self, records):
+        parts = [[] for _ in self.shards]
+        for row_num, record in records:
+            key = row_num if self.key_index is None else record[self.key_index]
+            parts[shard_of(key, self.workers)].append((row_num, list(record) + [row_num]))
+        for i, part in enumerate(parts):
+            if not part:
+                continue
+            pending = self._pending[i]
+            if len(pending) >= SHARD_QUEUE_DEPTH:
+                self._collect(pending.popleft())
+            pending.append(self._threads[i].submit(self._copy, i, part))
+
+    def finish(self):
+        for pending in self._pending:
+            while pending:
+                self._collect(pending.popleft())
+        for conn in self._conns:
+            conn.commit()
+        self._stack.close()
+
+        cols = quote_columns(self.columns)
+        shards = ' UNION ALL '.join(f'SELECT {cols}, _row_num FROM {shard}' for shard in self.shards)
+        with self.conn.cursor() as cursor:
+            # 依原本的行號排序，表中的實體順序與單一連線寫入時相同
+            cursor.execute(f'INSERT INTO {self.table} ({cols}) SELECT {cols} FROM ({shards}) AS shards '
+                           f'ORDER BY _row_num')
+            for shard in self.shards:
+                cursor.execute(f'DROP TABLE {shard}')
+        self.conn.commit()
+        return self.loaded, self.rejected
+
+    def abort(self):
+        for pending in self._pending:
+            for future in pending:
+                future.cancel()
+            pending.clear()
+        self._stack.close()
+        self.conn.rollback()
+        self._drop_shards()
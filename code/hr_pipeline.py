@@ -0,0 +1,138 @@
+"""
+串流式 擷取 → 轉換 → 載入 管線，所有載入程式共用。
+
+來源 (source) 產生 (row_num, row)；每個階段 (stage) 是「接收串流、回傳串流」的產生器函式，
+有 finish 屬性的階段在串流結束時再由 finish() 產生暫存的行（hr_dedup.dedup_stage）；
+最後依 chunk_size 切塊交給 sink(chunk)。整個過程只有目前這一塊與預先抓取佇列中的資料在記憶體中，
+不再使用 get_all_values() 一次讀入整張工作表。
+"""
+from operator import itemgetter
+
+from hr_sheet_fetch import FETCH_QUEUE_DEPTH, FETCH_WORKERS, prefetch_ranges
+from hr_sheet_scheduler import AdaptiveBatchSize, adaptive_ranges, default_scheduler
+
+# 每次從試算表抓取的行數（起始值，之後依實際的請求時間與限流情況調整）
+SOURCE_BATCH_SIZE = 1000
+
+# 每塊交給 sink 的筆數
+PIPELINE_CHUNK_SIZE = 1000
+
+# key 與 UNIQUE 索引的欄位中表示「沒有值」的寫法：不算重複（例如沒有工號的員工可以有很多位）
+BLANK_VALUES = ('',)
+
+
+def sheet_rows(sheet, first_row=2, last_row=None, batch_size=SOURCE_BATCH_SIZE, fetch=None,
+               workers=FETCH_WORKERS, queue_depth=FETCH_QUEUE_DEPTH, scheduler=None):
+    """
+    來源：分批讀取工作表 first_row ~ last_row（預設到格線最後一行），yield (row_num, row)。
+    fetch(start, end) 預設抓整行；API 不回傳範圍尾端的空白行，所以空白格線幾乎不花成本。
+    每個請求都經過 scheduler（預設為行程共用的排程器）：遵守讀取配額、處理 429 與暫時性錯誤，
+    每批的行數從 batch_size 開始依實際情況調整。
+    """
+    if last_row is None:
+        last_row = sheet.row_count
+    if fetch is None:
+        def fetch(start, end):
+            return sheet.get(f"{start}:{end}")
+    scheduler = scheduler or default_scheduler()
+    sizer = AdaptiveBatchSize(batch_size)
+
+    for start, _, rows in prefetch_ranges(scheduler.fetcher(fetch, sizer),
+                                          adaptive_ranges(first_row, last_row, sizer),
+                                          workers=workers, queue_depth=queue_depth):
+        for row_num, row in enumerate(rows, start=start):
+            yield row_num, row
+
+
+def clean_header(header):
+    """處理空的列名。"""
+    return [f'col_{i+1}' if col.strip() == '' else col.strip() for i, col in enumerate(header)]
+
+
+def clean_text(value, empty="NA"):
+    """去除前後空白，空的欄位替換為 empty。"""
+    return value.strip() or empty
+
+
+def blank_values(empty=None):
+    """BLANK_VALUES 加上 clean_text 把空值換成的 empty（例如 "NA"），這些值同樣表示沒有值。"""
+    if empty is None or empty in BLANK_VALUES:
+        return BLANK_VALUES
+    return BLANK_VALUES + (empty,)
+
+
+def row_mapper(positions, missing_column=None):
+    """
+    依預先算好的位置把工作表的一行轉成 record，以 operator.itemgetter 一次取出所有欄位。
+    位置為 None 的欄位（標題中沒有）填 missing_column；行尾被 API 省略的空白儲存格補空字串。
+    """
+    width = max((p for p in positions if p is not None), default=-1) + 1
+    indexes = [width if p is None else p for p in positions]  # 缺少的欄位取補上的最後一格
+    getter = itemgetter(*indexes) if len(indexes) > 1 else lambda row: (row[indexes[0]],)
+    filler = [''] * width + [missing_column]
+    pad_always = None in positions
+
+    def mapper(row):
+        if pad_always or len(row) < width:
+            row = row[:width] + filler[min(len(row), width):]
+        return list(getter(row))
+    return mapper
+
+
+def map_rows(mapper):
+    """標題對應：mapper(row) 把工作表的一行轉成依目標欄位排列的 record。"""
+    def stage(rows):
+        for row_num, row in rows:
+            yield row_num, mapper(row)
+    return stage
+
+
+def map_records(fn):
+    """正規化：fn(row_num, record) 回傳新的 record，回傳 None 表示丟掉這一行。"""
+    def stage(rows):
+        for row_num, record in rows:
+            record = fn(row_num, record)
+            if record is not None:
+                yield row_num, record
+    return stage
+
+
+def validate(check, on_reject):
+    """驗證：check(record) 回傳錯誤訊息或 None；有錯誤的行交給 on_reject(row_num, record, 訊息) 後丟掉。"""
+    def stage(rows):
+        for row_num, record in rows:
+            error = check(record)
+            if error is None:
+                yield row_num, record
+            else:
+                on_reject(row_num, record, error)
+    return stage
+
+
+def chunked(rows, chunk_size):
+    chunk = []
+    for item in rows:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _finished(stage, rows):
+    yield from stage(rows)
+    yield from stage.finish()
+
+
+def run_pipeline(source, stages, sink, chunk_size=PIPELINE_CHUNK_SIZE):
+    """把 source 依序套上 stages，每 chunk_size 筆交給 sink(chunk) 一次。回傳送進 sink 的總筆數。"""
+    stream = source
+    for stage in stages:
+        stream = _finished(stage, stream) if hasattr(stage, 'finish') else stage(stream)
+
+    total = 0
+    for chunk in chunked(stream, chunk_size):
+        sink(chunk)
+        total += len(chunk)
+    return total
@@ -0,0 +1,219 @@
+"""
+被拒絕的行（寫入前檢查或資料庫拒絕）集中寫到這裡，取代逐行 print 與每次覆寫的 skipped_records.txt。
+每筆紀錄包含行號、key（例如 10_number）、欄位、原因（例外名稱）、SQLSTATE、訊息與原始的值：
+- "file" ：gzip 壓縮的 JSONL，依工作分檔、附加寫入，超過 REJECTS_MAX_BYTES 時輪替，保留 REJECTS_KEEP 份
+- "table"：以 COPY 批次寫入 <目標表>_rejects，與載入的交易分開，載入 rollback 時拒絕紀錄仍會保留
+
+RejectSink.add() 只把行放進緩衝區並累加各原因的計數；每 REJECT_BATCH_SIZE 筆交給背景執行緒
+轉成 JSON 並寫出，大量拒絕時主要的載入不必等待檔案或資料庫。
+"""
+import gzip
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from hr_bulk_load import copy_records
+
+# 拒絕紀錄的目的地
+REJECT_TARGETS = ("file", "table")
+
+# 拒絕紀錄檔的目錄；Airflow 的 dags 資料夾可能是唯讀的，預設放在暫存目錄
+REJECTS_DIR = os.path.join(tempfile.gettempdir(), 'hr_rejects')
+
+# 單一紀錄檔超過這個大小（壓縮後）時輪替，保留幾份舊檔
+REJECTS_MAX_BYTES = 20 * 1024 * 1024
+REJECTS_KEEP = 5
+
+# 每幾筆交給背景執行緒寫出一次
+REJECT_BATCH_SIZE = 1000
+
+# 每次執行只印出前幾筆拒絕的行，其餘只寫入紀錄與計數
+REJECT_PRINT_LIMIT = 20
+
+REJECT_TABLE_COLUMNS = ["rejected_at", "job", "row_num", "key", "column_name", "reason", "sqlstate", "message",
+                        "raw_values"]
+
+
+def _json_value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def _error_column(error):
+    # hr_validation 的錯誤帶有 column；psycopg2 的錯誤只有部分（例如 NOT NULL）會在 diag 中回報欄位
+    column = getattr(error, 'column', None)
+    if column is None:
+        column = getattr(getattr(error, 'diag', None), 'column_name', None)
+    return column
+
+
+class JsonlRejectFile:
+    """gzip 壓縮的 JSONL；每批附加為一個 gzip member（gzip / zcat 可以直接讀完整個檔案）。"""
+
+    def __init__(self, job_name, directory=REJECTS_DIR, max_bytes=REJECTS_MAX_BYTES, keep=REJECTS_KEEP):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{job_name}.rejects.jsonl.gz")
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self._rotate_if_needed()
+
+    def _rotate_if_needed(self):
+        """例如 x.jsonl.gz -> x.1.jsonl.gz -> x.2.jsonl.gz ...，超過 keep 份的最舊檔案刪除。"""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < self.max_bytes:
+            return
+        base = self.path[:-len('.jsonl.gz')]
+        oldest = f"{base}.{self.keep}.jsonl.gz"
+        if os.path.exists(oldest):
+            os.remove(oldest)
+        for i in range(self.keep - 1, 0, -1):
+            older = f"{base}.{i}.jsonl.gz"
+            if os.path.exists(older):
+                os.replace(older, f"{base}.{i + 1}.jsonl.gz")
+        os.replace(self.path, f"{base}.1.jsonl.gz")
+
+    def write(self, entries):
+        lines = [json.dumps(entry, ensure_ascii=False, default=str) + '\n' for entry in entries]
+        with gzip.open(self.path, 'at', encoding='utf-8', compresslevel=6) as f:
+            f.writelines(lines)
+
+
+class RejectTable:
+    """
+    以 COPY 批次寫入 table；connect() 回傳借用連線的 context manager（例如 hr_connections.db_connection），
+    每批借一次連線並 commit，與載入使用的連線、交易分開。
+    """
+
+    def __init__(self, connect, table):
+        self.connect = connect
+        self.table = table
+        self._created = False
+
+    def _create(self, conn):
+        with conn.cursor() as cursor:
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS {self.table} (
+                    rejected_at TIMESTAMPTZ NOT NULL,
+                    job VARCHAR(100) NOT NULL,
+                    row_num INTEGER,
+                    key TEXT,
+                    column_name TEXT,
+                    reason TEXT NOT NULL,
+                    sqlstate VARCHAR(5),
+                    message TEXT,
+                    raw_values JSONB
+                )
+            ''')
+        conn.commit()
+        self._created = True
+
+    def write(self, entries):
+        with self.connect() as conn:
+            if not self._created:
+                self._create(conn)
+            records = ((entry['row_num'], [entry['rejected_at'], entry['job'], entry['row_num'], entry['key'],
+                                           entry['column'], entry['reason'], entry['sqlstate'], entry['message'],
+                                           json.dumps(entry['values'], ensure_ascii=False, default=str)])
+                       for entry in entries)
+            copy_records(conn, self.table, REJECT_TABLE_COLUMNS, records)
+
+
+class RejectSink:
+    """
+    一個工作一次執行的拒絕紀錄。columns 為 record 的欄位名稱，key 為其中用來辨識員工的欄位（可為 None）。
+    add() 可直接當作 on_reject 使用；結束時呼叫 close()，回傳 {原因: 筆數}。
+    """
+
+    def __init__(self, job_name, columns, key=None, targets=(), batch_size=REJECT_BATCH_SIZE,
+                 print_limit=REJECT_PRINT_LIMIT, log=print):
+        self.job_name = job_name
+        self.columns = list(columns)
+        self.key_index = self.columns.index(key) if key else None
+        self.targets = list(targets)
+        self.batch_size = batch_size
+        self.print_limit = print_limit
+        self.log = log
+        self.counts = {}
+        self.total = 0
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._pending = []
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='hr-rejects') if self.targets else None
+
+    def add(self, row_num, record, error):
+        reason = type(error).__name__
+        with self._lock:
+            self.counts[reason] = self.counts.get(reason, 0) + 1
+            self.total += 1
+            shown = self.total <= self.print_limit
+            if self._writer is not None:
+                self._buffer.append((row_num, record, error, datetime.now(timezone.utc)))
+                batch = self._buffer if len(self._buffer) >= self.batch_size else None
+                if batch is not None:
+                    self._buffer = []
+        if shown:
+            self.log(f"跳過無效的資料在第 {row_num} 行: {record}, 錯誤: {error}")
+        if self._writer is not None and batch is not None:
+            self._pending.append(self._writer.submit(self._write, batch))
+
+    def _entry(self, row_num, record, error, rejected_at):
+        key = record[self.key_index] if self.key_index is not None and self.key_index < len(record) else None
+        return {
+            'rejected_at': rejected_at.isoformat(),
+            'job': self.job_name,
+            'row_num': row_num,
+            'key': key,
+            'column': _error_column(error),
+            'reason': type(error).__name__,
+            'sqlstate': getattr(error, 'pgcode', None),
+            'message': str(error).strip(),
+            'values': dict(zip(self.columns, map(_json_value, record))),
+        }
+
+    def _write(self, batch):
+        entries = [self._entry(*item) for item in batch]
+        for target in self.targets:
+            try:
+                target.write(entries)
+            except Exception as e:
+                # 拒絕紀錄寫不出去不影響載入本身
+                self.log(f"無法寫入拒絕紀錄（{type(target).__name__}）: {e}")
+
+    def close(self):
+        """寫出緩衝區中剩下的紀錄並等待背景寫入完成，回傳各原因的筆數。"""
+        if self._writer is not None:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+            if batch:
+                self._pending.append(self._writer.submit(self._write, batch))
+            for future in self._pending:
+                future.result()
+            self._writer.shutdown()
+            self._writer = None
+        if self.total > self.print_limit:
+            self.log(f"另有 {self.total - self.print_limit} 行被拒絕，未逐行輸出")
+        if self.total:
+            self.log(f"拒絕 {self.total} 行: {self.counts}")
+        return dict(self.counts)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def reject_targets(names, job_name, table=None, connect=None, directory=REJECTS_DIR):
+    """依名稱（"file"、"table"，可用逗號分隔）建立寫入目的地；"table" 需要 table 與 connect。"""
+    if isinstance(names, str):
+        names = [name.strip() for name in names.split(',') if name.strip()]
+    unknown = [name for name in names if name not in REJECT_TARGETS + ("off",)]
+    if unknown:
+        raise ValueError(f"未知的拒絕紀錄目的地: {', '.join(unknown)}（可用: {', '.join(REJECT_TARGETS)}, off）")
+    targets = []
+    if "file" in names:
+        targets.append(JsonlRejectFile(job_name, directory))
+    if "table" in names:
+        targets.append(RejectTable(connect, f"{table}_rejects"))
+    return targets
@@ -0,0 +1,59 @@
+"""
+暫時性錯誤（連線中斷、逾時、408/429/5xx）的指數退避重試。
+只用在可以安全重做的動作：建立連線、取得 token、開啟試算表、抓取範圍。
+"""
+import random
+import time
+
+# 最多嘗試次數；第 n 次失敗後等待 RETRY_BASE_DELAY * 2^(n-1) 秒（加上隨機抖動，最多 RETRY_MAX_DELAY）
+RETRY_ATTEMPTS = 4
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+
+# 視為暫時性錯誤的 HTTP 狀態碼
+TRANSIENT_STATUS = (408, 429, 500, 502, 503, 504)
+
+# 沒有 HTTP 回應的網路錯誤（requests、urllib3，以及 hr_async_sync 使用的 aiohttp、asyncpg）
+TRANSIENT_ERROR_NAMES = ('ConnectionError', 'Timeout', 'ReadTimeout', 'ConnectTimeout', 'ProtocolError',
+                         'ClientConnectorError', 'ClientOSError', 'ServerDisconnectedError', 'ClientPayloadError',
+                         'ConnectionDoesNotExistError', 'CannotConnectNowError')
+
+
+def is_transient(error):
+    """psycopg2 的連線類錯誤、網路錯誤與 408/429/5xx 視為暫時性，可以重試。"""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    for cls in type(error).__mro__:
+        # psycopg2.OperationalError / InterfaceError 及其子類別（這裡不匯入 psycopg2）
+        if cls.__module__.startswith('psycopg2') and cls.__name__ in ('OperationalError', 'InterfaceError'):
+            return True
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    if status is not None:
+        return status in TRANSIENT_STATUS
+    return type(error).__name__ in TRANSIENT_ERROR_NAMES
+
+
+def backoff_delay(attempt, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY):
+    """第 attempt 次（1 起算）失敗後的等待秒數，加上最多 10% 的隨機抖動避免多個工作同時重試。"""
+    delay = min(max_delay, base_delay * 2 ** (attempt - 1))
+    return delay + random.uniform(0, delay * 0.1)
+
+
+def retry_call(fn, *args, attempts=RETRY_ATTEMPTS, base_delay=RETRY_BASE_DELAY, **kwargs):
+    """呼叫 fn(*args, **kwargs)，遇到暫時性錯誤時以指數退避重試，其他錯誤直接拋出。"""
+    for attempt in range(1, attempts + 1):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == attempts or not is_transient(e):
+                raise
+            delay = backoff_delay(attempt, base_delay)
+            print(f"暫時性錯誤，{delay:.1f} 秒後重試（第 {attempt}/{attempts - 1} 次）: {e}")
+            time.sleep(delay)
+
+
+def retrying(fn, attempts=RETRY_ATTEMPTS):
+    """把 fn 包成會自動重試暫時性錯誤的版本。"""
+    def wrapper(*args, **kwargs):
+        return retry_call(fn, *args, attempts=attempts, **kwargs)
+    return wrapper
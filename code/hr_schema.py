@@ -0,0 +1,154 @@
+"""
+目標資料表的欄位定義（每張表一份）。欄位名稱、試算表標題、型別與長度只寫在這裡，
+標題對應、CREATE TABLE、INSERT 與 INSERT ... ON CONFLICT 都由這份定義在每次執行時產生一次。
+索引另外以 Index 宣告，CREATE TABLE 不包含索引，由 hr_indexes 在寫入完成後建立。
+"""
+from hr_bulk_load import MERGE_STAGE, build_insert_query, build_merge_query, quote_columns
+from hr_indexes import index_name
+from hr_pipeline import BLANK_VALUES, row_mapper
+from hr_sheet_fetch import header_positions
+
+
+class Column:
+    """
+    name: 資料庫欄位名稱；sql_type: 型別（VARCHAR 配合 max_length）；
+    header: 試算表標題（預設同 name）；position: 標題列找不到時使用的欄位序號（0 起算）。
+    型別、長度與 NOT NULL 也是 hr_validation 在寫入前檢查的依據。
+    """
+
+    def __init__(self, name, sql_type, max_length=None, header=None, position=None, primary_key=False,
+                 not_null=False):
+        self.name = name
+        self.sql_type = sql_type.upper()
+        self.max_length = max_length
+        self.header = header or name
+        self.position = position
+        self.primary_key = primary_key
+        self.not_null = not_null
+
+    def ddl(self):
+        sql_type = f"{self.sql_type}({self.max_length})" if self.max_length else self.sql_type
+        if self.primary_key:
+            return f'"{self.name}" {sql_type} PRIMARY KEY'
+        return f'"{self.name}" {sql_type}' + (' NOT NULL' if self.not_null else '')
+
+
+class Index:
+    """
+    一個索引的欄位（依序）；unique 為 True 時同樣的值只能出現一次。
+    索引在寫入後才建立，重複的值由 hr_validation 在寫入前擋下，不會讓建立索引失敗。
+    UNIQUE 索引為部分索引，不包含 blanks 中表示沒有值的寫法（空字串、工作的 empty_value），
+    沒有工號的員工不會被當成重複。
+    """
+
+    def __init__(self, *columns, unique=False):
+        self.columns = list(columns)
+        self.unique = unique
+
+    def name(self, table):
+        return index_name(table, self.columns)
+
+    def predicate(self, blanks=BLANK_VALUES):
+        """UNIQUE 索引排除 blanks 的 WHERE 子句；一般索引回傳空字串。"""
+        if not self.unique or not blanks:
+            return ''
+        values = ', '.join("'" + value.replace("'", "''") + "'" for value in blanks)
+        return ' WHERE ' + ' AND '.join(f'"{column}" NOT IN ({values})' for column in self.columns)
+
+    def create_query(self, table, concurrently=False, blanks=BLANK_VALUES):
+        unique = 'UNIQUE ' if self.unique else ''
+        concurrent = 'CONCURRENTLY ' if concurrently else ''
+        return (f'CREATE {unique}INDEX {concurrent}IF NOT EXISTS {self.name(table)} '
+                f'ON {table} ({quote_columns(self.columns)}){self.predicate(blanks)}')
+
+
+class TableSchema:
+    """一張目標表的欄位定義，key 為用來比對、合併的欄位（例如 10_number），indexes 為寫入後建立的索引。"""
+
+    def __init__(self, table, columns, key=None, indexes=()):
+        self.table = table
+        self.columns = columns
+        self.key = key
+        self.indexes = list(indexes)
+        self.names = [col.name for col in columns]
+
+    def index_of(self, name):
+        return self.names.index(name)
+
+    def positions(self, header):
+        """每個欄位在工作表中的位置（hr_sheet_fetch.header_positions）；找不到時用 position（沒有設定則為 None）。"""
+        return header_positions(header, self.fetch_columns())
+
+    def row_mapper(self, header, missing_column=None):
+        """依標題列產生 mapper(row)，整次執行共用。"""
+        return row_mapper(self.positions(header), missing_column)
+
+    def fetch_columns(self):
+        """給 hr_sheet_fetch.FetchPlan 的 [(標題名稱, 預設欄位序號), ...]。"""
+        return [(col.header, col.position) for col in self.columns]
+
+    def create_table_query(self, table="{table}", if_not_exists=False):
+        """CREATE TABLE 語句；table 預設保留 {table}，供 create_shadow_table 代入影子表名稱。"""
+        columns = ',\n    '.join(col.ddl() for col in self.columns)
+        exists = 'IF NOT EXISTS ' if if_not_exists else ''
+        return f'CREATE TABLE {exists}{table} (\n    {columns}\n);'
+
+    def insert_query(self, table=None):
+        return build_insert_query(table or self.table, self.names)
+
+    def merge_query(self, source=MERGE_STAGE):
+        """由暫存表 source 合併進正式表的 INSERT ... ON CONFLICT (key)。"""
+        return build_merge_query(self.table, source, self.names, self.key)
+
+
+# employee_records_for_IT_use：「引用-HR 10碼工號」工作表1
+EMPLOYEE_RECORDS = TableSchema('employee_records_for_IT_use', [
+    Column("Div", "varchar", 50),
+    Column("Formal_Name", "varchar", 100, header="Formal Name"),
+    Column("Department", "varchar", 100),
+    Column("Cost_Centre", "varchar", 50, header="Cost Centre"),
+    Column("Reporting_date", "date", header="Reporting date"),
+    Column("Resigned_date", "date", header="Resigned date"),
+    Column("10_Number", "varchar", 10, header="10 Number"),
+    Column("Department_Code", "varchar", 8, header="Department Code"),
+    Column("Cost_Centre_Code", "varchar", 8, header="Cost Centre Code"),
+], key="10_Number", indexes=[
+    Index("10_Number", unique=True),
+    Index("Department_Code"),
+    Index("Cost_Centre_Code"),
+])
+
+# hr_merge_for_IT_use：員工彙整表 Merge 分頁（R、S 兩欄沒有用到，active 在 T 欄）
+HR_MERGE = TableSchema('hr_merge_for_IT_use', [
+    Column("div", "varchar", 13, position=0),
+    Column("last_name", "varchar", 50, position=1),
+    Column("first_name", "varchar", 50, position=2),
+    Column("middle_name", "varchar", 13, position=3),
+    Column("formal_name", "varchar", 255, position=4),
+    Column("department", "varchar", 50, position=5),
+    Column("cost_centre", "varchar", 50, position=6),
+    Column("reporting_date", "date", position=7),
+    Column("resigned_date", "date", position=8),
+    Column("10_number", "varchar", 10, position=9, primary_key=True),
+    Column("type", "varchar", 21, position=10),
+    Column("department_code", "varchar", 15, position=11),
+    Column("cost_centre_code", "varchar", 16, position=12),
+    Column("transfer_record", "varchar", 50, position=13),
+    Column("remark", "varchar", 87, position=14),
+    Column("card_number", "varchar", 59, position=15),
+    Column("adm_remark", "varchar", 94, position=16),
+    Column("active", "varchar", 6, position=19),
+], key="10_number", indexes=[
+    # 10_number 已是主鍵
+    Index("department_code"),
+    Index("cost_centre_code"),
+])
+
+SCHEMAS = {schema.table: schema for schema in (EMPLOYEE_RECORDS, HR_MERGE)}
+
+
+def get_schema(table):
+    try:
+        return SCHEMAS[table]
+    except KeyError:
+        raise ValueError(f"沒有 {table} 的欄位定義（可用: {', '.join(SCHEMAS)}）")
@@ -1,6 +1,19 @@
 import psycopg2
 import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+from hr_bulk_load import TableWriter, replace_keys_from_stage
+from hr_columnar import transform_stage
+from hr_connections import db_connection, open_spreadsheet, sheets_client
+from hr_date_parser import DateNormalizer
+from hr_dedup import KeyDeduplicator, dedup_stage
+from hr_indexes import finish_bulk_load
+from hr_pipeline import clean_header, map_records, map_rows, run_pipeline, sheet_rows
+from hr_rejects import RejectSink, reject_targets
+from hr_schema import EMPLOYEE_RECORDS
+from hr_sheet_scheduler import default_scheduler
+from hr_sync_state import (ChangeTracker, combine_fingerprints, create_state_tables, delete_row_hashes,
+                           fingerprint, load_row_hashes, reset_row_hashes, save_row_hashes)
+from hr_table_swap import create_shadow_table, swap_in_shadow, table_exists
+from hr_validation import SchemaValidator, validation_stage
 
 # DB 資訊
 my_serverIP = "10.231.220.60"
@@ -9,113 +22,200 @@ my_login_userName = "postgres"
 my_login_password = ""
 my_port = "5432"
 
+# 寫入模式："copy" 以 COPY 批次寫入並只 commit 一次；"row" 為舊的逐行 INSERT（比較用）
+LOAD_MODE = "copy"
+
+# 轉換模式："columnar" 每欄只正規化不重複的值；"row" 逐行逐格轉換（比較用）
+TRANSFORM_MODE = "columnar"
+
+# 換表方式："swap" 先填好影子表再一次改名換上；"recreate" 為舊的 DROP TABLE + 重建；
+# "incremental" 只刪除並重寫內容有變動或已消失的 10_Number（表不存在時改用 recreate）
+LOAD_STRATEGY = "swap"
+KEEP_OLD_COPIES = 2  # 換表後保留幾份舊表，方便回滾
+
+# 同一個 10_Number 出現多次時的處理方式（hr_dedup.DEDUP_POLICIES）；first-wins 與 UNIQUE 索引相同，邊讀邊決定。
+# 其他策略先讀一次 10_Number 欄找出重複的工號，只有這些工號的行會暫存到決定勝出的一行為止
+DEDUP_POLICY = "first-wins"
+
+# 被拒絕的行寫到 hr_rejects 的 gzip JSONL（取代 skipped_records.txt），前 20 行仍會印出
+REJECTS_TARGETS = "file"
+
 # Google Sheets API 資訊
 my_spreadsheet_name = "引用-HR 10碼工號"
 my_Googlesheet_PageName = "工作表1"
 
-# 設定 Google Sheets API 認證
-scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-creds = ServiceAccountCredentials.from_json_keyfile_name('cred.json', scope)
-client = gspread.authorize(creds)
-
-try:
-    # 打開 Google Sheets
-    spreadsheet = client.open(my_spreadsheet_name)
-    sheet = spreadsheet.worksheet(my_Googlesheet_PageName)
-
-    # 取得所有資料
-    data = sheet.get_all_values()
-    if not data:
-        raise ValueError("Google Sheets 中沒有數據")
-
-    header = data[0] if len(data) > 0 else []
-    rows = data[1:] if len(data) > 1 else []
-
-    # 處理空的列名
-    header = [f'col_{i+1}' if col == '' else col for i, col in enumerate(header)]
-
-    # 連接到 PostgreSQL 資料庫
-    conn = psycopg2.connect(
-        host=my_serverIP,
-        port=my_port,
-        dbname=my_DBName,
-        user=my_login_userName,
-        password=my_login_password
-    )
-    cursor = conn.cursor()
-
-    # 刪除已存在的表格（如果存在）
-    cursor.execute('DROP TABLE IF EXISTS employee_records_for_IT_use')
-    conn.commit()
-    print("已刪除表格 employee_records_for_IT_use（如果存在）")
-
-    # 創建新表格
-    create_table_query = '''
-    CREATE TABLE employee_records_for_IT_use (
-        "Div" VARCHAR(50),
-        "Formal Name" VARCHAR(100),
-        "Department" VARCHAR(100),
-        "Cost Centre" VARCHAR(50),
-        "Reporting date" DATE,
-        "Resigned date" DATE,
-        "10 Number" VARCHAR(10)  ,
-        "Department Code" VARCHAR(8),
-        "Cost Centre Code" VARCHAR(8)
-    );
-    '''
-    cursor.execute(create_table_query)
-    conn.commit()
-    print("表格 employee_records_for_IT_use 已成功創建")
-
-    # 根據 Google Sheets 的資料結構插入資料
-    columns = [
-        "Div", "Formal Name", "Department", "Cost Centre", 
-        "Reporting date", "Resigned date", "10 Number", 
-        "Department Code", "Cost Centre Code"
-    ]
-    columns_str = ', '.join(f'"{col}"' for col in columns)
-    placeholders = ', '.join(['%s'] * len(columns))
-    insert_query = f'INSERT INTO employee_records_for_IT_use ({columns_str}) VALUES ({placeholders})'
-
-    for row in rows:
-        # Match each row with corresponding columns
-        record = [row[header.index(col)] if col in header else None for col in columns]
-        
-        # Skip the row if "Div" is empty
-        if not record[0]:
-            print(f"跳過 'Div' 欄位為空的行: {record}")
-            continue
-        
-        # Convert invalid date values to None
-        def clean_date(date_str):
-            if date_str and date_str != '-' and len(date_str) == 10:
-                return date_str
-            return None
-
-        record[4] = clean_date(record[4])  # Reporting date
-        record[5] = clean_date(record[5])  # Resigned date
-
-        try:
-            cursor.execute(insert_query, record)
-        except psycopg2.IntegrityError:
-            conn.rollback()  # Skip the duplicate
-            print(f"跳過重複的 '10 Number': {record[6]}")
-        except psycopg2.DataError as e:
-            print(f"跳過無效的資料: {record}, 錯誤: {e}")
-            conn.rollback()  # Skip the invalid data
-        else:
-            conn.commit()
-
-    print("資料已成功上傳至 PostgreSQL 資料庫")
-
-except gspread.SpreadsheetNotFound:
-    print("找不到指定的 Google Sheets 文件。請確保文件名稱正確。")
-except gspread.WorksheetNotFound:
-    print("找不到指定的分頁。請確保分頁名稱正確。")
-except psycopg2.Error as e:
-    print(f"發生錯誤: {e}")
-    conn.rollback()
-finally:
-    # 關閉連接
-    cursor.close()
-    conn.close()
+
+def main(client=None, db_params=None):
+    """client 與 db_params（psycopg2.connect 的參數）預設為上面的設定；效能測試時換成假試算表與本機資料庫。"""
+    # 設定 Google Sheets API 認證（沿用磁碟上尚未到期的 access token）
+    client = client or sheets_client('cred.json')
+
+    try:
+        # 打開 Google Sheets
+        spreadsheet = open_spreadsheet(client, name=my_spreadsheet_name)
+        sheet = spreadsheet.worksheet(my_Googlesheet_PageName)
+
+        # 只讀標題列，資料本體由管線分批串流讀取
+        header = default_scheduler().call(sheet.row_values, 1)
+        if not header:
+            raise ValueError("Google Sheets 中沒有數據")
+
+        # 處理空的列名
+        header = clean_header(header)
+
+        # 從連線池借用 PostgreSQL 連線，離開時歸還（未 commit 的交易會 rollback）
+        with db_connection(**(db_params or dict(
+            host=my_serverIP,
+            port=my_port,
+            dbname=my_DBName,
+            user=my_login_userName,
+            password=my_login_password
+        ))) as conn:
+            cursor = conn.cursor()
+
+            # 欄位、型別與標題對應都來自 hr_schema
+            schema = EMPLOYEE_RECORDS
+            table = schema.table
+            columns = schema.names
+            key_index = schema.index_of(schema.key)
+            create_state_tables(conn)
+            incremental = LOAD_STRATEGY == "incremental" and table_exists(conn, table)
+
+            # 創建新表格
+            create_table_query = schema.create_table_query()
+            if incremental:
+                # 先寫入暫存表，比對雜湊後只把有變動的 10_Number 換進正式表
+                target = '_incremental_stage'
+                cursor.execute(f'DROP TABLE IF EXISTS {target}')
+                cursor.execute(f'CREATE TEMP TABLE {target} (LIKE {table})')
+                conn.commit()
+            elif LOAD_STRATEGY == "swap":
+                # 新資料寫入影子表，正式表在換表前維持原樣
+                target = create_shadow_table(conn, table, create_table_query)
+                print(f"已建立影子表 {target}")
+            else:
+                # 刪除已存在的表格（如果存在）
+                cursor.execute(f'DROP TABLE IF EXISTS {table}')
+                conn.commit()
+                print(f"已刪除表格 {table}（如果存在）")
+
+                cursor.execute(create_table_query.format(table=table))
+                conn.commit()
+                target = table
+                print(f"表格 {table} 已成功創建")
+
+            # Convert date strings to date, invalid values to None
+            clean_reporting_date = DateNormalizer()
+            clean_resigned_date = DateNormalizer()
+
+            rejected_keys = set()
+            rejects = RejectSink(table, columns, schema.key, reject_targets(REJECTS_TARGETS, table))
+
+            def report_reject(row_num, record, error):
+                rejected_keys.add(record[key_index] or '')
+                rejects.add(row_num, record, error)
+
+            def skip_empty_div(row_num, record):
+                # Skip the row if "Div" is empty
+                if not record[0]:
+                    print(f"跳過 'Div' 欄位為空的行: {record}")
+                    return None
+                return record
+
+            column_fns = {
+                schema.index_of("Reporting_date"): clean_reporting_date,
+                schema.index_of("Resigned_date"): clean_resigned_date,
+            }
+
+            # 依 10_Number 累計內容雜湊（同一個 10_Number 可能有多行），只保留雜湊不保留資料
+            hashes = {}
+
+            def track_hash(row_num, record):
+                key = record[key_index] or ''
+                hashes[key] = combine_fingerprints(hashes.get(key), fingerprint([record]))
+                return record
+
+            # 來源 → 標題對應 → 正規化 → 檢查欄位型別與長度 → 去重 → 寫入，整個過程只有一小塊資料在記憶體中；
+            # 超過長度、重複的 10_Number 等問題在 Python 中就擋下，不必每行送一次 INSERT 再 rollback
+            # 重複的 10_Number 只寫入勝出的一行，其餘只記入拒絕紀錄（key 本身仍有寫入，不影響雜湊）；
+            # 檢查不過的行不參與去重，同一個工號檢查通過的其他行仍可寫入
+            dedup = KeyDeduplicator(schema, DEDUP_POLICY, rejects.add)
+            validator = SchemaValidator(schema, dedup_key=schema.key)
+            if not dedup.streaming:
+                positions = schema.positions(header)
+                keys = default_scheduler().call(sheet.col_values, positions[key_index] + 1)
+                dedup.scan(enumerate(keys[1:], start=2))
+            precheck_rejected = 0
+
+            def reject_before_load(row_num, record, error):
+                nonlocal precheck_rejected
+                precheck_rejected += 1
+                report_reject(row_num, record, error)
+
+            # 拒絕紀錄在背景寫出，結束（包括中途出錯）時寫完剩下的部分
+            with rejects:
+                writer = TableWriter(conn, target, columns, mode=LOAD_MODE, on_reject=report_reject)
+                run_pipeline(
+                    sheet_rows(sheet),
+                    [map_rows(schema.row_mapper(header)), map_records(skip_empty_div),
+                     transform_stage(column_fns, mode=TRANSFORM_MODE), validation_stage(validator, reject_before_load),
+                     dedup_stage(dedup), map_records(track_hash)],
+                    writer.write
+                )
+                loaded, rejected = writer.finish()
+            rejected += precheck_rejected
+            if dedup.summary():
+                print(dedup.summary())
+
+            if incremental:
+                tracker = ChangeTracker(load_row_hashes(conn, table))
+                changed_keys = [key for key, h in hashes.items() if tracker.classify(key, h) != 'unchanged']
+                # 檢查不過、寫入失敗與 reject-all 丟掉的 10_Number 仍在試算表中，正式表中既有的行保留不動，
+                # 與 merge 相同；要在算出已消失的 10_Number 之前記下
+                tracker.mark_seen(rejected_keys)
+                tracker.mark_seen(dedup.rejected_keys())
+                removed_keys = tracker.deleted_keys()
+                for key in rejected_keys:
+                    tracker.discard(key)
+
+                # 刪除變動與消失的 10_Number，再由暫存表寫入新內容，與雜湊在同一個交易
+                written, deleted = replace_keys_from_stage(conn, table, target, columns, schema.key,
+                                                           changed_keys, removed_keys)
+                save_row_hashes(conn, table, tracker)
+                delete_row_hashes(conn, table, removed_keys)
+                cursor.execute(f'DROP TABLE IF EXISTS {target}')
+                conn.commit()
+                print(f"寫入 {written} 行，刪除 {deleted} 行，跳過 {rejected} 行，"
+                      f"未變動而略過 {tracker.counts['unchanged']} 個 10_Number（模式: {LOAD_MODE}）")
+                # 正式表的索引一直都在，只補建缺少的並更新統計資料
+                finish_bulk_load(conn, table, schema.indexes, concurrently=True)
+            else:
+                print(f"寫入 {loaded} 行，跳過 {rejected} 行（模式: {LOAD_MODE}）")
+
+                # 索引在寫入後才建立：影子表直接建立，重建的正式表以 CONCURRENTLY 建立
+                finish_bulk_load(conn, target, schema.indexes, concurrently=LOAD_STRATEGY != "swap")
+
+                if LOAD_STRATEGY == "swap":
+                    swap_in_shadow(conn, table, keep=KEEP_OLD_COPIES)
+                    print(f"已將 {target} 換為 {table}")
+
+                # 整表重建後，狀態表改為本次的內容，供下次 incremental 比對
+                reset_row_hashes(conn, table, {key: h for key, h in hashes.items() if key not in rejected_keys})
+                conn.commit()
+
+            print("資料已成功上傳至 PostgreSQL 資料庫")
+
+    except gspread.SpreadsheetNotFound:
+        print("找不到指定的 Google Sheets 文件。請確保文件名稱正確。")
+    except gspread.WorksheetNotFound:
+        print("找不到指定的分頁。請確保分頁名稱正確。")
+    except psycopg2.Error as e:
+        print(f"發生錯誤: {e}")
+    finally:
+        # 關閉游標；連線已歸還連線池
+        if 'cursor' in locals():
+            cursor.close()
+
+
+if __name__ == "__main__":
+    main()
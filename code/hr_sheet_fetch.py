@@ -0,0 +1,133 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# 同時抓取試算表範圍的執行緒數
+FETCH_WORKERS = 2
+
+# 最多有幾批資料在記憶體中（已抓好待寫入 + 抓取中），限制記憶體用量
+FETCH_QUEUE_DEPTH = 4
+
+
+def batch_ranges(first_row, last_row, batch_size):
+    """把 first_row ~ last_row 切成每段 batch_size 行的 (start, end)。"""
+    for start in range(first_row, last_row + 1, batch_size):
+        yield start, min(start + batch_size - 1, last_row)
+
+
+def prefetch_ranges(fetch, ranges, workers=FETCH_WORKERS, queue_depth=FETCH_QUEUE_DEPTH):
+    """
+    生產者/消費者管線：workers 個執行緒預先以 fetch(start, end) 抓取後面的範圍，
+    呼叫端（寫資料庫）處理目前這批的同時，下一批已經在下載，網路與資料庫的等待時間互相重疊。
+    依原本順序 yield (start, end, rows)；同時最多 queue_depth 批在記憶體中。
+    """
+    ranges = iter(ranges)
+    pending = deque()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sheet-fetch') as pool:
+        def submit_next():
+            item = next(ranges, None)
+            if item is None:
+                return False
+            pending.append((item, pool.submit(fetch, *item)))
+            return True
+
+        try:
+            while len(pending) < queue_depth and submit_next():
+                pass
+
+            while pending:
+                (start, end), future = pending.popleft()
+                rows = future.result()
+                submit_next()
+                yield start, end, rows
+        finally:
+            # 中途結束（例外或呼叫端不再讀取）時取消尚未開始的抓取
+            for _, future in pending:
+                future.cancel()
+
+
+def column_letter(index):
+    """0 起算的欄位序號轉為欄位字母，例如 0 -> A、19 -> T、26 -> AA。"""
+    letters = ''
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(ord('A') + rem) + letters
+    return letters
+
+
+def find_last_data_row(sheet, column_index):
+    """
+    以單一欄（通常是 key 欄）找出實際最後一筆資料的行號。
+    sheet.row_count 是格線大小，包含大量空白行；col_values 只回傳到最後一個非空白儲存格。
+    """
+    return len(sheet.col_values(column_index + 1))
+
+
+def normalize_header(name):
+    return name.strip().lower().replace(' ', '_')
+
+
+def header_positions(header, columns):
+    """
+    columns 為 [(標題名稱, 預設欄位序號), ...]，回傳每個欄位在標題列中的位置：標題完全相同者優先，
+    其次忽略大小寫、空白與底線的差異，都找不到時用預設序號（可為 None）。
+    TableSchema.positions 與 FetchPlan 共用，讀取的欄位與對應的欄位一定相同。
+    """
+    exact = {name: i for i, name in enumerate(header)}
+    loose = {normalize_header(name): i for i, name in enumerate(header) if name.strip()}
+    return [exact.get(name, loose.get(normalize_header(name), default)) for name, default in columns]
+
+
+def _column_spans(indices):
+    """把排序後的欄位序號合併成連續區段 [(first, last), ...]。"""
+    spans = []
+    for index in indices:
+        if spans and index == spans[-1][1] + 1:
+            spans[-1] = (spans[-1][0], index)
+        else:
+            spans.append((index, index))
+    return spans
+
+
+class FetchPlan:
+    """
+    欄位投影的抓取計畫：只下載目標表需要的欄位。
+    columns 為 [(標題名稱, 預設欄位序號), ...]，位置依 header_positions 對應。
+    fetch() 回傳的每一行依 columns 的順序排列。
+    """
+
+    def __init__(self, header, columns):
+        self.names = [name for name, _ in columns]
+        self.positions = header_positions(header, columns)
+        self.spans = _column_spans(sorted(set(self.positions)))
+
+        # 每個輸出欄位在「合併後各區段」中的位置
+        offsets = {}
+        offset = 0
+        for first, last in self.spans:
+            for index in range(first, last + 1):
+                offsets[index] = offset
+                offset += 1
+        self._offsets = [offsets[p] for p in self.positions]
+
+    def position_of(self, name):
+        return self.positions[self.names.index(name)]
+
+    def ranges(self, start, end):
+        return [f"{column_letter(first)}{start}:{column_letter(last)}{end}" for first, last in self.spans]
+
+    def fetch(self, sheet, start, end):
+        """以一個 batch_get 抓取 start ~ end 行的所需欄位，空白儲存格補空字串。"""
+        return self.assemble(sheet.batch_get(self.ranges(start, end)), start, end)
+
+    def assemble(self, blocks, start, end):
+        """把 ranges(start, end) 各區段抓回來的 blocks 組回每行，依 columns 的順序排列。"""
+        rows = [[] for _ in range(end - start + 1)]
+        for (first, last), block in zip(self.spans, blocks):
+            width = last - first + 1
+            for i, row in enumerate(rows):
+                cells = block[i] if i < len(block) else []
+                row.extend(cells)
+                row.extend([''] * (width - len(cells)))
+        return [[row[offset] for offset in self._offsets] for row in rows]
@@ -0,0 +1,66 @@
+import hashlib
+import json
+from abc import ABC, abstractmethod
+
+from hr_sync_state import load_revision
+
+DRIVE_FILES_URL = "https://www.googleapis.com/drive/v3/files/{file_id}"
+
+# 抽樣檢查時讀取的範圍（不含資料本體的大範圍下載）
+SAMPLE_RANGES = ["A1:T50"]
+
+
+class SheetRevisionSource(ABC):
+    """
+    取得試算表目前「版本」的介面。內容沒有變動時 revision() 必須回傳相同的字串。
+    check_unchanged() 只依賴這個介面；測試時以 hr_fake_sheets 的假試算表實作（見 tests/test_sheet_revision.py）。
+    """
+
+    @abstractmethod
+    def revision(self):
+        """目前版本的字串。"""
+
+
+class DriveRevisionSource(SheetRevisionSource):
+    """讀取 Drive 檔案的 version / modifiedTime，只有一個很小的 API 請求。"""
+
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+
+    def revision(self):
+        client = self.spreadsheet.client
+        http = getattr(client, 'http_client', client)  # gspread 6 以後 request 移到 http_client
+        response = http.request(
+            'get',
+            DRIVE_FILES_URL.format(file_id=self.spreadsheet.id),
+            params={'fields': 'version,modifiedTime', 'supportsAllDrives': True}
+        )
+        meta = response.json()
+        return meta.get('version') or meta['modifiedTime']
+
+
+class SampledChecksumSource(SheetRevisionSource):
+    """
+    沒有 Drive 權限時的退路：以工作表大小加上抽樣範圍內容的雜湊當作版本。
+    只偵測得到抽樣範圍內或行列數的變動。
+    """
+
+    def __init__(self, worksheet, ranges=SAMPLE_RANGES):
+        self.worksheet = worksheet
+        self.ranges = ranges
+
+    def revision(self):
+        sampled = self.worksheet.batch_get(self.ranges)
+        payload = json.dumps([self.worksheet.row_count, self.worksheet.col_count, sampled],
+                             ensure_ascii=False, default=list)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def check_unchanged(conn, sync_name, source):
+    """
+    回傳 (是否未變動, 目前版本)。
+    同步成功後應以 hr_sync_state.save_revision() 記錄這裡拿到的版本，
+    讀版本要在抓資料之前，抓取期間的修改才會在下次執行時被偵測到。
+    """
+    revision = source.revision()
+    return load_revision(conn, sync_name) == revision, revision
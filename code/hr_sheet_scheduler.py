@@ -0,0 +1,253 @@
+"""
+Google Sheets 讀取請求的排程：
+- TokenBucket：整個行程共用的令牌桶，讓每分鐘的讀取請求數不超過配額
+- AdaptiveBatchSize：依每次請求實際花費的時間與是否被限流，調整每次抓取的行數
+- SheetReadScheduler：每個請求先取令牌；429 時依 Retry-After 讓所有請求暫停，其他暫時性錯誤以指數退避重試
+- AsyncSheetReadScheduler：同樣的規則給 asyncio 使用（hr_async_sync），與執行緒共用同一個令牌桶
+
+配額是以「請求數」計算，與每次抓幾行無關：被限流時加大批次（同樣的資料用較少請求），
+單次請求太慢時才縮小批次。
+"""
+import asyncio
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from hr_retry import RETRY_ATTEMPTS, backoff_delay, is_transient
+
+# Sheets API 每位使用者每分鐘的讀取請求配額（預設 60），以及允許的瞬間請求數
+READ_QUOTA_PER_MINUTE = 60
+READ_BURST = 5
+
+# 每次抓取行數的範圍，以及希望每個請求花費的時間（秒）
+BATCH_MIN_ROWS = 200
+BATCH_MAX_ROWS = 5000
+BATCH_TARGET_SECONDS = 3.0
+
+# 被限流但回應沒有 Retry-After 時，至少暫停的秒數
+DEFAULT_RETRY_AFTER = 10.0
+
+
+class TokenBucket:
+    """
+    容量 burst、每 per 秒補充 rate - burst 個令牌，任何 per 秒內取出的令牌不會超過 rate 個。
+    pause() 讓所有呼叫 acquire() 的執行緒等到指定時間之後。
+    """
+
+    def __init__(self, rate=READ_QUOTA_PER_MINUTE, per=60.0, burst=READ_BURST):
+        burst = max(1, min(burst, rate - 1))
+        self.capacity = burst
+        self.fill_rate = max(rate - burst, 1) / per
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+
+    def _take(self):
+        """取得一個令牌時回傳 0，否則回傳還要等幾秒；呼叫端必須持有 _cond。"""
+        now = time.monotonic()
+        if now < self._paused_until:
+            return self._paused_until - now
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.fill_rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self.fill_rate
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                wait = self._take()
+                if not wait:
+                    return
+                self._cond.wait(wait)
+
+    def try_acquire(self):
+        """不等待的版本（給 asyncio 使用）：取得令牌時回傳 0，否則回傳建議等待的秒數。"""
+        with self._cond:
+            return self._take()
+
+    def pause(self, seconds):
+        """被限流後暫停所有請求 seconds 秒，之後從空的令牌桶重新開始。"""
+        with self._cond:
+            now = time.monotonic()
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._tokens = 0.0
+            self._updated = self._paused_until
+            self._cond.notify_all()
+
+
+class AdaptiveBatchSize:
+    """
+    每次抓取的行數：請求比 target_seconds 慢就依比例縮小；明顯比較快或被限流時放大 1.5 倍。
+    多個預先抓取的執行緒共用同一個實例。
+    """
+
+    def __init__(self, initial, minimum=BATCH_MIN_ROWS, maximum=BATCH_MAX_ROWS, target_seconds=BATCH_TARGET_SECONDS):
+        self.minimum = min(minimum, initial)
+        self.maximum = max(maximum, initial)
+        self.target_seconds = target_seconds
+        self.size = initial
+        self._lock = threading.Lock()
+
+    def _resize(self, size):
+        self.size = int(max(self.minimum, min(self.maximum, size)))
+
+    def record(self, rows, seconds):
+        with self._lock:
+            if seconds > self.target_seconds:
+                # 以實際的每行時間估算 target_seconds 內能抓幾行
+                self._resize(rows * self.target_seconds / seconds)
+            elif seconds < self.target_seconds / 2 and rows >= self.size:
+                self._resize(self.size * 1.5)
+
+    def throttled(self):
+        with self._lock:
+            self._resize(self.size * 1.5)
+
+
+def adaptive_ranges(first_row, last_row, sizer):
+    """依 sizer 目前的大小切出下一段 (start, end)；在送出請求時才決定，會反映之前量到的結果。"""
+    start = first_row
+    while start <= last_row:
+        end = min(start + sizer.size - 1, last_row)
+        yield start, end
+        start = end + 1
+
+
+def _status(error):
+    return getattr(getattr(error, 'response', None), 'status_code', None)
+
+
+def retry_after_seconds(error):
+    """讀取回應的 Retry-After（秒數或 HTTP 日期），沒有時回傳 None。"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    value = headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class SheetReadScheduler:
+    """所有試算表讀取請求都經過 call()；同一個行程的工作共用 default_scheduler() 的令牌桶。"""
+
+    def __init__(self, bucket=None, attempts=RETRY_ATTEMPTS + 2):
+        self.bucket = bucket or TokenBucket()
+        self.attempts = attempts
+        self.requests = 0
+        self.throttled = 0
+
+    def call(self, fn, *args, sizer=None, **kwargs):
+        for attempt in range(1, self.attempts + 1):
+            self.bucket.acquire()
+            self.requests += 1
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if attempt == self.attempts or not is_transient(e):
+                    raise
+                if _status(e) == 429:
+                    self.throttled += 1
+                    delay = retry_after_seconds(e)
+                    if delay is None:
+                        delay = max(DEFAULT_RETRY_AFTER, backoff_delay(attempt))
+                    print(f"讀取請求被限流，{delay:.1f} 秒後重試")
+                    self.bucket.pause(delay)
+                    if sizer is not None:
+                        sizer.throttled()
+                else:
+                    delay = backoff_delay(attempt)
+                    print(f"暫時性錯誤，{delay:.1f} 秒後重試（第 {attempt}/{self.attempts - 1} 次）: {e}")
+                    time.sleep(delay)
+
+    def fetcher(self, fetch, sizer):
+        """把 fetch(start, end) 包成經過排程的版本，並把每次請求的行數與時間回報給 sizer。"""
+        def fetch_range(start, end):
+            def timed():
+                started = time.monotonic()
+                rows = fetch(start, end)
+                sizer.record(end - start + 1, time.monotonic() - started)
+                return rows
+            return self.call(timed, sizer=sizer)
+        return fetch_range
+
+
+class AsyncSheetReadScheduler:
+    """SheetReadScheduler 的 asyncio 版本：fn 為 coroutine function，等待令牌與重試時不會卡住事件迴圈。"""
+
+    def __init__(self, bucket=None, attempts=RETRY_ATTEMPTS + 2):
+        # 預設與行程共用的排程器使用同一個令牌桶，同時執行的同步與非同步工作一起遵守配額
+        self.bucket = bucket or default_scheduler().bucket
+        self.attempts = attempts
+        self.requests = 0
+        self.throttled = 0
+
+    async def _acquire(self):
+        while True:
+            wait = self.bucket.try_acquire()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    async def call(self, fn, *args, sizer=None, **kwargs):
+        for attempt in range(1, self.attempts + 1):
+            await self._acquire()
+            self.requests += 1
+            try:
+                return await fn(*args, **kwargs)
+            except Exception as e:
+                if attempt == self.attempts or not is_transient(e):
+                    raise
+                if _status(e) == 429:
+                    self.throttled += 1
+                    delay = retry_after_seconds(e)
+                    if delay is None:
+                        delay = max(DEFAULT_RETRY_AFTER, backoff_delay(attempt))
+                    print(f"讀取請求被限流，{delay:.1f} 秒後重試")
+                    self.bucket.pause(delay)
+                    if sizer is not None:
+                        sizer.throttled()
+                else:
+                    delay = backoff_delay(attempt)
+                    print(f"暫時性錯誤，{delay:.1f} 秒後重試（第 {attempt}/{self.attempts - 1} 次）: {e}")
+                    await asyncio.sleep(delay)
+
+    def fetcher(self, fetch, sizer):
+        """把 async fetch(start, end) 包成經過排程的版本，並把每次請求的行數與時間回報給 sizer。"""
+        async def fetch_range(start, end):
+            async def timed():
+                started = time.monotonic()
+                rows = await fetch(start, end)
+                sizer.record(end - start + 1, time.monotonic() - started)
+                return rows
+            return await self.call(timed, sizer=sizer)
+        return fetch_range
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_scheduler():
+    """行程內共用的排程器，多個同時執行的工作一起遵守同一個配額。"""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = SheetReadScheduler()
+        return _default
+
+
+def set_default_scheduler(scheduler):
+    """換掉行程共用的排程器（例如效能測試時不限速），回傳原本的排程器。"""
+    global _default
+    with _default_lock:
+        previous, _default = _default, scheduler
+        return previous
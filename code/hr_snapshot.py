@@ -0,0 +1,129 @@
+"""
+本地快照：下載下來的工作表資料存成 gzip 壓縮的 CSV，另存一個 JSON manifest 記錄筆數、版本與 SHA-256。
+DAG 的 extract / transform / load 任務之間以檔案路徑傳遞資料，
+load 失敗重試時直接讀 transform 的快照，不必重新下載試算表。
+
+CSV 第一欄是工作表中的行號；None 寫成 \\N（與 COPY 相同），本身以反斜線開頭的值多加一個反斜線。
+date 等其他型別寫成字串（date 為 YYYY-MM-DD），寫入資料庫與計算雜湊時結果相同。
+"""
+import csv
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+
+# 快照目錄；Airflow 的各個任務必須看得到同一個目錄（同一台機器或共用磁碟）
+SNAPSHOT_DIR = os.path.join(tempfile.gettempdir(), 'hr_snapshots')
+
+# 每個工作最多保留幾份快照（每份含 extract 與 transform），以及最多保留幾天
+SNAPSHOT_KEEP = 6
+SNAPSHOT_MAX_AGE_DAYS = 3
+
+_NULL = '\\N'
+
+
+class SnapshotError(Exception):
+    """快照不存在、不完整或校驗碼不符，必須重新 extract。"""
+
+
+def _encode(value):
+    if value is None:
+        return _NULL
+    value = str(value)
+    return '\\' + value if value.startswith('\\') else value
+
+
+def _decode(value):
+    if value == _NULL:
+        return None
+    return value[1:] if value.startswith('\\') else value
+
+
+def snapshot_path(job_name, stage, directory=SNAPSHOT_DIR):
+    """例如 /tmp/hr_snapshots/hr_merge_for_IT_use.extract.20250213093000123456.csv.gz。"""
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d%H%M%S%f')
+    return os.path.join(directory, f"{job_name}.{stage}.{stamp}.csv.gz")
+
+
+def _manifest_path(path):
+    return path + '.json'
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def write_snapshot(path, rows, **meta):
+    """
+    把 rows（(row_num, record) 的串流）寫成快照，回傳 manifest。
+    先寫入暫存檔再改名，manifest 最後才寫，沒有 manifest 的快照視為不完整。
+    """
+    tmp = path + '.tmp'
+    count = 0
+    with gzip.open(tmp, 'wt', encoding='utf-8', newline='', compresslevel=6) as f:
+        writer = csv.writer(f)
+        for row_num, record in rows:
+            writer.writerow([row_num] + [_encode(value) for value in record])
+            count += 1
+    os.replace(tmp, path)
+
+    manifest = dict(meta, rows=count, sha256=_sha256(path), created=datetime.now().isoformat())
+    with open(_manifest_path(path) + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(_manifest_path(path) + '.tmp', _manifest_path(path))
+    return manifest
+
+
+def read_manifest(path):
+    try:
+        with open(_manifest_path(path), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        raise SnapshotError(f"快照 {path} 沒有可用的 manifest: {e}")
+
+
+def read_snapshot(path):
+    """先核對 SHA-256 與筆數，再逐行 yield (row_num, record)。"""
+    manifest = read_manifest(path)
+    if not os.path.exists(path) or _sha256(path) != manifest['sha256']:
+        raise SnapshotError(f"快照 {path} 不存在或校驗碼不符")
+
+    count = 0
+    with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+        for row in csv.reader(f):
+            count += 1
+            yield int(row[0]), [_decode(value) for value in row[1:]]
+    if count != manifest['rows']:
+        raise SnapshotError(f"快照 {path} 筆數不符：{count} / {manifest['rows']}")
+
+
+def evict_snapshots(job_name, directory=SNAPSHOT_DIR, keep=SNAPSHOT_KEEP, max_age_days=SNAPSHOT_MAX_AGE_DAYS):
+    """刪除 job_name 超過 max_age_days 天或超過 keep 份的舊快照（連同 manifest）。"""
+    if not os.path.isdir(directory):
+        return 0
+    prefix = f"{job_name}."
+    files = sorted(
+        (entry for entry in os.scandir(directory)
+         if entry.name.startswith(prefix) and entry.name.endswith('.csv.gz')),
+        key=lambda entry: entry.stat().st_mtime, reverse=True
+    )
+    cutoff = time.time() - max_age_days * 86400
+    removed = 0
+    for i, entry in enumerate(files):
+        if i < keep and entry.stat().st_mtime >= cutoff:
+            continue
+        for name in (entry.path, _manifest_path(entry.path)):
+            try:
+                os.remove(name)
+            except FileNotFoundError:
+                pass
+        removed += 1
+    return removed
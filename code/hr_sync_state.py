@@ -0,0 +1,250 @@
+import hashlib
+
+from psycopg2.extras import execute_values
+
+# 記錄每個 key（10_number）內容雜湊的狀態表，用來判斷哪些員工資料有變動
+ROW_STATE_TABLE = 'hr_sync_row_state'
+
+# 每個同步工作最後一次成功時的試算表版本
+SYNC_STATE_TABLE = 'hr_sync_state'
+
+# 進行中的同步已 commit 到第幾行，以及當時的試算表版本；中斷後同一版本的下一次執行從這裡繼續
+CHECKPOINT_TABLE = 'hr_sync_checkpoint'
+
+# 同步模式
+# "incremental": 只送出新增、變動與已從試算表消失的行
+# "full"       : 全部重送（狀態表仍會一併更新）
+SYNC_MODES = ("incremental", "full")
+
+
+# 狀態表的 DDL；hr_async_sync 以 asyncpg 執行同樣的語句
+STATE_TABLES_DDL = [
+    f"""
+    CREATE TABLE IF NOT EXISTS {SYNC_STATE_TABLE} (
+        sync_name VARCHAR(100) PRIMARY KEY,
+        revision TEXT,
+        synced_at TIMESTAMP DEFAULT now()
+    );
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS {ROW_STATE_TABLE} (
+        sync_name VARCHAR(100),
+        row_key VARCHAR(100),
+        row_hash CHAR(32),
+        updated_at TIMESTAMP DEFAULT now(),
+        PRIMARY KEY (sync_name, row_key)
+    );
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} (
+        sync_name VARCHAR(100) PRIMARY KEY,
+        revision TEXT,
+        last_row INTEGER,
+        updated_at TIMESTAMP DEFAULT now()
+    );
+    """,
+]
+
+
+# 狀態表的語句以 psycopg2 的 %s 寫成；hr_async_sync 換成 asyncpg 的 $1, $2, ... 後執行同樣的語句
+LOAD_REVISION_QUERY = f"SELECT revision FROM {SYNC_STATE_TABLE} WHERE sync_name = %s"
+
+SAVE_REVISION_QUERY = f"""
+    INSERT INTO {SYNC_STATE_TABLE} (sync_name, revision)
+    VALUES (%s, %s)
+    ON CONFLICT (sync_name) DO UPDATE SET
+        revision = EXCLUDED.revision,
+        synced_at = now()
+"""
+
+LOAD_CHECKPOINT_QUERY = f"SELECT revision, last_row FROM {CHECKPOINT_TABLE} WHERE sync_name = %s"
+
+SAVE_CHECKPOINT_QUERY = f"""
+    INSERT INTO {CHECKPOINT_TABLE} (sync_name, revision, last_row)
+    VALUES (%s, %s, %s)
+    ON CONFLICT (sync_name) DO UPDATE SET
+        revision = EXCLUDED.revision,
+        last_row = EXCLUDED.last_row,
+        updated_at = now()
+"""
+
+CLEAR_CHECKPOINT_QUERY = f"DELETE FROM {CHECKPOINT_TABLE} WHERE sync_name = %s"
+
+LOAD_ROW_HASHES_QUERY = f"SELECT row_key, row_hash FROM {ROW_STATE_TABLE} WHERE sync_name = %s"
+
+DELETE_ROW_HASHES_QUERY = f"DELETE FROM {ROW_STATE_TABLE} WHERE sync_name = %s AND row_key = ANY(%s)"
+
+
+def save_row_hashes_query(values='%s'):
+    """寫入 (sync_name, row_key, row_hash)；values 預設為 execute_values 的 %s，逐行執行時傳入一行的參數。"""
+    return f"""
+        INSERT INTO {ROW_STATE_TABLE} (sync_name, row_key, row_hash)
+        VALUES {values}
+        ON CONFLICT (sync_name, row_key) DO UPDATE SET
+            row_hash = EXCLUDED.row_hash,
+            updated_at = now()
+    """
+
+
+def create_state_tables(conn):
+    with conn.cursor() as cursor:
+        for statement in STATE_TABLES_DDL:
+            cursor.execute(statement)
+    conn.commit()
+
+
+def load_revision(conn, sync_name):
+    with conn.cursor() as cursor:
+        cursor.execute(LOAD_REVISION_QUERY, (sync_name,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+
+def save_revision(conn, sync_name, revision):
+    """記錄本次成功同步時的試算表版本，不 commit。"""
+    with conn.cursor() as cursor:
+        cursor.execute(SAVE_REVISION_QUERY, (sync_name, revision))
+
+
+def load_checkpoint(conn, sync_name):
+    """回傳 (試算表版本, 最後 commit 的行號)，沒有進行中的同步時回傳 None。"""
+    with conn.cursor() as cursor:
+        cursor.execute(LOAD_CHECKPOINT_QUERY, (sync_name,))
+        return cursor.fetchone()
+
+
+def save_checkpoint(conn, sync_name, revision, last_row):
+    """記錄已處理到 last_row，不 commit；必須與該批資料、雜湊在同一個交易。"""
+    with conn.cursor() as cursor:
+        cursor.execute(SAVE_CHECKPOINT_QUERY, (sync_name, revision, last_row))
+
+
+def clear_checkpoint(conn, sync_name):
+    """同步全部完成後刪除進度，不 commit；與 save_revision 放在同一個交易。"""
+    with conn.cursor() as cursor:
+        cursor.execute(CLEAR_CHECKPOINT_QUERY, (sync_name,))
+
+
+def resumable_row(checkpoint, revision):
+    """
+    checkpoint 為 load_checkpoint 的 (版本, 最後 commit 的行號) 或 None。同一個版本時回傳該行號，
+    否則回傳 None；checkpoint 不是 None 卻回傳 None 時，舊的進度屬於別的版本，呼叫端要刪除。
+    """
+    if checkpoint is not None and revision is not None and checkpoint[0] == revision:
+        return checkpoint[1]
+    return None
+
+
+def resume_point(conn, sync_name, revision):
+    """
+    同一個版本上次中斷時回傳已 commit 的最後一行，否則回傳 None。
+    版本不同（試算表在中斷後被修改）時刪除舊的進度，從頭開始。
+    """
+    checkpoint = load_checkpoint(conn, sync_name)
+    resumed = resumable_row(checkpoint, revision)
+    if checkpoint is not None and resumed is None:
+        clear_checkpoint(conn, sync_name)
+        conn.commit()
+    return resumed
+
+
+def fingerprint(records):
+    """計算一個 key 底下所有行的內容雜湊（行的順序會影響結果）。"""
+    h = hashlib.blake2b(digest_size=16)
+    for record in records:
+        for value in record:
+            h.update(b'\x00' if value is None else str(value).encode('utf-8'))
+            h.update(b'\x1f')
+        h.update(b'\x1e')
+    return h.hexdigest()
+
+
+def combine_fingerprints(a, b):
+    """
+    合併同一個 key 底下多行的雜湊，與行的先後順序無關，
+    串流處理時不必把同一個 key 的行收集在一起。
+    """
+    if a is None:
+        return b
+    return format((int(a, 16) + int(b, 16)) % (1 << 128), '032x')
+
+
+def load_row_hashes(conn, sync_name):
+    with conn.cursor() as cursor:
+        cursor.execute(LOAD_ROW_HASHES_QUERY, (sync_name,))
+        return dict(cursor.fetchall())
+
+
+class ChangeTracker:
+    """
+    以上次同步留下的 {key: 雜湊} 比對本次抓到的資料。
+    classify() 回傳 'insert'、'update' 或 'unchanged'；跑完後 deleted_keys() 為試算表中已消失的 key。
+    """
+
+    def __init__(self, previous):
+        self.previous = previous
+        self.current = {}
+        self.pending = {}    # 尚未寫回狀態表的新雜湊
+        self.failed = set()  # 寫入失敗的 key，保留舊雜湊讓下次重送
+        self.counts = {'insert': 0, 'update': 0, 'unchanged': 0}
+
+    def classify(self, key, row_hash):
+        # 同一次執行中重複出現的 key 與本次較早的那一行比較（後出現者為準）
+        old_hash = self.current.get(key, self.previous.get(key))
+        self.current[key] = row_hash
+        if old_hash is None:
+            kind = 'insert'
+        elif old_hash != row_hash:
+            kind = 'update'
+        else:
+            kind = 'unchanged'
+        if self.previous.get(key) != row_hash:
+            self.pending[key] = row_hash
+        else:
+            self.pending.pop(key, None)
+        self.counts[kind] += 1
+        return kind
+
+    def mark_seen(self, keys):
+        """
+        續傳時已在之前 commit 的行：只記下 key 仍在試算表中（不比對、不計數），
+        deleted_keys() 才不會把它們當成已刪除。這些 key 的新雜湊已在之前的交易寫入 previous。
+        """
+        for key in keys:
+            if key and key not in self.current:
+                self.current[key] = self.previous.get(key)
+
+    def discard(self, key):
+        self.pending.pop(key, None)
+        self.failed.add(key)
+
+    def seen_keys(self):
+        return list(self.current)
+
+    def deleted_keys(self):
+        return [key for key in self.previous if key not in self.current]
+
+
+def save_row_hashes(conn, sync_name, tracker):
+    """寫入目前累積的新雜湊，不 commit。應與對應的資料寫入放在同一個交易。"""
+    if not tracker.pending:
+        return
+    with conn.cursor() as cursor:
+        execute_values(cursor, save_row_hashes_query(), [(sync_name, key, h) for key, h in tracker.pending.items()],
+                       page_size=1000)
+    tracker.pending = {}
+
+
+def delete_row_hashes(conn, sync_name, keys):
+    if not keys:
+        return
+    with conn.cursor() as cursor:
+        cursor.execute(DELETE_ROW_HASHES_QUERY, (sync_name, list(keys)))
+
+
+def reset_row_hashes(conn, sync_name, hashes):
+    """整表重建後，以本次的雜湊完全取代狀態，不 commit。"""
+    with conn.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {ROW_STATE_TABLE} WHERE sync_name = %s", (sync_name,))
+        execute_values(cursor, f"INSERT INTO {ROW_STATE_TABLE} (sync_name, row_key, row_hash) VALUES %s",
+                       [(sync_name, key, h) for key, h in hashes.items()], page_size=1000)
@@ -0,0 +1,122 @@
+import time
+from datetime import datetime
+
+import psycopg2
+
+from hr_indexes import rename_indexes
+
+# 換表後保留幾份舊表，方便快速回滾
+KEEP_OLD_COPIES = 2
+
+# 換表時等待鎖的上限，避免被長查詢卡住而讓後面的讀取排隊
+SWAP_LOCK_TIMEOUT = '5s'
+SWAP_RETRIES = 3
+SWAP_LOCK_QUERY = f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'"
+
+# 以 psycopg2 的 %s 寫成；hr_async_sync 換成 $1 後執行同樣的語句
+TABLE_EXISTS_QUERY = "SELECT to_regclass(%s) IS NOT NULL"
+LIST_OLD_COPIES_QUERY = ("SELECT tablename FROM pg_tables "
+                         "WHERE schemaname = current_schema() AND tablename ~ %s "
+                         "ORDER BY tablename DESC")
+
+
+def shadow_table_name(table):
+    return f"{table}__shadow"
+
+
+def old_table_pattern(table):
+    # 未加引號的表名在 PostgreSQL 中會轉成小寫
+    return f"^{table.lower()}__old_[0-9]+$"
+
+
+def old_copy_name(table):
+    """換表時正式表改成的名稱 {table}__old_<時間戳>。"""
+    return f"{table}__old_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+
+
+def recreate_table_queries(table, create_table_query):
+    """刪除後重新建立 table；create_table_query 以 {table} 代表表名。"""
+    return [f'DROP TABLE IF EXISTS {table}', create_table_query.format(table=table)]
+
+
+def _table_exists(cursor, table):
+    cursor.execute(TABLE_EXISTS_QUERY, (table.lower(),))
+    return cursor.fetchone()[0]
+
+
+def table_exists(conn, table):
+    with conn.cursor() as cursor:
+        return _table_exists(cursor, table)
+
+
+def list_old_copies(conn, table):
+    """回傳保留中的舊表名稱，由新到舊排列。"""
+    with conn.cursor() as cursor:
+        cursor.execute(LIST_OLD_COPIES_QUERY, (old_table_pattern(table),))
+        return [r[0] for r in cursor.fetchall()]
+
+
+def create_shadow_table(conn, table, create_table_query):
+    """
+    建立空的影子表並回傳其名稱。
+    create_table_query 以 {table} 代表表名，例如 'CREATE TABLE {table} (...)'。
+    """
+    shadow = shadow_table_name(table)
+    with conn.cursor() as cursor:
+        for query in recreate_table_queries(shadow, create_table_query):
+            cursor.execute(query)
+    conn.commit()
+    return shadow
+
+
+def swap_in_shadow(conn, table, keep=KEEP_OLD_COPIES):
+    """
+    在同一個短交易中把正式表改名為 {table}__old_<時間戳>，再把影子表改名為正式表。
+    讀取端只會看到完整的舊表或完整的新表。換表後只保留最新 keep 份舊表。
+    索引跟著表改名：舊表的索引先讓出名稱，影子表的索引再改為正式表的名稱。
+    """
+    shadow = shadow_table_name(table)
+    old_copy = old_copy_name(table)
+
+    for attempt in range(1, SWAP_RETRIES + 1):
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(SWAP_LOCK_QUERY)
+                if _table_exists(cursor, table):
+                    cursor.execute(f'ALTER TABLE {table} RENAME TO {old_copy}')
+                    rename_indexes(cursor, old_copy)
+                cursor.execute(f'ALTER TABLE {shadow} RENAME TO {table}')
+                rename_indexes(cursor, table)
+            conn.commit()
+            break
+        except psycopg2.errors.LockNotAvailable:
+            conn.rollback()
+            if attempt == SWAP_RETRIES:
+                raise
+            print(f"換表等待鎖逾時，第 {attempt} 次重試")
+            time.sleep(attempt)
+
+    drop_old_copies(conn, table, keep)
+
+
+def drop_old_copies(conn, table, keep=KEEP_OLD_COPIES):
+    with conn.cursor() as cursor:
+        for name in list_old_copies(conn, table)[keep:]:
+            cursor.execute(f'DROP TABLE IF EXISTS {name}')
+            print(f"已刪除舊表 {name}")
+    conn.commit()
+
+
+def rollback_to_previous(conn, table):
+    """把最近一份舊表換回正式表，目前的正式表直接刪除。"""
+    old_copies = list_old_copies(conn, table)
+    if not old_copies:
+        raise ValueError(f"沒有可回滾的舊表: {table}")
+
+    with conn.cursor() as cursor:
+        cursor.execute(SWAP_LOCK_QUERY)
+        cursor.execute(f'DROP TABLE IF EXISTS {table}')
+        cursor.execute(f'ALTER TABLE {old_copies[0]} RENAME TO {table}')
+        rename_indexes(cursor, table)
+    conn.commit()
+    print(f"已將 {old_copies[0]} 換回 {table}")
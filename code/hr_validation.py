@@ -0,0 +1,147 @@
+"""
+寫入資料庫前，依 hr_schema 的欄位定義在 Python 中先檢查每一行，有問題的行不會送到 PostgreSQL：
+- VARCHAR(n)：超過 n 個字元就拒絕；與 PostgreSQL 相同，超出的部分全是空白時截斷為 n 個字元
+- DATE：必須是 date、None 或 YYYY-MM-DD 字串（正規化後的值；快照中的日期是字串）
+- NOT NULL 與 PRIMARY KEY 欄位不可為 None
+- UNIQUE 索引（hr_schema.Index）的值在整次執行中只能出現一次，與索引已存在時相同，先出現的一行保留；
+  索引在寫入完成後才建立，重複的值必須在這裡擋下。表示沒有值的寫法（blanks）與索引一樣不算重複；
+  去重的 key（dedup_key）的索引不在這裡檢查，由之後的 hr_dedup 依策略處理
+
+拒絕的原因是與 psycopg2 同名的例外（StringDataRightTruncation 等），SQLSTATE 與訊息也與
+PostgreSQL 回報的相同，拒絕紀錄與 metrics 的原因分類不會因為改在 Python 檢查而不同。
+
+每行只看有限制的欄（沒有長度的 VARCHAR 等永遠不會被拒絕），各欄的檢查方式在建立時先算好；
+合法的日期值跨批次記住，員工資料中大量重複的日期只檢查一次（結果與 bench_validation.py 的逐格檢查相同）。
+"""
+from datetime import date
+from operator import itemgetter
+
+from hr_pipeline import BLANK_VALUES, PIPELINE_CHUNK_SIZE, chunked
+
+
+class ValidationError(ValueError):
+    """與 PostgreSQL 相同的錯誤；pgcode 為 SQLSTATE，column 為有問題的欄位名稱。"""
+
+    pgcode = None
+
+    def __init__(self, message, column=None):
+        super().__init__(message)
+        self.column = column
+
+
+class StringDataRightTruncation(ValidationError):
+    pgcode = '22001'
+
+
+class InvalidDatetimeFormat(ValidationError):
+    pgcode = '22007'
+
+
+class NotNullViolation(ValidationError):
+    pgcode = '23502'
+
+
+class UniqueViolation(ValidationError):
+    pgcode = '23505'
+
+
+def _valid_date(value):
+    if isinstance(value, date):
+        return True
+    try:
+        date.fromisoformat(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+class SchemaValidator:
+    """
+    依 schema 的欄位定義檢查 records；table 為錯誤訊息中的表名（預設 schema.table）。
+    blanks 為 UNIQUE 索引不包含的值（與建立索引時的 blanks 相同，例如工作的 empty_value）。
+    dedup_key 為之後由 KeyDeduplicator 去重的 key，只有這一欄的 UNIQUE 索引不檢查。
+    split(chunk) 回傳 (可寫入的行, [(row_num, record, 錯誤), ...])；UNIQUE 索引的值跨批次記住，一次執行用一個。
+    """
+
+    def __init__(self, schema, table=None, blanks=BLANK_VALUES, dedup_key=None):
+        self.table = table or schema.table
+        self.blanks = frozenset(blanks)
+        # (欄位序號, 欄位, 不可為 None, VARCHAR 的長度限制, 是否為 DATE)；沒有任何限制的欄不必檢查
+        self.checks = [(i, col, col.not_null or col.primary_key,
+                        col.max_length if col.sql_type == 'VARCHAR' else None, col.sql_type == 'DATE')
+                       for i, col in enumerate(schema.columns)
+                       if col.not_null or col.primary_key or col.sql_type == 'DATE'
+                       or (col.sql_type == 'VARCHAR' and col.max_length)]
+        # (索引, 取出值的 itemgetter, 值是否不在索引中, 已出現的值)；單欄的索引記值本身，多欄的記 tuple
+        skipped = self.blanks | {None}
+        self.unique = [(index, itemgetter(*(schema.index_of(name) for name in index.columns)),
+                        skipped.__contains__ if len(index.columns) == 1 else
+                        (lambda value: not skipped.isdisjoint(value)), set())
+                       for index in schema.indexes if index.unique and index.columns != [dedup_key]]
+        # 已確認合法的日期值
+        self.valid_dates = set()
+
+    def _unique_error(self, index, value):
+        columns = ', '.join(f'"{column}"' for column in index.columns)
+        values = ', '.join(map(str, value))
+        return UniqueViolation(f'duplicate key value violates unique constraint "{index.name(self.table)}"\n'
+                               f'DETAIL:  Key ({columns})=({values}) already exists.', index.columns[0])
+
+    def split(self, chunk):
+        """
+        依欄位順序檢查每一行，只保留第一個錯誤（與 PostgreSQL 逐欄轉換時的順序相同）；需要截斷的值直接改寫 record。
+        通過後依序記下每個 UNIQUE 索引的值：已被拒絕的行不佔用，含 None 的值與 PostgreSQL 相同不算重複，
+        含 blanks 的值不在部分索引中，也不算重複。
+        """
+        clean = []
+        rejected = []
+        checks = self.checks
+        valid_dates = self.valid_dates
+        unique = self.unique
+        for item in chunk:
+            record = item[1]
+            error = None
+            for i, col, not_null, limit, is_date in checks:
+                value = record[i]
+                if value is None:
+                    if not_null:
+                        error = NotNullViolation(f'null value in column "{col.name}" of relation "{self.table}" '
+                                                 f'violates not-null constraint', col.name)
+                        break
+                elif limit:
+                    if len(value) > limit:
+                        if value[limit:].strip(' '):
+                            error = StringDataRightTruncation(
+                                f"value too long for type character varying({limit})", col.name)
+                            break
+                        record[i] = value[:limit]
+                elif is_date and value not in valid_dates:
+                    if not _valid_date(value):
+                        error = InvalidDatetimeFormat(f'invalid input syntax for type date: "{value}"', col.name)
+                        break
+                    valid_dates.add(value)
+            if error is None:
+                for index, key, is_blank, seen in unique:
+                    value = key(record)
+                    if value in seen and not is_blank(value):
+                        error = self._unique_error(index, value if isinstance(value, tuple) else (value,))
+                        break
+                else:
+                    # 所有索引都通過才佔用；沒有值的寫法也記入 seen，但比對時不算重複
+                    for _, key, _, seen in unique:
+                        seen.add(key(record))
+                    clean.append(item)
+                    continue
+            rejected.append((item[0], record, error))
+        return clean, rejected
+
+
+def validation_stage(validator, on_reject, batch_size=PIPELINE_CHUNK_SIZE):
+    """管線階段：每 batch_size 行檢查一次，有問題的行交給 on_reject(row_num, record, 錯誤) 後丟掉。"""
+    def stage(rows):
+        for chunk in chunked(rows, batch_size):
+            clean, rejected = validator.split(chunk)
+            for row_num, record, error in rejected:
+                on_reject(row_num, record, error)
+            yield from clean
+    return stage
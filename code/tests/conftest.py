@@ -0,0 +1,105 @@
+"""
+pytest 共用設定。測試直接匯入 code/ 下的模組，試算表一律使用 hr_fake_sheets，不連 Google。
+
+需要 PostgreSQL 的測試使用 db_params / settings fixture，每個測試一個新的資料庫：
+- 設定 N_HR_TEST_DSN（例如 "host=127.0.0.1 port=5432 user=postgres dbname=postgres"）時在該伺服器上建立
+- 否則與 bench_loaders 相同，以 PATH 中的 initdb / pg_ctl 建立臨時的 PostgreSQL
+- 兩者都沒有時略過這些測試
+正確性只在這裡檢查；bench_*.py 只量測時間。
+執行：cd code && python -m pytest tests
+"""
+import contextlib
+import os
+import subprocess
+import sys
+import uuid
+from functools import partial
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hr_sheet_scheduler import SheetReadScheduler, TokenBucket, set_default_scheduler  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def unlimited_scheduler():
+    """測試的是程式本身，不等待讀取配額；需要配額的測試自己建立 SheetReadScheduler。"""
+    previous = set_default_scheduler(SheetReadScheduler(TokenBucket(rate=10 ** 6, per=1.0)))
+    yield
+    set_default_scheduler(previous)
+
+
+@pytest.fixture(scope='session')
+def postgres_server():
+    """整個測試階段共用的 PostgreSQL，回傳 psycopg2.connect 的參數。"""
+    dsn = os.getenv('N_HR_TEST_DSN')
+    if dsn:
+        import psycopg2.extensions
+        yield psycopg2.extensions.parse_dsn(dsn)
+        return
+
+    from bench_loaders import local_postgres
+    with contextlib.ExitStack() as stack:
+        try:
+            params = stack.enter_context(local_postgres())
+        except (SystemExit, OSError, subprocess.CalledProcessError) as e:
+            pytest.skip(f"沒有可用的 PostgreSQL（設定 N_HR_TEST_DSN 或安裝 initdb）: {e}")
+        yield params
+
+
+def _admin(params, statement):
+    import psycopg2
+    conn = psycopg2.connect(**params)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(statement)
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def db_params(postgres_server):
+    """這個測試專用的空資料庫。"""
+    from hr_connections import close_pools
+
+    dbname = f"hr_test_{uuid.uuid4().hex[:12]}"
+    _admin(postgres_server, f'CREATE DATABASE {dbname}')
+    try:
+        yield dict(postgres_server, dbname=dbname)
+    finally:
+        close_pools()
+        _admin(postgres_server, f'DROP DATABASE IF EXISTS {dbname}')
+
+
+@pytest.fixture
+def settings(db_params, tmp_path):
+    """hr_jobs.load_settings() 改連測試資料庫，拒絕紀錄寫到暫存目錄。"""
+    from hr_jobs import load_settings
+
+    return dict(load_settings(),
+                POSTGRES_SERVER=db_params.get('host'), POSTGRES_PORT=db_params.get('port'),
+                POSTGRES_DB=db_params['dbname'], POSTGRES_USER=db_params.get('user'),
+                POSTGRES_PASSWORD=db_params.get('password'), POSTGRES_OPTIONS={},
+                HR_SKIP_IF_UNCHANGED=True, HR_METRICS=False, HR_REJECTS='file', HR_REJECTS_DIR=str(tmp_path))
+
+
+@pytest.fixture
+def snapshots(tmp_path, monkeypatch):
+    """hr_jobs 的快照寫到這個測試的暫存目錄，不動到 SNAPSHOT_DIR。"""
+    import hr_jobs
+    from hr_snapshot import evict_snapshots, snapshot_path
+
+    directory = str(tmp_path / 'snapshots')
+    monkeypatch.setattr(hr_jobs, 'snapshot_path', partial(snapshot_path, directory=directory))
+    monkeypatch.setattr(hr_jobs, 'evict_snapshots', partial(evict_snapshots, directory=directory))
+    return directory
+
+
+@pytest.fixture
+def conn(db_params):
+    from hr_connections import db_connection
+
+    with db_connection(**db_params) as conn:
+        yield conn
@@ -0,0 +1,73 @@
+"""hr_async_sync 的 merge：每批 commit 時記錄進度，中斷後同一個版本從下一行繼續，結果與沒有中斷時相同。"""
+import asyncio
+
+import pytest
+
+pytest.importorskip('asyncpg')
+pytest.importorskip('aiohttp')
+
+import aiohttp  # noqa: E402
+import asyncpg  # noqa: E402
+
+import hr_async_sync  # noqa: E402
+from hr_fake_sheets import FakeClient, FakeSheetsServer, FakeWorksheet, merge_sheet_rows  # noqa: E402
+from hr_jobs import SheetJob  # noqa: E402
+from hr_sync_state import CHECKPOINT_TABLE, ROW_STATE_TABLE, SYNC_STATE_TABLE  # noqa: E402
+
+SPREADSHEET_ID = 'test-merge'
+
+
+async def _run(job, settings, server):
+    async with aiohttp.ClientSession() as session, \
+            asyncpg.create_pool(min_size=1, max_size=1, **hr_async_sync.connect_options(settings)) as pool:
+        sheets = hr_async_sync.AsyncSheetsClient(session, server.sheets_url, server.drive_url)
+        return await hr_async_sync.run_job_async(job, settings, sheets, pool)
+
+
+def _query(conn, query):
+    with conn.cursor() as cursor:
+        cursor.execute(query)
+        rows = sorted(cursor.fetchall(), key=repr)
+    conn.commit()
+    return rows
+
+
+def test_merge_resumes_after_interruption(settings, conn, monkeypatch, capsys):
+    job = SheetJob('hr_merge_for_IT_use', 'Merge', 'hr_merge_for_IT_use', spreadsheet_id=SPREADSHEET_ID,
+                   strategy="merge", batch_size=200)
+    client = FakeClient()
+    client.add("HR", {'Merge': FakeWorksheet(merge_sheet_rows(1000), title='Merge')}, spreadsheet_id=SPREADSHEET_ID)
+    settings = dict(settings, HR_REJECTS='off')
+
+    # 第三批寫入進度時中斷：這一批 rollback，前兩批已 commit
+    saved = []
+    save_checkpoint = hr_async_sync.save_checkpoint
+
+    async def interrupted(conn, sync_name, revision, last_row):
+        saved.append(last_row)
+        if len(saved) == 3:
+            raise RuntimeError("中斷")
+        await save_checkpoint(conn, sync_name, revision, last_row)
+
+    with FakeSheetsServer(client) as server:
+        monkeypatch.setattr(hr_async_sync, 'save_checkpoint', interrupted)
+        with pytest.raises(RuntimeError):
+            asyncio.run(_run(job, settings, server))
+        assert _query(conn, f'SELECT last_row FROM {CHECKPOINT_TABLE}') == [(saved[1],)]
+
+        monkeypatch.setattr(hr_async_sync, 'save_checkpoint', save_checkpoint)
+        capsys.readouterr()
+        assert asyncio.run(_run(job, settings, server))
+        assert f"上次寫入到第 {saved[1]} 行中斷" in capsys.readouterr().out
+        resumed = [_query(conn, f'SELECT * FROM {job.table}'),
+                   _query(conn, f'SELECT row_key, row_hash FROM {ROW_STATE_TABLE}')]
+        assert _query(conn, f'SELECT * FROM {CHECKPOINT_TABLE}') == []
+
+        # 同一份資料從頭同步一次，結果必須相同
+        with conn.cursor() as cursor:
+            cursor.execute(f'DROP TABLE {job.table}')
+            cursor.execute(f'DELETE FROM {ROW_STATE_TABLE}; DELETE FROM {SYNC_STATE_TABLE}')
+        conn.commit()
+        assert asyncio.run(_run(job, settings, server))
+    assert resumed == [_query(conn, f'SELECT * FROM {job.table}'),
+                       _query(conn, f'SELECT row_key, row_hash FROM {ROW_STATE_TABLE}')]
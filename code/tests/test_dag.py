@@ -0,0 +1,47 @@
+"""hr_gsheet2db_dag：解析時不連網、不載入重的套件；三個任務以假試算表串起 extract → transform → load。需要 Airflow。"""
+import pytest
+
+pytest.importorskip('airflow')
+
+import hr_gsheet2db_dag  # noqa: E402
+import hr_jobs  # noqa: E402
+from bench_dag_parse import DEFAULT_DAG_FILE, parse_once  # noqa: E402
+from hr_fake_sheets import FakeClient, FakeWorksheet, employee_sheet_rows  # noqa: E402
+
+pytestmark = pytest.mark.usefixtures('snapshots')
+
+EMPLOYEE_JOB = 'employee_records_for_IT_use'
+
+
+def test_dag_file_parses_without_side_effects():
+    result = parse_once(DEFAULT_DAG_FILE)
+    assert result['error'] is None
+    assert result['network'] == []
+    assert result['heavy'] == []
+
+
+def test_dag_expands_one_task_group_per_table():
+    assert {'list_hr_jobs', 'hr_sheet_sync.extract_hr_gsheet', 'hr_sheet_sync.transform_hr_gsheet',
+            'hr_sheet_sync.import_hr_gsheet2db'} <= set(hr_gsheet2db_dag.dag.task_ids)
+    assert hr_gsheet2db_dag.list_hr_jobs() == [[EMPLOYEE_JOB], ['hr_merge_for_IT_use']]
+
+
+def test_dag_steps_sync_on_fake_sheets(settings, conn, monkeypatch):
+    job = {job.name: job for job in hr_jobs.load_jobs()}[EMPLOYEE_JOB]
+    client = FakeClient()
+    client.add(job.spreadsheet_name, {job.worksheet: FakeWorksheet(employee_sheet_rows(300))})
+    # 任務在執行時才讀設定與建立 gspread client；settings 停用 metrics，不需要 Airflow 的 context
+    monkeypatch.setattr(hr_jobs, 'load_settings', lambda: settings)
+    monkeypatch.setattr(hr_jobs, 'sheets_client', lambda credentials_file: client)
+
+    snapshots = hr_gsheet2db_dag.extract_hr_jobs([EMPLOYEE_JOB])
+    hr_gsheet2db_dag.hr_gsheet2db(hr_gsheet2db_dag.transform_hr_jobs(snapshots))
+    with conn.cursor() as cursor:
+        cursor.execute(f'SELECT count(*) FROM {job.table}')
+        assert cursor.fetchone()[0] > 0
+    conn.commit()
+
+    # 試算表沒有變動：後面兩個任務收到 None，不做事
+    snapshots = hr_gsheet2db_dag.extract_hr_jobs([EMPLOYEE_JOB])
+    assert snapshots == {EMPLOYEE_JOB: None}
+    assert hr_gsheet2db_dag.transform_hr_jobs(snapshots) == {EMPLOYEE_JOB: None}
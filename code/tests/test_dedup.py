@@ -0,0 +1,121 @@
+"""hr_dedup：先檢查再去重、只讀 key 欄的兩趟去重、merge 的 last-wins 與空白的 key。"""
+import pytest
+
+from hr_dedup import DEDUP_POLICIES, KeyDeduplicator, dedup_stage
+from hr_pipeline import blank_values, run_pipeline
+from hr_schema import EMPLOYEE_RECORDS
+from hr_validation import SchemaValidator, validation_stage
+
+KEY = EMPLOYEE_RECORDS.index_of("10_Number")
+# 與 empty_value="NA" 的工作相同：空字串與 "NA" 都表示沒有工號
+BLANKS = blank_values("NA")
+TOO_LONG = 'D' * 20
+
+
+def employee(key, resigned=None, department_code='D100'):
+    return ['BBI-HO', 'SANTOS,HENRY A.', 'IT', 'HO', '2020-01-01', resigned, key, department_code, 'C100']
+
+
+def numbered(records):
+    return [(row_num, record) for row_num, record in enumerate(records, start=2)]
+
+
+def run(policy, rows, upsert=False):
+    """與載入程式相同的順序：檢查 → 去重。回傳 (寫入的行號, {行號: 原因}, dedup)。"""
+    rejected = {}
+
+    def on_reject(row_num, record, error):
+        rejected[row_num] = type(error).__name__
+
+    dedup = KeyDeduplicator(EMPLOYEE_RECORDS, policy, on_reject, BLANKS, upsert=upsert)
+    if not dedup.streaming:
+        dedup.scan((row_num, record[KEY]) for row_num, record in rows)
+    validator = SchemaValidator(EMPLOYEE_RECORDS, blanks=BLANKS, dedup_key=dedup.key)
+    written = []
+    run_pipeline(iter(rows), [validation_stage(validator, on_reject, batch_size=2), dedup_stage(dedup)],
+                 lambda chunk: written.extend(row_num for row_num, _ in chunk), chunk_size=3)
+    return written, rejected, dedup
+
+
+@pytest.mark.parametrize('policy', DEDUP_POLICIES)
+def test_invalid_first_occurrence_does_not_drop_key(policy):
+    rows = numbered([employee('A', department_code=TOO_LONG), employee('A'), employee('B')])
+    written, rejected, _ = run(policy, rows)
+    assert sorted(written) == [3, 4]
+    assert rejected == {2: 'StringDataRightTruncation'}
+
+
+@pytest.mark.parametrize('policy', ["last-wins", "prefer-active"])
+def test_invalid_last_occurrence_keeps_earlier_row(policy):
+    rows = numbered([employee('A'), employee('B'), employee('A', department_code=TOO_LONG)])
+    written, rejected, _ = run(policy, rows)
+    assert sorted(written) == [2, 3]
+    assert rejected == {4: 'StringDataRightTruncation'}
+
+
+@pytest.mark.parametrize('policy, kept', [("first-wins", [2, 5]), ("last-wins", [4, 5]),
+                                          ("prefer-active", [3, 5]), ("reject-all", [5])])
+def test_policy_picks_winner(policy, kept):
+    rows = numbered([employee('A', resigned='2023-01-01'), employee('A'), employee('A', resigned='2024-06-30'),
+                     employee('B')])
+    written, rejected, dedup = run(policy, rows)
+    assert sorted(written) == kept
+    assert rejected == {row_num: 'DuplicateKey' for row_num in (2, 3, 4) if row_num not in kept}
+    assert dedup.conflicts == {'A': [2, 3, 4]}
+    assert dedup.rejected_keys() == (['A'] if policy == "reject-all" else [])
+
+
+@pytest.mark.parametrize('policy', DEDUP_POLICIES)
+def test_blank_keys_pass_every_policy(policy):
+    keys = ['', 'NA', 'A', '', 'NA', 'A', 'B', '', 'NA']
+    written, rejected, _ = run(policy, numbered([employee(key) for key in keys]))
+    blank_rows = [row_num for row_num, key in enumerate(keys, start=2) if key in BLANKS]
+    assert set(blank_rows) <= set(written)
+    assert len(written) == len(blank_rows) + (1 if policy == "reject-all" else 2)
+
+
+def test_only_rows_of_duplicate_keys_are_held():
+    rows = numbered([employee('A'), employee('B'), employee('C'), employee('A'), employee('D')])
+    consumed = []
+
+    def source():
+        for item in rows:
+            consumed.append(item[0])
+            yield item
+
+    dedup = KeyDeduplicator(EMPLOYEE_RECORDS, "last-wins", lambda *args: None, BLANKS)
+    dedup.scan((row_num, record[KEY]) for row_num, record in rows)
+    stream = dedup.apply(source())
+    # B 不重複，讀到就放行；A 暫存到最後出現的第 5 行
+    assert next(stream)[0] == 3 and consumed == [2, 3]
+    assert next(stream)[0] == 4
+    # 第 2 行還在暫存中，進度只能記到第 1 行
+    assert dedup.checkpoint(4) == 1
+    assert next(stream)[0] == 5 and consumed == [2, 3, 4, 5]
+    assert dedup.checkpoint(5) == 5
+    assert [row_num for row_num, _ in stream] == [6]
+
+
+def test_scan_is_required_unless_streaming():
+    dedup = KeyDeduplicator(EMPLOYEE_RECORDS, "last-wins", blanks=BLANKS)
+    assert not dedup.streaming
+    with pytest.raises(ValueError):
+        list(dedup.apply(numbered([employee('A')])))
+    assert KeyDeduplicator(EMPLOYEE_RECORDS, "first-wins").streaming
+
+
+def test_merge_last_wins_streams_to_on_conflict():
+    rows = numbered([employee('A'), employee('B'), employee('A', resigned='2024-06-30')])
+    written, rejected, dedup = run("last-wins", rows, upsert=True)
+    # 兩行都送出，由 ON CONFLICT 依序覆寫；被覆寫的行不是拒絕
+    assert written == [2, 3, 4]
+    assert rejected == {}
+    assert dedup.overwritten == 1 and '覆寫' in dedup.summary()
+
+
+def test_validator_leaves_dedup_key_to_deduplicator():
+    chunk = numbered([employee('A'), employee('A')])
+    _, rejected = SchemaValidator(EMPLOYEE_RECORDS, blanks=BLANKS).split(chunk)
+    assert [(row_num, type(error).__name__) for row_num, _, error in rejected] == [(3, 'UniqueViolation')]
+    clean, rejected = SchemaValidator(EMPLOYEE_RECORDS, blanks=BLANKS, dedup_key="10_Number").split(chunk)
+    assert len(clean) == 2 and rejected == []
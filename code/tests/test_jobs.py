@@ -0,0 +1,112 @@
+"""hr_jobs：以假試算表執行 extract → transform → load，檢查工作設定、版本檢查與 merge 的中斷續傳。"""
+import json
+
+import pytest
+
+import hr_jobs
+from hr_fake_sheets import FakeClient, FakeWorksheet, employee_sheet_rows, merge_sheet_rows
+from hr_jobs import SheetJob, extract_job, group_by_table, load_job, load_jobs, run_job, transform_job
+from hr_snapshot import read_manifest
+from hr_sync_state import CHECKPOINT_TABLE, ROW_STATE_TABLE, SYNC_STATE_TABLE, load_revision
+
+pytestmark = pytest.mark.usefixtures('snapshots')
+
+JOBS = {job.name: job for job in load_jobs()}
+EMPLOYEE_JOB = JOBS['employee_records_for_IT_use']
+
+
+def _query(conn, query):
+    with conn.cursor() as cursor:
+        cursor.execute(query)
+        rows = sorted(cursor.fetchall(), key=repr)
+    conn.commit()
+    return rows
+
+
+def test_jobs_file_groups_by_table(tmp_path):
+    assert [job.strategy for job in JOBS.values()] == ["swap", "merge"]
+    assert set(EMPLOYEE_JOB.blank_values) == {'', 'NA'}
+    # 同一個目標表的工作分在同一組，依設定檔的順序執行
+    extra = SheetJob('employee_copy', '工作表2', 'employee_records_for_IT_use', spreadsheet_name="HR")
+    groups = group_by_table(list(JOBS.values()) + [extra])
+    assert [[job.name for job in group] for group in groups] == [
+        ['employee_records_for_IT_use', 'employee_copy'], ['hr_merge_for_IT_use']]
+
+    path = tmp_path / 'jobs.json'
+    config = {'jobs': [dict(name='a', worksheet='x', schema='hr_merge_for_IT_use', spreadsheet_id='1')] * 2}
+    path.write_text(json.dumps(config), encoding='utf-8')
+    with pytest.raises(ValueError, match="工作名稱重複"):
+        load_jobs(str(path))
+    with pytest.raises(ValueError, match="spreadsheet_id 或 spreadsheet_name"):
+        SheetJob('b', 'x', 'hr_merge_for_IT_use')
+
+
+def test_swap_job_skips_unchanged_revision(settings, conn, capsys):
+    rows = employee_sheet_rows(300)
+    client = FakeClient()
+    spreadsheet = client.add(EMPLOYEE_JOB.spreadsheet_name, {EMPLOYEE_JOB.worksheet: FakeWorksheet(rows)})
+    key_column = rows[0].index('10 Number')
+
+    run_job(EMPLOYEE_JOB, settings, client)
+    keys = {key for key, in _query(conn, f'SELECT "10_Number" FROM {EMPLOYEE_JOB.table}')}
+    assert rows[5][key_column] in keys
+    assert load_revision(conn, EMPLOYEE_JOB.name) == str(spreadsheet.version)
+
+    # 試算表沒有變動：extract 不抓資料，transform / load 不執行
+    capsys.readouterr()
+    assert extract_job(EMPLOYEE_JOB, settings, client) is None
+    assert "略過本次同步" in capsys.readouterr().out
+
+    # 修改後重新同步，新的工號換上、原本的工號消失
+    edited = list(rows[5])
+    edited[key_column] = '9999999999'
+    spreadsheet.edit(EMPLOYEE_JOB.worksheet, 6, edited)
+    run_job(EMPLOYEE_JOB, settings, client)
+    after = {key for key, in _query(conn, f'SELECT "10_Number" FROM {EMPLOYEE_JOB.table}')}
+    assert after == keys - {rows[5][key_column]} | {'9999999999'}
+    assert load_revision(conn, EMPLOYEE_JOB.name) == str(spreadsheet.version)
+
+
+def test_merge_load_resumes_after_interruption(settings, conn, monkeypatch, capsys):
+    job = SheetJob('hr_merge_for_IT_use', 'Merge', 'hr_merge_for_IT_use', spreadsheet_id='test-merge',
+                   strategy="merge", batch_size=200)
+    client = FakeClient()
+    client.add("HR", {'Merge': FakeWorksheet(merge_sheet_rows(1000), title='Merge')}, spreadsheet_id='test-merge')
+    settings = dict(settings, HR_REJECTS='off')
+    path = transform_job(job, extract_job(job, settings, client), settings)
+    revision = read_manifest(path)['revision']
+
+    # 第三批寫入進度時中斷：這一批 rollback，前兩批已 commit
+    saved = []
+    save_checkpoint = hr_jobs.save_checkpoint
+
+    def interrupted(conn, sync_name, revision, last_row):
+        saved.append(last_row)
+        if len(saved) == 3:
+            raise RuntimeError("中斷")
+        save_checkpoint(conn, sync_name, revision, last_row)
+
+    monkeypatch.setattr(hr_jobs, 'save_checkpoint', interrupted)
+    with pytest.raises(RuntimeError):
+        load_job(job, path, settings)
+    assert _query(conn, f'SELECT revision, last_row FROM {CHECKPOINT_TABLE}') == [(revision, saved[1])]
+    assert load_revision(conn, job.name) is None
+
+    # load 重試時重讀同一個快照，從中斷的下一行繼續
+    monkeypatch.setattr(hr_jobs, 'save_checkpoint', save_checkpoint)
+    capsys.readouterr()
+    load_job(job, path, settings)
+    assert f"上次寫入到第 {saved[1]} 行中斷" in capsys.readouterr().out
+    resumed = [_query(conn, f'SELECT * FROM {job.table}'),
+               _query(conn, f'SELECT row_key, row_hash FROM {ROW_STATE_TABLE}')]
+    assert _query(conn, f'SELECT * FROM {CHECKPOINT_TABLE}') == []
+    assert load_revision(conn, job.name) == revision
+
+    # 同一個快照從頭寫入一次，結果必須相同
+    with conn.cursor() as cursor:
+        cursor.execute(f'DROP TABLE {job.table}')
+        cursor.execute(f'DELETE FROM {ROW_STATE_TABLE}; DELETE FROM {SYNC_STATE_TABLE}')
+    conn.commit()
+    load_job(job, path, settings)
+    assert resumed == [_query(conn, f'SELECT * FROM {job.table}'),
+                       _query(conn, f'SELECT row_key, row_hash FROM {ROW_STATE_TABLE}')]
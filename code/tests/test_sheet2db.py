@@ -0,0 +1,41 @@
+"""hr_sheet2db 的 incremental 模式：以假試算表執行兩次，檢查不過的員工不會被當成已刪除。"""
+from collections import Counter
+
+import hr_sheet2db
+from hr_fake_sheets import FakeClient, FakeWorksheet, employee_sheet_rows
+from hr_schema import EMPLOYEE_RECORDS
+
+
+def table_keys(conn):
+    with conn.cursor() as cursor:
+        cursor.execute(f'SELECT "10_Number" FROM {EMPLOYEE_RECORDS.table}')
+        return {key for key, in cursor.fetchall()}
+
+
+def test_incremental_keeps_rows_that_fail_validation(db_params, conn, monkeypatch):
+    monkeypatch.setattr(hr_sheet2db, 'LOAD_STRATEGY', "incremental")
+    monkeypatch.setattr(hr_sheet2db, 'REJECTS_TARGETS', "off")
+    rows = employee_sheet_rows(300)
+    sheet = FakeWorksheet(rows)
+    client = FakeClient()
+    client.add(hr_sheet2db.my_spreadsheet_name, {hr_sheet2db.my_Googlesheet_PageName: sheet})
+
+    # 第一次：表不存在，整表建立
+    hr_sheet2db.main(client=client, db_params=db_params)
+    before = table_keys(conn)
+    conn.commit()
+
+    key_column = rows[0].index('10 Number')
+    department = rows[0].index('Department')
+    counts = Counter(row[key_column] for row in sheet.rows)
+    invalid, removed = [row for row in sheet.rows[2:] if row[key_column] and counts[row[key_column]] == 1
+                        and row[key_column] in before][:2]
+    # 部門名稱超過 VARCHAR(100)：這一行被拒絕，但員工仍在試算表中
+    invalid[department] = 'D' * 200
+    sheet.rows.remove(removed)
+
+    hr_sheet2db.main(client=client, db_params=db_params)
+    after = table_keys(conn)
+    assert invalid[key_column] in after
+    assert removed[key_column] not in after
+    assert after == before - {removed[key_column]}
@@ -0,0 +1,37 @@
+"""hr_sheet_fetch：標題對應由 TableSchema 與 FetchPlan 共用，讀取標題與行數都經過排程器。"""
+import hr_merge2gsheet_20250213 as merge2gsheet
+from hr_fake_sheets import FakeClient, FakeWorksheet, employee_sheet_rows, merge_sheet_rows
+from hr_schema import EMPLOYEE_RECORDS, HR_MERGE
+from hr_sheet_fetch import FetchPlan, header_positions
+from hr_sheet_scheduler import SheetReadScheduler, TokenBucket, set_default_scheduler
+
+
+def test_exact_header_wins_over_loose_match():
+    header = ['formal_name', 'Formal Name', 'Div']
+    assert header_positions(header, [('Formal Name', None), ('div', 7), ('Missing', 3)]) == [1, 2, 3]
+
+
+def test_schema_and_fetch_plan_agree():
+    header = employee_sheet_rows(1)[0]
+    # 完全相同的標題排在後面，仍以它為準；其他欄只有大小寫與底線不同
+    header = [name.lower().replace(' ', '_') for name in header] + ['', 'Formal Name']
+    plan = FetchPlan(header, EMPLOYEE_RECORDS.fetch_columns())
+    assert plan.positions == EMPLOYEE_RECORDS.positions(header)
+    assert plan.position_of('Formal Name') == len(header) - 1
+
+
+def test_check_google_sheet_reads_through_scheduler():
+    rows = merge_sheet_rows(50)
+    # 每 0.05 秒只能讀一次：直接呼叫 gspread 第二個請求就會收到 429
+    sheet = FakeWorksheet(rows, row_count=500, quota=1, window=0.05, title=merge2gsheet.my_Googlesheet_PageName)
+    spreadsheet = FakeClient().add("HR", {sheet.title: sheet})
+    scheduler = SheetReadScheduler(TokenBucket(rate=10 ** 6, per=1.0))
+    previous = set_default_scheduler(scheduler)
+    try:
+        plan, total_rows = merge2gsheet.check_google_sheet(spreadsheet)
+    finally:
+        set_default_scheduler(previous)
+    assert total_rows == len(rows)
+    assert plan.positions == HR_MERGE.positions(rows[0])
+    assert sheet.throttled > 0 and scheduler.throttled == sheet.throttled
+    assert scheduler.requests == sheet.requests
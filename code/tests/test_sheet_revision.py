@@ -0,0 +1,74 @@
+"""hr_sheet_revision：版本來源可以替換，check_unchanged 以 hr_fake_sheets 的假試算表驅動。"""
+import pytest
+
+from hr_fake_sheets import FakeClient, FakeWorksheet, employee_sheet_rows
+from hr_sheet_revision import DriveRevisionSource, SampledChecksumSource, SheetRevisionSource, check_unchanged
+from hr_sync_state import create_state_tables, save_revision
+
+
+def fake_spreadsheet(rows=200):
+    client = FakeClient()
+    return client.add("引用-HR 10碼工號", {'工作表1': FakeWorksheet(employee_sheet_rows(rows))})
+
+
+def test_source_must_implement_revision():
+    with pytest.raises(TypeError):
+        SheetRevisionSource()
+
+    class Incomplete(SheetRevisionSource):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_drive_revision_follows_edits():
+    spreadsheet = fake_spreadsheet()
+    source = DriveRevisionSource(spreadsheet)
+    first = source.revision()
+    assert source.revision() == first
+
+    spreadsheet.edit('工作表1', 5, ['BBI-HO', 'SANTOS,HENRY A.'])
+    assert source.revision() != first
+
+
+def test_sampled_checksum_only_sees_sampled_range():
+    spreadsheet = fake_spreadsheet()
+    source = SampledChecksumSource(spreadsheet.worksheet('工作表1'))
+    first = source.revision()
+    assert source.revision() == first
+
+    # 抽樣範圍（A1:T50）以外的修改偵測不到，範圍內的修改與行數變動偵測得到
+    sheet = spreadsheet.worksheet('工作表1')
+    sheet.rows[100][0] = 'PBG-QA'
+    assert source.revision() == first
+    spreadsheet.edit('工作表1', 10, ['PBG-QA'])
+    second = source.revision()
+    assert second != first
+    spreadsheet.edit('工作表1', 500, ['LOG'])
+    assert source.revision() != second
+
+
+def test_check_unchanged_with_fake_sources(conn):
+    spreadsheet = fake_spreadsheet()
+    create_state_tables(conn)
+
+    # 沒有成功同步過：一定要同步
+    unchanged, revision = check_unchanged(conn, 'test_sync', DriveRevisionSource(spreadsheet))
+    assert not unchanged
+    save_revision(conn, 'test_sync', revision)
+    conn.commit()
+
+    assert check_unchanged(conn, 'test_sync', DriveRevisionSource(spreadsheet)) == (True, revision)
+
+    spreadsheet.edit('工作表1', 3, ['SVC'])
+    unchanged, new_revision = check_unchanged(conn, 'test_sync', DriveRevisionSource(spreadsheet))
+    assert not unchanged and new_revision != revision
+
+    # 換成另一種版本來源不需要改 check_unchanged；不同的同步名稱各自記錄
+    sampled = SampledChecksumSource(spreadsheet.worksheet('工作表1'))
+    unchanged, checksum = check_unchanged(conn, 'test_sync_sampled', sampled)
+    assert not unchanged
+    save_revision(conn, 'test_sync_sampled', checksum)
+    conn.commit()
+    assert check_unchanged(conn, 'test_sync_sampled', sampled) == (True, checksum)
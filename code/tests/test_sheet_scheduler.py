@@ -0,0 +1,79 @@
+"""hr_sheet_scheduler：429 依 Retry-After 暫停後重試、令牌桶的速率、批次大小的調整，以假試算表驅動。"""
+import asyncio
+import time
+from email.utils import formatdate
+
+import pytest
+
+from hr_fake_sheets import FakeAPIError, FakeResponse, FakeWorksheet, employee_sheet_rows
+from hr_sheet_scheduler import (AdaptiveBatchSize, AsyncSheetReadScheduler, SheetReadScheduler, TokenBucket,
+                                adaptive_ranges, retry_after_seconds)
+
+
+def unlimited():
+    return TokenBucket(rate=10 ** 6, per=1.0)
+
+
+def test_retry_after_seconds():
+    assert retry_after_seconds(FakeAPIError(429, "quota", retry_after=1.5)) == 1.5
+    assert retry_after_seconds(FakeAPIError(429, "quota")) is None
+    error = Exception()
+    error.response = FakeResponse(429, {'Retry-After': formatdate(time.time() + 30, usegmt=True)})
+    assert 25 < retry_after_seconds(error) <= 30
+
+
+def test_throttled_reads_wait_for_retry_after():
+    # 0.1 秒內只能讀 2 次：其餘的請求收到 429，依 Retry-After 暫停後重試成功
+    sheet = FakeWorksheet(employee_sheet_rows(50), quota=2, window=0.1)
+    scheduler = SheetReadScheduler(unlimited())
+    sizer = AdaptiveBatchSize(10, minimum=5, maximum=40)
+    started = time.monotonic()
+    blocks = [scheduler.call(sheet.get, f"{start}:{start + 9}", sizer=sizer) for start in range(2, 42, 10)]
+    assert time.monotonic() - started >= 0.1
+    assert [len(block) for block in blocks] == [10] * 4
+    assert sheet.throttled > 0 and scheduler.throttled == sheet.throttled
+    assert scheduler.requests == sheet.requests
+    # 被限流時加大批次，同樣的資料用較少的請求
+    assert sizer.size > 10
+
+
+def test_permanent_errors_are_not_retried():
+    scheduler = SheetReadScheduler(unlimited())
+    sheet = FakeWorksheet(employee_sheet_rows(5))
+    with pytest.raises(FakeAPIError):
+        scheduler.call(sheet.get, "bad range")
+    assert scheduler.requests == 1
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=10, per=0.2, burst=2)
+    started = time.monotonic()
+    for _ in range(12):
+        bucket.acquire()
+    # 前 2 個令牌立即取得，之後每 0.025 秒補充一個
+    assert time.monotonic() - started >= 0.2
+
+
+def test_adaptive_batch_size():
+    sizer = AdaptiveBatchSize(1000, minimum=200, maximum=5000, target_seconds=3.0)
+    sizer.record(1000, 6.0)
+    assert sizer.size == 500
+    sizer.record(500, 0.5)
+    assert sizer.size == 750
+    sizer.record(750, 60.0)
+    assert sizer.size == 200
+    assert list(adaptive_ranges(2, 601, sizer)) == [(2, 201), (202, 401), (402, 601)]
+
+
+def test_async_scheduler_shares_retry_rules():
+    sheet = FakeWorksheet(employee_sheet_rows(50), quota=2, window=0.1)
+    scheduler = AsyncSheetReadScheduler(unlimited())
+
+    async def get(a1):
+        return sheet.get(a1)
+
+    async def read_all():
+        return await asyncio.gather(*(scheduler.call(get, f"{start}:{start + 9}") for start in range(2, 42, 10)))
+
+    assert [len(block) for block in asyncio.run(read_all())] == [10] * 4
+    assert sheet.throttled > 0 and scheduler.throttled == sheet.throttled